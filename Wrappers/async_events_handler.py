@@ -0,0 +1,60 @@
+import asyncio
+import logging
+
+from sys import stdout
+
+import aio_pika
+
+from ProjectUtils.MessagingService.queue_definitions import EXCHANGE_NAME
+from ProjectUtils.MessagingService.schemas import to_json, from_json
+from Wrappers import config
+from Wrappers.base_wrapper.async_wrapper import AsyncWrapper
+from Wrappers.base_wrapper.wrapper import BaseWrapper
+from Wrappers.keyed_executor import AsyncKeyedLanes
+
+logging.basicConfig(level=logging.INFO, stream=stdout)
+LOGGER = logging.getLogger(__name__)
+LOGGER.setLevel(logging.INFO)
+
+
+async def consume(wrapper: BaseWrapper, process_message, message_key):
+    # process_message(wrapper, message, publish) is the (blocking) handler of the regular or scheduled events;
+    # up to ASYNC_PREFETCH_COUNT messages are in flight, each processed on one of ASYNC_WORKERS threads.
+    # Messages with the same message_key(message) are processed in the order received, None -> exclusively
+    async_wrapper = AsyncWrapper(wrapper, config.ASYNC_WORKERS)
+    lanes = AsyncKeyedLanes()
+    loop = asyncio.get_running_loop()
+    connection = await aio_pika.connect_robust(config.AMQP_URL)
+    async with connection:
+        channel = await connection.channel()
+        await channel.set_qos(prefetch_count=config.ASYNC_PREFETCH_COUNT)
+        exchange = await channel.get_exchange(EXCHANGE_NAME)
+        queue = await channel.get_queue(wrapper.queue)
+
+        def publish(routing_key, response):
+            # called from the worker threads, the publish itself runs on the event loop
+            body = to_json(response)
+            asyncio.run_coroutine_threadsafe(exchange.publish(
+                aio_pika.Message(body=body.encode() if isinstance(body, str) else body), routing_key=routing_key
+            ), loop).result()
+
+        async def on_message(incoming: aio_pika.abc.AbstractIncomingMessage):
+            try:
+                message = from_json(incoming.body)
+                LOGGER.info("%s - received message", wrapper.service_schema.name)
+                await lanes.run(message_key(message), async_wrapper.run, process_message, wrapper, message, publish)
+            except Exception as e:
+                LOGGER.error(f"Error in on_message: {e}")
+            finally:
+                await incoming.ack()
+
+        await queue.consume(on_message)
+        LOGGER.info("%s - consuming '%s' with the async engine", wrapper.service_schema.name, wrapper.queue)
+        await asyncio.Future()
+
+
+def run_async_events_handler(wrapper: BaseWrapper, process_message, message_key):
+    try:
+        asyncio.run(consume(wrapper, process_message, message_key))
+    except KeyboardInterrupt:
+        pass
@@ -0,0 +1,24 @@
+import asyncio
+
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+
+from Wrappers.base_wrapper.wrapper import BaseWrapper
+
+
+class AsyncWrapper:
+    """
+        Runs the blocking work of a BaseWrapper (HTTP with requests, database with SQLAlchemy) on a thread pool,
+        awaitable from the event loop without blocking it.
+    """
+
+    def __init__(self, wrapper: BaseWrapper, max_workers: int) -> None:
+        self.wrapper = wrapper
+        self.executor = ThreadPoolExecutor(
+            max_workers=max_workers,
+            thread_name_prefix=f"{wrapper.service_schema.value}-async",
+        )
+
+    async def run(self, function, *args, **kwargs):
+        return await asyncio.get_running_loop().run_in_executor(self.executor, partial(function, *args, **kwargs))
+
@@ -0,0 +1,37 @@
+import multiprocessing
+import os
+import threading
+
+from concurrent.futures import ProcessPoolExecutor
+
+from Wrappers import config
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def _pool_size() -> int:
+    return config.CONVERSION_PROCESSES or os.cpu_count() or 1
+
+
+def _process_pool() -> ProcessPoolExecutor:
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            # forkserver, not fork: the handler holds database pools, broker sockets and worker threads that a forked
+            # child would inherit mid-use. The workers only import the pure batch converters, which never touch the
+            # database: ids are allocated by the handler before the items are converted
+            _pool = ProcessPoolExecutor(max_workers=_pool_size(), mp_context=multiprocessing.get_context("forkserver"))
+        return _pool
+
+
+def convert_batch(convert, items: list, *args) -> list:
+    # convert(items, *args) is one of the pure batch converters (e.g. ZookingToPropertease.convert_reservations).
+    # Lists of at least CONVERSION_PROCESS_POOL_THRESHOLD items are split across a process pool, 0 disables it
+    threshold = config.CONVERSION_PROCESS_POOL_THRESHOLD
+    if threshold <= 0 or len(items) < threshold:
+        return convert(items, *args)
+    pool = _process_pool()
+    chunk_size = max(threshold // 2, -(-len(items) // _pool_size()))
+    futures = [pool.submit(convert, items[start:start + chunk_size], *args) for start in range(0, len(items), chunk_size)]
+    return [converted for future in futures for converted in future.result()]
@@ -0,0 +1,204 @@
+import logging
+import random
+import threading
+import time
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.exceptions import MaxRetryError, NewConnectionError
+
+from ProjectUtils.MessagingService.schemas import Service as ServiceSchema
+from Wrappers import config
+from Wrappers.base_wrapper.rate_limiter import get_rate_limiter
+from Wrappers.base_wrapper.response_cache import ResponseCache
+
+LOGGER = logging.getLogger(__name__)
+LOGGER.setLevel(logging.INFO)
+
+# methods that can be sent again without changing the outcome, unless the caller passes idempotent=False
+IDEMPOTENT_METHODS = frozenset({"GET", "HEAD", "OPTIONS", "PUT", "DELETE"})
+RETRY_STATUS_CODES = frozenset({429, 502, 503, 504})
+
+
+class CircuitOpenError(requests.exceptions.ConnectionError):
+    # raised without calling the service while its circuit breaker is open
+    pass
+
+
+class CircuitBreaker:
+    """
+        Opens after failure_threshold consecutive failures, rejecting every call for reset_timeout seconds.
+        Then a single trial call is let through (half open): success closes the breaker, failure opens it again.
+    """
+
+    CLOSED, OPEN, HALF_OPEN = "closed", "open", "half_open"
+
+    def __init__(self, failure_threshold: int, reset_timeout: float) -> None:
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self._lock = threading.Lock()
+        self._state = self.CLOSED
+        self._failures = 0
+        self._opened_at = 0.0
+        self._trial_in_flight = False
+
+    @property
+    def state(self) -> str:
+        with self._lock:
+            if self._state == self.OPEN and time.monotonic() - self._opened_at >= self.reset_timeout:
+                return self.HALF_OPEN
+            return self._state
+
+    def allow(self) -> bool:
+        with self._lock:
+            if self._state == self.CLOSED:
+                return True
+            if self._state == self.OPEN and time.monotonic() - self._opened_at >= self.reset_timeout:
+                self._state = self.HALF_OPEN
+                self._trial_in_flight = False
+            if self._state == self.HALF_OPEN and not self._trial_in_flight:
+                self._trial_in_flight = True
+                return True
+            return False
+
+    def record_success(self) -> None:
+        with self._lock:
+            self._state = self.CLOSED
+            self._failures = 0
+            self._trial_in_flight = False
+
+    def record_failure(self) -> None:
+        with self._lock:
+            self._failures += 1
+            self._trial_in_flight = False
+            if self._state == self.HALF_OPEN or self._failures >= self.failure_threshold:
+                self._state = self.OPEN
+                self._opened_at = time.monotonic()
+
+
+# per service, shared by every session of the service in this process
+_circuit_breakers = {}
+_response_caches = {}
+_stats = {}
+_stats_lock = threading.Lock()
+
+
+def _count(service_schema: ServiceSchema, counter: str) -> None:
+    with _stats_lock:
+        _stats.setdefault(service_schema.value, {"requests": 0, "retries": 0, "failures": 0, "rejected": 0})[counter] += 1
+
+
+def get_http_stats() -> dict:
+    # {service: {"circuit": state, "requests", "retries", "failures", "rejected", "rate_limited", "rate_limit_wait_s"}}
+    with _stats_lock:
+        stats = {service: dict(counters) for service, counters in _stats.items()}
+    for service, breaker in _circuit_breakers.items():
+        service_stats = stats.setdefault(service, {"requests": 0, "retries": 0, "failures": 0, "rejected": 0})
+        service_stats["circuit"] = breaker.state
+        if (rate_limiter := get_rate_limiter(service)) is not None:
+            service_stats["rate_limited"] = rate_limiter.waits
+            service_stats["rate_limit_wait_s"] = round(rate_limiter.wait_seconds, 3)
+        if (response_cache := _response_caches.get(service)) is not None:
+            service_stats["response_cache"] = response_cache.stats()
+    return stats
+
+
+class ServiceSession(requests.Session):
+    """
+        requests.Session for one external service: every request gets default connect/read timeouts, idempotent
+        requests are retried with exponential backoff on connection errors, timeouts and 429/502/503/504 responses,
+        other requests only when their connection couldn't be established (they never reached the service).
+        Every attempt counts for the service's circuit breaker, which fails requests fast while the service keeps
+        failing, and waits for a token of the service's rate limiter, if one is configured.
+        Pass idempotent=True/False to a request to override the choice made from its method, and cache=True
+        to a GET to serve it from the service's ResponseCache (shared in-flight request, ETag revalidation).
+    """
+
+    def __init__(self, service_schema: ServiceSchema) -> None:
+        super().__init__()
+        self.service_schema = service_schema
+        settings = config.http_resilience_settings(service_schema.value)
+        self.timeout = (settings["connect_timeout_ms"] / 1000, settings["read_timeout_ms"] / 1000)
+        self.retries = settings["retries"]
+        self.connect_retries = settings["connect_retries"]
+        self.backoff = settings["backoff_ms"] / 1000
+        self.backoff_max = settings["backoff_max_ms"] / 1000
+        breaker = _circuit_breakers.get(service_schema.value)
+        if breaker is None:
+            breaker = _circuit_breakers[service_schema.value] = CircuitBreaker(
+                settings["circuit_failure_threshold"], settings["circuit_reset_ms"] / 1000
+            )
+        self.circuit_breaker = breaker
+        self.rate_limiter = get_rate_limiter(service_schema.value)
+        cache_settings = config.http_cache_settings(service_schema.value)
+        response_cache = _response_caches.get(service_schema.value)
+        if response_cache is None and cache_settings["max_size"] > 0:
+            response_cache = _response_caches[service_schema.value] = ResponseCache(
+                cache_settings["ttl_ms"] / 1000, cache_settings["max_size"]
+            )
+        self.response_cache = response_cache
+
+    def request(self, method, url, *args, **kwargs):
+        cache = kwargs.pop("cache", False)
+        if cache and self.response_cache is not None and method.upper() == "GET":
+            key = requests.Request(method, url, params=kwargs.get("params")).prepare().url
+            headers = kwargs.pop("headers", None) or {}
+            return self.response_cache.fetch(key, lambda validators: self._send(
+                method, url, *args, headers={**headers, **validators}, **kwargs
+            ))
+        return self._send(method, url, *args, **kwargs)
+
+    def _send(self, method, url, *args, **kwargs):
+        idempotent = kwargs.pop("idempotent", None)
+        if idempotent is None:
+            idempotent = method.upper() in IDEMPOTENT_METHODS
+        if kwargs.get("timeout") is None:
+            kwargs["timeout"] = self.timeout
+        attempts = 1 + (self.retries if idempotent else self.connect_retries)
+        for attempt in range(attempts):
+            if not self.circuit_breaker.allow():
+                _count(self.service_schema, "rejected")
+                raise CircuitOpenError(f"{self.service_schema.name} circuit breaker is open, not calling {method} {url}")
+            if self.rate_limiter is not None:
+                self.rate_limiter.acquire(url)
+            _count(self.service_schema, "requests")
+            try:
+                response = super().request(method, url, *args, **kwargs)
+            except (requests.exceptions.ConnectionError, requests.exceptions.Timeout) as e:
+                self.circuit_breaker.record_failure()
+                _count(self.service_schema, "failures")
+                if attempt + 1 == attempts or not (idempotent or _not_sent(e)):
+                    raise
+                LOGGER.warning("%s - %s %s failed (%s), retrying", self.service_schema.name, method, url, e)
+            else:
+                if response.status_code < 500:
+                    # the service is up, even when it throttles (429)
+                    self.circuit_breaker.record_success()
+                else:
+                    self.circuit_breaker.record_failure()
+                    _count(self.service_schema, "failures")
+                if attempt + 1 == attempts or not idempotent or response.status_code not in RETRY_STATUS_CODES:
+                    return response
+                LOGGER.warning("%s - %s %s answered %s, retrying", self.service_schema.name, method, url, response.status_code)
+                response.close()
+            _count(self.service_schema, "retries")
+            # full jitter exponential backoff
+            time.sleep(random.uniform(0, min(self.backoff_max, self.backoff * 2 ** attempt)))
+
+
+def _not_sent(error: Exception) -> bool:
+    # whether the request failed before reaching the service, so even a non-idempotent one can be resent
+    if isinstance(error, requests.exceptions.ConnectTimeout):
+        return True
+    reason = error.args[0] if error.args else None
+    return isinstance(reason, MaxRetryError) and isinstance(reason.reason, NewConnectionError)
+
+
+def create_http_session(service_schema: ServiceSchema) -> ServiceSession:
+    # one keep-alive connection pool per wrapper instead of a new connection per request. The adapter doesn't
+    # retry (max_retries=0): ServiceSession does, so that every attempt counts for the circuit breaker
+    adapter = HTTPAdapter(**config.http_pool_settings(service_schema.value), max_retries=0)
+    session = ServiceSession(service_schema)
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    return session
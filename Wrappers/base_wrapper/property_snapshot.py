@@ -0,0 +1,23 @@
+import threading
+
+from Wrappers.base_wrapper.utils import content_hash
+
+
+def field_hashes(platform_property: dict) -> dict:
+    # {field: 16 hex digits hash of its JSON value}, compact enough to keep one per property and field
+    return {field: content_hash(value) for field, value in platform_property.items()}
+
+
+# per service: property updates pushed / skipped because the platform already held every value, fields left out
+_stats = {}
+_stats_lock = threading.Lock()
+
+
+def count(service_name: str, counter: str, amount: int = 1) -> None:
+    with _stats_lock:
+        _stats.setdefault(service_name, {"pushed_writes": 0, "skipped_writes": 0, "skipped_fields": 0})[counter] += amount
+
+
+def get_property_snapshot_stats() -> dict:
+    with _stats_lock:
+        return {service: dict(counters) for service, counters in _stats.items()}
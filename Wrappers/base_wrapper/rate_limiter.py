@@ -0,0 +1,170 @@
+import logging
+import threading
+import time
+
+from urllib.parse import urlsplit
+
+from sqlalchemy import Column, Float, MetaData, String, Table, create_engine, event, insert, select, update
+from sqlalchemy.exc import IntegrityError, OperationalError, SQLAlchemyError
+
+from Wrappers import config
+
+LOGGER = logging.getLogger(__name__)
+LOGGER.setLevel(logging.INFO)
+
+metadata = MetaData()
+rate_limit_buckets = Table(
+    "rate_limit_buckets", metadata,
+    Column("name", String, primary_key=True),
+    Column("tokens", Float, nullable=False),
+    Column("updated_at", Float, nullable=False),  # unix time
+)
+
+
+class TokenBucket:
+    """
+        In-process token bucket refilled at `rate` tokens per second up to `capacity`. reserve() always takes a
+        token, possibly going into debt, and returns how long the caller has to wait for it to be due:
+        concurrent callers are spread out at `rate` instead of retrying in a burst.
+    """
+
+    def __init__(self, rate: float, capacity: float) -> None:
+        self.rate = rate
+        self.capacity = capacity
+        self._tokens = capacity
+        self._updated_at = time.monotonic()
+        self._lock = threading.Lock()
+
+    def reserve(self) -> float:
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self.capacity, self._tokens + (now - self._updated_at) * self.rate) - 1
+            self._updated_at = now
+            return max(0.0, -self._tokens / self.rate)
+
+
+class SharedTokenBucket(TokenBucket):
+    # same bucket, stored in a database shared by the regular and scheduled handlers of the service. While the
+    # database is unavailable, the in-process bucket is used and the database tried again every retry_after seconds
+    def __init__(self, url: str, name: str, rate: float, capacity: float, retry_after: float) -> None:
+        super().__init__(rate, capacity)
+        self.url = url
+        self.name = name
+        self.retry_after = retry_after
+        self._unavailable_until = float("-inf")
+        self._warned_at = float("-inf")
+
+    def reserve(self) -> float:
+        if time.monotonic() >= self._unavailable_until:
+            try:
+                return self._reserve_shared()
+            except SQLAlchemyError as e:
+                now = time.monotonic()
+                with self._lock:
+                    self._unavailable_until = now + self.retry_after
+                    warn = now - self._warned_at >= self.retry_after
+                    if warn:
+                        self._warned_at = now
+                if warn:
+                    LOGGER.warning("Shared rate limit bucket '%s' unavailable, limiting this process only for %ss: %s",
+                                   self.name, self.retry_after, e)
+        return super().reserve()
+
+    def _reserve_shared(self) -> float:
+        table = rate_limit_buckets
+        try:
+            with _shared_engine(self.url).begin() as connection:
+                # a no-op UPDATE first, so the row (or the SQLite database) is write locked before it's read
+                locked = connection.execute(
+                    update(table).where(table.c.name == self.name).values(tokens=table.c.tokens)
+                ).rowcount
+                now = time.time()
+                if not locked:
+                    connection.execute(insert(table).values(name=self.name, tokens=self.capacity - 1, updated_at=now))
+                    return 0.0
+                tokens, updated_at = connection.execute(
+                    select(table.c.tokens, table.c.updated_at).where(table.c.name == self.name)
+                ).one()
+                tokens = min(self.capacity, tokens + max(0.0, now - updated_at) * self.rate) - 1
+                connection.execute(update(table).where(table.c.name == self.name).values(tokens=tokens, updated_at=now))
+        except IntegrityError:
+            # the row was created by the other process meanwhile
+            return self._reserve_shared()
+        return max(0.0, -tokens / self.rate)
+
+
+_engines = {}
+_engines_lock = threading.Lock()
+
+
+def _shared_engine(url: str):
+    with _engines_lock:
+        engine = _engines.get(url)
+        if engine is None:
+            engine = create_engine(url)
+            if engine.dialect.name == "sqlite":
+                @event.listens_for(engine, "connect")
+                def set_sqlite_pragmas(dbapi_connection, connection_record):
+                    cursor = dbapi_connection.cursor()
+                    cursor.execute("PRAGMA journal_mode=WAL")
+                    cursor.execute(f"PRAGMA busy_timeout={config.SQLITE_BUSY_TIMEOUT_MS}")
+                    cursor.close()
+            try:
+                metadata.create_all(engine)
+            except OperationalError:
+                # created by the other process between the existence check and the CREATE TABLE
+                metadata.create_all(engine)
+            _engines[url] = engine
+        return engine
+
+
+class RateLimiter:
+    # one token bucket per service, or per service and endpoint (first segment of the URL path)
+    def __init__(self, service_name: str, rate: float, burst: float, per_endpoint: bool, shared_url: str = "") -> None:
+        self.service_name = service_name
+        self.rate = rate
+        self.burst = max(1.0, burst)
+        self.per_endpoint = per_endpoint
+        self.shared_url = shared_url
+        self._buckets = {}
+        self._lock = threading.Lock()
+        self.waits = 0
+        self.wait_seconds = 0.0
+
+    def _bucket(self, url: str) -> TokenBucket:
+        name = self.service_name
+        if self.per_endpoint:
+            name += ":" + urlsplit(url).path.strip("/").split("/")[0]
+        with self._lock:
+            bucket = self._buckets.get(name)
+            if bucket is None:
+                if self.shared_url:
+                    bucket = SharedTokenBucket(self.shared_url, name, self.rate, self.burst,
+                                               config.RATE_LIMIT_SHARED_RETRY_MS / 1000)
+                else:
+                    bucket = TokenBucket(self.rate, self.burst)
+                self._buckets[name] = bucket
+            return bucket
+
+    def acquire(self, url: str) -> None:
+        wait = self._bucket(url).reserve()
+        if wait > 0:
+            with self._lock:
+                self.waits += 1
+                self.wait_seconds += wait
+            time.sleep(wait)
+
+
+# per service, shared by every session of the service in this process
+_rate_limiters = {}
+
+
+def get_rate_limiter(service_name: str):
+    # None when the service isn't rate limited
+    with _engines_lock:
+        if service_name not in _rate_limiters:
+            settings = config.http_rate_limit_settings(service_name)
+            _rate_limiters[service_name] = None if settings["rate"] <= 0 else RateLimiter(
+                service_name, settings["rate"], settings["burst"], settings["per_endpoint"], config.RATE_LIMIT_DATABASE_URL
+            )
+        return _rate_limiters[service_name]
@@ -0,0 +1,101 @@
+import threading
+import time
+
+from collections import OrderedDict
+from concurrent.futures import Future
+
+import requests
+
+
+class CachedResponse(requests.Response):
+    # response shared by every caller of a cached GET: its JSON body is parsed once, callers must not mutate it
+    def json(self, **kwargs):
+        if kwargs:
+            return super().json(**kwargs)
+        if not hasattr(self, "_parsed_json"):
+            self._parsed_json = super().json()
+        return self._parsed_json
+
+
+class ResponseCache:
+    """
+        Cache of successful GET responses keyed by URL, bounded to max_size entries (least recently used evicted).
+        Fresh entries (younger than ttl seconds) are served without a request; stale ones are revalidated with
+        If-None-Match when the service sent an ETag, and a 304 answer serves the cached body again.
+        Concurrent fetches of the same URL share a single in-flight request.
+    """
+
+    def __init__(self, ttl: float, max_size: int) -> None:
+        self.ttl = ttl
+        self.max_size = max_size
+        self._entries = OrderedDict()  # url -> (response, etag, expires_at)
+        self._in_flight = {}  # url -> Future
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.revalidated = 0
+        self.coalesced = 0
+        self.misses = 0
+
+    def fetch(self, url: str, send) -> requests.Response:
+        # send(headers) issues the GET with the extra headers (None removes a header) and returns its response
+        with self._lock:
+            entry = self._entries.get(url)
+            if entry is not None:
+                self._entries.move_to_end(url)
+                if entry[2] > time.monotonic():
+                    self.hits += 1
+                    return entry[0]
+            flight = self._in_flight.get(url)
+            leader = flight is None
+            if leader:
+                flight = self._in_flight[url] = Future()
+            else:
+                self.coalesced += 1
+        if not leader:
+            return flight.result()
+
+        try:
+            response = send({"If-None-Match": entry[1]} if entry is not None and entry[1] else {})
+            if response.status_code == 304 and entry is None:
+                # nothing cached to serve it with (e.g. an If-None-Match set on the session): asked again without one
+                response = send({"If-None-Match": None})
+            with self._lock:
+                if response.status_code == 304 and entry is not None:
+                    self.revalidated += 1
+                    response = entry[0]
+                    self._store(url, response, entry[1])
+                else:
+                    self.misses += 1
+                    if response.status_code == 200:
+                        response.content  # read the body before the response is shared
+                        response.__class__ = CachedResponse
+                        self._store(url, response, response.headers.get("ETag"))
+            flight.set_result(response)
+            return response
+        except BaseException as e:
+            flight.set_exception(e)
+            raise
+        finally:
+            with self._lock:
+                self._in_flight.pop(url, None)
+
+    def _store(self, url: str, response: requests.Response, etag) -> None:
+        self._entries[url] = (response, etag, time.monotonic() + self.ttl)
+        self._entries.move_to_end(url)
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+
+    def invalidate(self, url: str) -> None:
+        with self._lock:
+            self._entries.pop(url, None)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "size": len(self._entries),
+                "max_size": self.max_size,
+                "hits": self.hits,
+                "revalidated": self.revalidated,
+                "coalesced": self.coalesced,
+                "misses": self.misses,
+            }
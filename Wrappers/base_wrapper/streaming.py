@@ -0,0 +1,86 @@
+import codecs
+import json
+
+STREAM_READ_SIZE = 64 * 1024
+_WHITESPACE = " \t\n\r"
+_ITEM_END = _WHITESPACE + ",]"
+
+
+def iter_json_array(response, read_size: int = STREAM_READ_SIZE):
+    """
+        Yields the items of a JSON array response (requested with stream=True) as they are downloaded,
+        keeping only the undecoded tail of the body in memory instead of the whole document.
+    """
+    decoder = json.JSONDecoder()
+    text_decoder = codecs.getincrementaldecoder(response.encoding or "utf-8")()
+    chunks = response.iter_content(chunk_size=read_size)
+    buffer = ""
+    position = 0
+    exhausted = False
+    started = False
+
+    def read_more() -> bool:
+        nonlocal buffer, position, exhausted
+        if exhausted:
+            return False
+        chunk = next(chunks, None)
+        if chunk is None:
+            exhausted = True
+            buffer = buffer[position:] + text_decoder.decode(b"", final=True)
+        else:
+            buffer = buffer[position:] + text_decoder.decode(chunk)
+        position = 0
+        return True
+
+    def next_significant_char():
+        nonlocal position
+        while True:
+            while position < len(buffer) and buffer[position] in _WHITESPACE:
+                position += 1
+            if position < len(buffer):
+                return buffer[position]
+            if not read_more():
+                return None
+
+    if next_significant_char() != "[":
+        raise ValueError("Expected a JSON array")
+    position += 1
+    while True:
+        char = next_significant_char()
+        if char is None:
+            raise ValueError("Unterminated JSON array")
+        if char == "]":
+            return
+        if started:
+            if char != ",":
+                raise ValueError(f"Expected ',' or ']' in JSON array, got {char!r}")
+            position += 1
+            next_significant_char()
+        while True:
+            try:
+                item, end = decoder.raw_decode(buffer, position)
+                # a number cut by the end of the buffer ("12" of "12.5") may continue in the next chunk
+                if exhausted or (end < len(buffer) and buffer[end] in _ITEM_END):
+                    break
+            except json.JSONDecodeError:
+                if exhausted:
+                    raise
+            read_more()
+        position = end
+        started = True
+        yield item
+
+
+def chunked(items, max_count: int, max_bytes: int = 0):
+    # groups items into lists of at most max_count items and about max_bytes of JSON (0: no byte limit)
+    chunk = []
+    chunk_bytes = 0
+    for item in items:
+        item_bytes = len(json.dumps(item, default=str)) if max_bytes else 0
+        if chunk and (len(chunk) >= max_count or (max_bytes and chunk_bytes + item_bytes > max_bytes)):
+            yield chunk
+            chunk, chunk_bytes = [], 0
+        chunk.append(item)
+        chunk_bytes += item_bytes
+    if chunk:
+        yield chunk
@@ -1,3 +1,11 @@
+import hashlib
+import json
+
 
 def invert_map(d: dict):
     return {v: k for k, v in d.items()}
+
+
+def content_hash(value) -> str:
+    # 16 hex digits hash of the JSON value, keys sorted
+    return hashlib.blake2b(json.dumps(value, sort_keys=True, default=str).encode(), digest_size=8).hexdigest()
@@ -2,6 +2,9 @@ from abc import ABC, abstractmethod
 from datetime import datetime
 
 from ProjectUtils.MessagingService.schemas import Service as ServiceSchema
+from Wrappers import config, crud
+from Wrappers.base_wrapper import property_snapshot
+from Wrappers.base_wrapper.http_session import create_http_session
 
 
 # Interface of what a wrapper is able to do
@@ -10,6 +13,7 @@ class BaseWrapper(ABC):
         self.url = url
         self.queue = queue
         self.service_schema = service_schema
+        self.session = create_http_session(service_schema)
 
     @abstractmethod
     def create_property(self, property):
@@ -19,6 +23,34 @@ class BaseWrapper(ABC):
     def update_property(self, prop_internal_id: int, prop_update_parameters: dict):
         pass
 
+    def put_property_update(self, url: str, external_id: int, converted_property: dict):
+        # PUTs only the converted fields whose value differs from the last one pushed to the property.
+        # Returns the response, or None when the platform already holds every value and nothing was sent
+        if not config.PROPERTY_SNAPSHOTS:
+            return self.session.put(url=url, json=converted_property)
+        hashes = property_snapshot.field_hashes(converted_property)
+        pushed_hashes = crud.get_property_snapshot(self.service_schema, external_id)
+        changed_property = {field: value for field, value in converted_property.items()
+                            if pushed_hashes.get(field) != hashes[field]}
+        property_snapshot.count(self.service_schema.value, "skipped_fields", len(converted_property) - len(changed_property))
+        if not changed_property:
+            property_snapshot.count(self.service_schema.value, "skipped_writes")
+            return None
+        try:
+            response = self.session.put(url=url, json=changed_property)
+        except Exception:
+            # e.g. a read timeout: the platform may have applied the update, or part of it
+            crud.delete_property_snapshot(self.service_schema, external_id)
+            raise
+        property_snapshot.count(self.service_schema.value, "pushed_writes")
+        if response.ok:
+            crud.save_property_snapshot(self.service_schema, external_id,
+                                        {field: hashes[field] for field in changed_property})
+        else:
+            # the platform may have applied part of the update
+            crud.delete_property_snapshot(self.service_schema, external_id)
+        return response
+
     @abstractmethod
     def delete_property(self, property):
         pass
@@ -35,6 +67,21 @@ class BaseWrapper(ABC):
     def delete_management_event(self, property_internal_id: int, event_internal_id: int):
         pass
 
+    def apply_management_event_batch(self, property_internal_id: int, operations: list[dict]):
+        # operations, in order: {"type": "create" | "update" | "delete", "event_internal_id", "begin_datetime", "end_datetime"}
+        # (no datetimes for deletes). Applied one by one here, wrappers whose API can write several events in
+        # one request override it
+        for operation in operations:
+            match operation["type"]:
+                case "create":
+                    self.create_management_event(property_internal_id, operation["event_internal_id"],
+                                                 operation["begin_datetime"], operation["end_datetime"])
+                case "update":
+                    self.update_management_event(property_internal_id, operation["event_internal_id"],
+                                                 operation["begin_datetime"], operation["end_datetime"])
+                case "delete":
+                    self.delete_management_event(property_internal_id, operation["event_internal_id"])
+
     @abstractmethod
     def import_properties(self, user):
         pass
@@ -43,6 +90,10 @@ class BaseWrapper(ABC):
     def import_reservations(self, user):
         pass
 
+    def stream_reservations(self, user):
+        # generator version of import_reservations, wrappers override it to parse and convert while downloading
+        yield from self.import_reservations(user)
+
     @abstractmethod
     def import_new_or_newly_canceled_reservations(self, user):
         pass
@@ -1,9 +1,10 @@
-import requests
 import logging
 
 from datetime import datetime
 from .converters.clickandgo_to_propertease import ClickandgoToPropertease
 from .converters.propertease_to_clickandgo import ProperteaseToClickandgo
+from ..base_wrapper.conversion import convert_batch
+from ..base_wrapper.streaming import chunked, iter_json_array
 from ..base_wrapper.wrapper import BaseWrapper
 from ProjectUtils.MessagingService.queue_definitions import (
     channel,
@@ -11,7 +12,7 @@ from ProjectUtils.MessagingService.queue_definitions import (
     WRAPPER_CLICKANDGO_ROUTING_KEY, WRAPPER_BROADCAST_ROUTING_KEY,
 )
 from ..models import Service, ReservationStatus
-from .. import crud
+from .. import config, crud
 
 LOGGER = logging.getLogger(__name__)
 LOGGER.setLevel(logging.INFO)
@@ -38,7 +39,7 @@ class CNGWrapper(BaseWrapper):
     def create_property(self, property):
         url = self.url + "properties"
         LOGGER.info("Creating property in ClickAndGo external API: %s", property)
-        requests.post(url=url, json=property)
+        self.session.post(url=url, json=property)
 
     def update_property(self, prop_internal_id: int, prop_update_parameters: dict):
         external_id = crud.get_property_external_id(self.service_schema, prop_internal_id)
@@ -47,13 +48,14 @@ class CNGWrapper(BaseWrapper):
             return
         url = self.url + f"properties/{external_id}"
         LOGGER.info("Updating property in ClickAndGo external API. Internal_id - '%s'; External_id - '%s'. Update parameters: %s", prop_internal_id, external_id, prop_update_parameters)
-        requests.put(url=url, json=ProperteaseToClickandgo.convert_property(prop_update_parameters))
+        return self.put_property_update(url, external_id, ProperteaseToClickandgo.convert_property(prop_update_parameters, patch=True))
 
     def delete_property(self, property):
         _id = property.get("id")
         LOGGER.info("Deleting property in ClickAndGo external API: %s", property)
         url = self.url + f"properties/{_id}"
-        requests.delete(url=url)
+        self.session.delete(url=url)
+        crud.delete_property_snapshot(self.service_schema, _id)
 
     def create_management_event(self, property_internal_id: int, event_internal_id: int, begin_datetime: str,
                                 end_datetime: str):
@@ -69,7 +71,7 @@ class CNGWrapper(BaseWrapper):
         }
         url = self.url + f"properties/{property_external_id}/events"
         LOGGER.info("POST request call (create management event for property with external_id '%s') in ClickAndGo API at '%s'...", property_external_id, url)
-        res = requests.post(url, json=event_post_body)
+        res = self.session.post(url, json=event_post_body)
         if res.status_code == 201:
             property_after_creating_event = res.json()
             returned_closed_time_frames = property_after_creating_event["closed_time_frames"]
@@ -104,7 +106,7 @@ class CNGWrapper(BaseWrapper):
         }
         url = self.url + f"properties/{property_external_id}/events/{management_event_external.external_id}"
         LOGGER.info("PUT request call (to update management event for property_external_id '%s') in ClickAndGo API at '%s'...", property_external_id, url)
-        res = requests.put(url=url, json=update_parameters)
+        res = self.session.put(url=url, json=update_parameters)
         if res.status_code == 200:
             LOGGER.info("Successfully updated management event with internal_id '%s'", event_internal_id)
             return
@@ -128,7 +130,7 @@ class CNGWrapper(BaseWrapper):
         LOGGER.info("DELETE request call (to delete management event for property_external_id '%s') in ClickAndGo API at '%s'... Deleting event_external_id '%s'", 
                     property_external_id, url, management_event_external.external_id)
 
-        res = requests.delete(url=url)
+        res = self.session.delete(url=url)
         if res.status_code == 204:  # no content
             LOGGER.info("Successfully deleted management event with internal_id '%s'", event_internal_id)
             crud.delete_management_event(self.service_schema, event_internal_id)
@@ -140,10 +142,9 @@ class CNGWrapper(BaseWrapper):
         url = self.url + "properties?email=" + email
         LOGGER.info("Importing ClickAndGo properties for user '%s'", email)
         LOGGER.info("GET request call in ClickAndGo API at '%s'", url)
-        clickandgo_properties = requests.get(url=url).json()
-        converted_properties = [
-            ClickandgoToPropertease.convert_property(p) for p in clickandgo_properties
-        ]
+        clickandgo_properties = self.session.get(url=url, cache=True).json()
+        internal_ids = crud.set_property_internal_ids(self.service_schema, [p.get("id") for p in clickandgo_properties])
+        converted_properties = convert_batch(ClickandgoToPropertease.convert_properties, clickandgo_properties, internal_ids)
         return converted_properties
 
     def import_reservations(self, user):
@@ -151,26 +152,61 @@ class CNGWrapper(BaseWrapper):
         url = self.url + "reservations?email=" + email
         LOGGER.info("Importing ClickAndGo reservations for user '%s'", email)
         LOGGER.info("GET request call in ClickAndGo API at '%s'..", url)
-        clickandgo_reservations = requests.get(url=url).json()
-        converted_properties = [
-            ClickandgoToPropertease.convert_reservation(r, email) for r in clickandgo_reservations
-        ]
+        clickandgo_reservations = self.session.get(url=url).json()
+        property_ids = crud.get_property_internal_ids(self.service_schema, [r.get("property_id") for r in clickandgo_reservations])
+        reservation_ids = crud.save_reservations(self.service_schema,
+                                                 {r.get("id"): r.get("reservation_status") for r in clickandgo_reservations},
+                                                 ClickandgoToPropertease.reservation_details(clickandgo_reservations, property_ids))
+        converted_properties = convert_batch(ClickandgoToPropertease.convert_reservations, clickandgo_reservations, email, reservation_ids, property_ids)
         return converted_properties
 
+    def stream_reservations(self, user):
+        email = user.get("email")
+        url = self.url + "reservations?email=" + email
+        LOGGER.info("Streaming ClickAndGo reservations for user '%s'", email)
+        LOGGER.info("GET request call in ClickAndGo API at '%s'..", url)
+        with self.session.get(url=url, stream=True) as response:
+            if response.status_code != 200:
+                LOGGER.error("Importing reservations failed with status code %s. Response: %s", response.status_code, response.content)
+                return
+            for clickandgo_reservations in chunked(iter_json_array(response), config.RESERVATION_IMPORT_CHUNK_SIZE):
+                property_ids = crud.get_property_internal_ids(self.service_schema, [r.get("property_id") for r in clickandgo_reservations])
+                reservation_ids = crud.save_reservations(self.service_schema,
+                                                         {r.get("id"): r.get("reservation_status") for r in clickandgo_reservations},
+                                                         ClickandgoToPropertease.reservation_details(clickandgo_reservations, property_ids))
+                yield from convert_batch(ClickandgoToPropertease.convert_reservations, clickandgo_reservations, email, reservation_ids, property_ids)
+
     def import_new_or_newly_canceled_reservations(self, user):
         email = user.get("email")
         url = f"{self.url}reservations/upcoming?email={email}"
         LOGGER.info("Importing ClickAndGo NEW or NEWLY CANCELLED reservations for user '%s'", email)
         LOGGER.info("GET request call in ClickAndGo API at '%s'...", url)
-        clickandgo_reservations = requests.get(url=url).json()
-        converted_reservations = [
-            ClickandgoToPropertease.convert_reservation(r, email, reservation)
-            for r in clickandgo_reservations
-            if crud.get_property_internal_id(self.service_schema, r["property_id"]) is not None and
-               ((reservation := crud.get_reservation_by_external_id(self.service_schema, r["id"])) is None or
-                (r[
-                     "reservation_status"] == "canceled" and reservation.reservation_status != ReservationStatus.CANCELED))
+        clickandgo_reservations = self.session.get(url=url).json()
+        watermark = crud.get_reservation_watermark(self.service_schema, email)
+        # reservations with the status they had in the last sync were already handled then
+        changed_reservations = [r for r in clickandgo_reservations if watermark.get(r["id"]) != r["reservation_status"]]
+        LOGGER.info("%s of %s upcoming reservations changed since the last sync", len(changed_reservations), len(clickandgo_reservations))
+        mapped_property_ids = crud.get_property_internal_ids(self.service_schema, [r["property_id"] for r in changed_reservations])
+        reservation_states = crud.get_reservation_states(self.service_schema, [r["id"] for r in changed_reservations])
+        reservation_details = ClickandgoToPropertease.reservation_details(changed_reservations, mapped_property_ids)
+        new_or_newly_canceled_reservations = [
+            r for r in changed_reservations
+            if r["property_id"] in mapped_property_ids and
+               ((state := reservation_states.get(r["id"])) is None or
+                # same content as when it was saved -> nothing new
+                (state[1] != reservation_details[r["id"]]["content_hash"] and
+                 r["reservation_status"] == "canceled" and state[0] != ReservationStatus.CANCELED))
         ]
+        reservation_ids = crud.save_reservations(self.service_schema, {
+            r["id"]: r["reservation_status"] for r in new_or_newly_canceled_reservations
+        }, reservation_details)
+        # reservations of unmapped properties are checked again until their property gets mapped
+        crud.save_reservation_watermark(self.service_schema, email, {
+            r["id"]: r["reservation_status"] for r in clickandgo_reservations
+            if watermark.get(r["id"]) == r["reservation_status"] or r["property_id"] in mapped_property_ids
+        })
+        converted_reservations = convert_batch(ClickandgoToPropertease.convert_reservations, new_or_newly_canceled_reservations, email,
+                                               reservation_ids, mapped_property_ids)
         return converted_reservations
 
     def confirm_reservation(self, reservation_internal_id: int, property_internal_id: int, begin_datetime: str,
@@ -181,7 +217,7 @@ class CNGWrapper(BaseWrapper):
             LOGGER.info("Confirming ClickAndGo reservation with: internal_id - '%s'; external_id '%s'", reservation_internal_id, _id)
             url = self.url + f"reservations/{_id}"
             LOGGER.info("PUT request call in ClickAndGo API to confirm reservation at '%s'...", url)
-            response = requests.put(url=url, json={"reservation_status": "confirmed"})
+            response = self.session.put(url=url, json={"reservation_status": "confirmed"})
             if response.status_code == 200:
                 crud.update_reservation(self.service_schema, reservation_internal_id,
                                         response.json()["reservation_status"])
@@ -198,7 +234,7 @@ class CNGWrapper(BaseWrapper):
             LOGGER.info("Cancelling ClickAndGo OVERLAPPING reservation with: internal_id - '%s'; external_id '%s'", reservation_internal_id, _id)
             url = self.url + f"reservations/{_id}"
             LOGGER.info("PUT request call in ClickAndGo API at '%s'...", url)
-            response = requests.put(url=url, json={"reservation_status": "canceled"})
+            response = self.session.put(url=url, json={"reservation_status": "canceled"})
             if response.status_code == 200:
                 crud.update_reservation(self.service_schema, reservation_internal_id, response.json()["reservation_status"])
             else:
@@ -213,7 +249,7 @@ class CNGWrapper(BaseWrapper):
             LOGGER.info("Cancelling ClickAndGo reservation with: internal_id - '%s'; external_id '%s'", reservation_internal_id, _id)
             url = self.url + f"reservations/{_id}"
             LOGGER.info("PUT request call in ClickAndGo API at '%s'...", url)
-            response = requests.put(url=url, json={"reservation_status": "canceled"})
+            response = self.session.put(url=url, json={"reservation_status": "canceled"})
             if response.status_code == 200:
                 crud.update_reservation(self.service_schema, reservation_internal_id, response.json()["reservation_status"])
             else:
@@ -228,15 +264,14 @@ class CNGWrapper(BaseWrapper):
         LOGGER.info("Importing ClickAndGo NEW properties for user '%s'", email)
         url = f"{self.url}properties?email={email}"
         LOGGER.info("GET request call in ClickAndGo API at '%s'...", url)
-        response = requests.get(url=url)
+        response = self.session.get(url=url, cache=True)
         if response.status_code == 200:
             clickandgo_properties = response.json()
+            mapped_property_ids = crud.get_property_internal_ids(self.service_schema, [prop.get("id") for prop in clickandgo_properties])
             # import properties that don't exist -> not mapped in our database
-            converted_properties = [
-                ClickandgoToPropertease.convert_property(prop)
-                for prop in clickandgo_properties
-                if (crud.get_property_internal_id(self.service_schema, prop.get("id")) is None)
-            ]
+            new_properties = [prop for prop in clickandgo_properties if prop.get("id") not in mapped_property_ids]
+            internal_ids = crud.set_property_internal_ids(self.service_schema, [prop.get("id") for prop in new_properties])
+            converted_properties = convert_batch(ClickandgoToPropertease.convert_properties, new_properties, internal_ids)
             return converted_properties
         LOGGER.error("Importing new properties failed with status code %s. Response: %s", response.status_code, response.content)
         return []
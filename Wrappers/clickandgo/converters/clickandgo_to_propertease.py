@@ -1,10 +1,8 @@
 import logging
 
 from ProjectUtils.MessagingService.schemas import Service
-from Wrappers.base_wrapper.utils import invert_map
+from Wrappers.base_wrapper.utils import content_hash, invert_map
 from Wrappers.clickandgo.converters.propertease_to_clickandgo import ProperteaseToClickandgo
-from Wrappers.models import ReservationIdMapper, ReservationStatus
-from Wrappers.crud import get_property_internal_id, set_property_internal_id, create_reservation, update_reservation
 
 LOGGER = logging.getLogger(__name__)
 LOGGER.setLevel(logging.INFO)
@@ -17,10 +15,10 @@ class ClickandgoToPropertease:
     amenities_map = invert_map(ProperteaseToClickandgo.amenities_map)
 
     @staticmethod
-    def convert_property(clickandgo_property):
+    def convert_property(clickandgo_property, internal_id: int):
         LOGGER.debug("INPUT CONVERTING PROPERTY - ClickAndGo property: %s", clickandgo_property)
         propertease_property = {}
-        propertease_property["_id"] = set_property_internal_id(ClickandgoToPropertease.service, clickandgo_property.get("id"))
+        propertease_property["_id"] = internal_id
         propertease_property["user_email"] = clickandgo_property.get("user_email")
         propertease_property["title"] = clickandgo_property.get("name")
         propertease_property["address"] = clickandgo_property.get("address")
@@ -122,21 +120,12 @@ class ClickandgoToPropertease:
         return propertease_contacts
 
     @staticmethod
-    def convert_reservation(clickandgo_reservation, owner_email: str, reservation: ReservationIdMapper = None):
-        LOGGER.debug("INPUT CONVERTING RESERVATIONS - ClickAndGo reservation: %s", clickandgo_reservation)
-        reservation_status = clickandgo_reservation.get("reservation_status")
-        if reservation is not None:
-            reservation_id = reservation.internal_id
-            LOGGER.info("Existing reservation with status '%s' detected. New reservation status: '%s'", 
-                        reservation.reservation_status, reservation_status)
-            update_reservation(ClickandgoToPropertease.service, reservation_id, reservation_status)
-        else:
-            reservation_id = create_reservation(ClickandgoToPropertease.service, clickandgo_reservation.get("id"), reservation_status).internal_id
-
+    def map_reservation(clickandgo_reservation, owner_email: str, reservation_id: int, property_id: int):
+        # field mapping only, the ids are resolved by the caller
         propertease_reservation = {
             "_id": reservation_id,
-            "reservation_status": reservation_status,
-            "property_id": get_property_internal_id(ClickandgoToPropertease.service, clickandgo_reservation.get("property_id")),
+            "reservation_status": clickandgo_reservation.get("reservation_status"),
+            "property_id": property_id,
             "owner_email": owner_email,
             "begin_datetime": clickandgo_reservation.get("arrival"),
             "end_datetime": clickandgo_reservation.get("departure"),
@@ -148,3 +137,31 @@ class ClickandgoToPropertease:
         LOGGER.debug("OUTPUT CONVERTING RESERVATION - PropertEase reservation: %s", propertease_reservation)
         return propertease_reservation
 
+    # Batch converters, without any database access: the ids are resolved in bulk beforehand, so they can run
+    # on big lists or in another process (see base_wrapper.conversion.convert_batch)
+    @staticmethod
+    def convert_properties(clickandgo_properties: list, internal_ids: dict) -> list:
+        # internal_ids: {external_id: internal_id} of every property (crud.set_property_internal_ids)
+        return [ClickandgoToPropertease.convert_property(p, internal_ids[p.get("id")]) for p in clickandgo_properties]
+
+    @staticmethod
+    def convert_reservations(clickandgo_reservations: list, owner_email: str, reservation_ids: dict, property_ids: dict) -> list:
+        # reservation_ids: {external_id: internal_id} of every reservation (crud.save_reservations),
+        # property_ids: {external_id: internal_id} of the mapped properties (crud.get_property_internal_ids)
+        return [
+            ClickandgoToPropertease.map_reservation(r, owner_email, reservation_ids[r.get("id")], property_ids.get(r.get("property_id")))
+            for r in clickandgo_reservations
+        ]
+
+    @staticmethod
+    def reservation_details(clickandgo_reservations: list, property_ids: dict) -> dict:
+        # {external_id: details stored with the reservation (crud.save_reservations)}
+        return {
+            r.get("id"): {
+                "begin_datetime": r.get("arrival"),
+                "end_datetime": r.get("departure"),
+                "property_internal_id": property_ids.get(r.get("property_id")),
+                "content_hash": content_hash(r),
+            }
+            for r in clickandgo_reservations
+        }
@@ -1,7 +1,6 @@
 import logging
 
 from ProjectUtils.MessagingService.schemas import Service
-from Wrappers.crud import get_property_external_id
 
 LOGGER = logging.getLogger(__name__)
 LOGGER.setLevel(logging.INFO)
@@ -21,42 +20,58 @@ class ProperteaseToClickandgo:
         "parking_space": "parking",
     }
     commission = 0.02
+    # clickandgo field -> PropertEase field, for the fields copied as they are
+    fields_map = {
+        "user_email": "user_email",
+        "name": "title",
+        "address": "address",
+        "town": "location",
+        "description": "description",
+        "guest_num": "number_guests",
+        "house_area": "square_meters",
+        "additional_info": "additional_info",
+    }
 
 
     @staticmethod
-    def convert_property(propertease_property):
+    def convert_property(propertease_property, patch: bool = False):
+        # patch: convert only the fields present in propertease_property, for a partial update
         LOGGER.debug("INPUT CONVERTING PROPERTY - PropertEase property: %s", propertease_property)
+
+        def converts(propertease_field):
+            return not patch or propertease_field in propertease_property
+
         clickandgo_property = dict()
-        property_id = clickandgo_property.get("_id")
-        clickandgo_property["id"] = None if property_id is None else get_property_external_id(ProperteaseToClickandgo.service,
-                                                                                              property_id)
-        clickandgo_property["user_email"] = propertease_property.get("user_email")
-        clickandgo_property["name"] = propertease_property.get("title")
-        clickandgo_property["address"] = propertease_property.get("address")
-        clickandgo_property["town"] = propertease_property.get("location")
-        clickandgo_property["description"] = propertease_property.get("description")
-        clickandgo_property["curr_price"] = ProperteaseToClickandgo.convert_price(
-            propertease_price=propertease_property.get("price"),
-            after_commission=propertease_property.get("after_commission")
-        )
-        clickandgo_property["guest_num"] = propertease_property.get("number_guests")
-        clickandgo_property["house_area"] = propertease_property.get("square_meters")
-        clickandgo_property["bedrooms"] = None \
-            if (propertease_bedrooms := propertease_property.get("bedrooms")) is None \
-            else ProperteaseToClickandgo.convert_bedrooms(propertease_bedrooms)
-        clickandgo_property["bathrooms"] = None \
-            if (propertease_bathrooms := propertease_property.get("bathrooms")) is None \
-            else ProperteaseToClickandgo.convert_bathrooms(propertease_bathrooms)
-        clickandgo_property["available_amenities"] = None \
-            if (propertease_amenities := propertease_property.get("amenities")) is None \
-            else ProperteaseToClickandgo.convert_amenities(propertease_amenities)
-        clickandgo_property["house_rules"] = None \
-            if (propertease_house_rules := propertease_property.get("house_rules")) is None \
-            else ProperteaseToClickandgo.convert_house_rules(propertease_house_rules)
-        clickandgo_property["additional_info"] = propertease_property.get("additional_info")
-        clickandgo_property["house_managers"] = None \
-            if (propertease_contacts := propertease_property.get("contacts")) is None \
-            else ProperteaseToClickandgo.convert_contacts(propertease_contacts)
+        if not patch:
+            clickandgo_property["id"] = None
+        for clickandgo_field, propertease_field in ProperteaseToClickandgo.fields_map.items():
+            if converts(propertease_field):
+                clickandgo_property[clickandgo_field] = propertease_property.get(propertease_field)
+        if converts("price"):
+            clickandgo_property["curr_price"] = ProperteaseToClickandgo.convert_price(
+                propertease_price=propertease_property.get("price"),
+                after_commission=propertease_property.get("after_commission")
+            )
+        if converts("bedrooms"):
+            clickandgo_property["bedrooms"] = None \
+                if (propertease_bedrooms := propertease_property.get("bedrooms")) is None \
+                else ProperteaseToClickandgo.convert_bedrooms(propertease_bedrooms)
+        if converts("bathrooms"):
+            clickandgo_property["bathrooms"] = None \
+                if (propertease_bathrooms := propertease_property.get("bathrooms")) is None \
+                else ProperteaseToClickandgo.convert_bathrooms(propertease_bathrooms)
+        if converts("amenities"):
+            clickandgo_property["available_amenities"] = None \
+                if (propertease_amenities := propertease_property.get("amenities")) is None \
+                else ProperteaseToClickandgo.convert_amenities(propertease_amenities)
+        if converts("house_rules"):
+            clickandgo_property["house_rules"] = None \
+                if (propertease_house_rules := propertease_property.get("house_rules")) is None \
+                else ProperteaseToClickandgo.convert_house_rules(propertease_house_rules)
+        if converts("contacts"):
+            clickandgo_property["house_managers"] = None \
+                if (propertease_contacts := propertease_property.get("contacts")) is None \
+                else ProperteaseToClickandgo.convert_contacts(propertease_contacts)
         # the following elements are not supported in clickandgo -> no need to convert:
         # - cancellation_policy
         LOGGER.debug("OUTPUT CONVERTING PROPERTY - ClickAndGo property: %s", clickandgo_property)
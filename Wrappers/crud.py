@@ -1,104 +1,615 @@
 import logging
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from sqlalchemy import bindparam, insert, update, select, delete
 
 from ProjectUtils.MessagingService.schemas import Service
-from Wrappers.models import SessionLocal, property_id_mapper_by_service, reservation_id_mapper_by_service, \
-    ReservationIdMapper, ReservationStatus, management_id_mapper_by_service
+from Wrappers import config
+from Wrappers.id_cache import LRUCache, MISSING, PROPERTY_INTERNAL_TO_EXTERNAL, PROPERTY_EXTERNAL_TO_INTERNAL, \
+    RESERVATION_INTERNAL_TO_EXTERNAL, MANAGEMENT_EVENT_BY_INTERNAL
+from Wrappers.id_index import IdIndex, as_int
+from Wrappers.models import engine, SessionLocal, property_id_mapper_by_service, reservation_id_mapper_by_service, \
+    ReservationStatus, management_id_mapper_by_service, property_id_allocator, \
+    reservation_id_allocator, property_snapshot_by_service, reservation_watermark_by_service, IdMappingGeneration
 
 LOGGER = logging.getLogger(__name__)
 LOGGER.setLevel(logging.INFO)
 
+# SQLite builds before 3.32 cap bound parameters per statement at 999
+BULK_QUERY_CHUNK_SIZE = 500
 
-def get_property_external_id(service: Service, internal_property_id: int) -> int:
+# Write-through cache in front of the id mapping lookups, keyed by (service, direction, id).
+# Only found records are cached: the regular and scheduled handlers are separate processes sharing the same
+# database, so a miss must always reach the database to see rows inserted by the other process.
+# Mappings renumbered or removed by the other process are caught by revalidate_id_cache.
+id_cache = LRUCache(config.ID_CACHE_MAX_SIZE)
+
+# generation of each id mapper table (see models.IdMappingGeneration) the cache and indexes hold, and when they
+# were last compared with the database's
+_cache_generations = {"generations": None, "checked_at": float("-inf")}
+_cache_generations_lock = threading.Lock()
+
+
+# Session shared by every crud call made while handling one broker message (see message_session)
+_message_session = ContextVar("message_session", default=None)
+
+
+# Preloaded id indexes (see preload_id_indexes): (service, direction) -> (IdIndex, whether keyed by internal_id).
+# When a direction is indexed, it is served by the index instead of the LRU cache.
+_id_indexes_by_direction = {}
+
+
+def get_id_cache_stats() -> dict:
+    stats = id_cache.stats()
+    indexes = {id(index): index for index, _ in _id_indexes_by_direction.values()}.values()
+    stats["indexed_ids"] = sum(len(index) for index in indexes)
+    stats["index_bytes"] = sum(index.nbytes() for index in indexes)
+    return stats
+
+
+# id mappers kept in the preloaded indexes -> (direction, whether the direction is keyed by internal_id)
+_INDEXED_DIRECTIONS = (
+    (property_id_mapper_by_service, ((PROPERTY_INTERNAL_TO_EXTERNAL, True), (PROPERTY_EXTERNAL_TO_INTERNAL, False))),
+    (reservation_id_mapper_by_service, ((RESERVATION_INTERNAL_TO_EXTERNAL, True),)),
+    (management_id_mapper_by_service, ((MANAGEMENT_EVENT_BY_INTERNAL, True),)),
+)
+
+
+def _read_generations(connection) -> dict:
+    table = IdMappingGeneration.__table__
+    return dict(connection.execute(select(table.c.table_name, table.c.generation)).all())
+
+
+def preload_id_indexes(table_names=None):
+    # (re)loads the indexes of every id mapper table, or only of table_names
+    indexes_by_direction = {}
+    with engine.connect() as connection:
+        # read before the rows: a change made meanwhile shows up as a newer generation and gets reloaded
+        generations = _read_generations(connection)
+        for id_mappers_by_service, directions in _INDEXED_DIRECTIONS:
+            for service, IdMapperService in id_mappers_by_service.items():
+                table = IdMapperService.__table__
+                if table_names is not None and table.name not in table_names:
+                    continue
+                rows = connection.execute(select(table.c.internal_id, table.c.external_id))
+                index = IdIndex(
+                    (internal_id, external_id) for internal_id, external_id in rows if as_int(external_id) is not None
+                )
+                LOGGER.info("Preloaded %s ids of '%s' (%s bytes)", len(index), table.name, index.nbytes())
+                for direction, by_internal_id in directions:
+                    indexes_by_direction[(service, direction)] = (index, by_internal_id)
+    if table_names is None:
+        _id_indexes_by_direction.clear()
+    _id_indexes_by_direction.update(indexes_by_direction)
+    with _cache_generations_lock:
+        if table_names is None or _cache_generations["generations"] is None:
+            _cache_generations.update(generations=generations, checked_at=time.monotonic())
+        else:
+            _cache_generations["generations"].update({name: generations.get(name) for name in table_names})
+
+
+def _indexed_table_names() -> set:
+    return {
+        IdMapperService.__tablename__
+        for id_mappers_by_service, directions in _INDEXED_DIRECTIONS
+        for service, IdMapperService in id_mappers_by_service.items()
+        if (service, directions[0][0]) in _id_indexes_by_direction
+    }
+
+
+def revalidate_id_cache(force: bool = False) -> None:
+    # drops the cache, and reloads the preloaded indexes of the tables concerned, when id mappings were renumbered
+    # or removed (by any process) since they were loaded. The database is checked at most every
+    # ID_CACHE_REVALIDATE_MS, unless forced
+    if config.ID_CACHE_MAX_SIZE <= 0 and not _id_indexes_by_direction:
+        return
+    now = time.monotonic()
+    with _cache_generations_lock:
+        if not force and now - _cache_generations["checked_at"] < config.ID_CACHE_REVALIDATE_MS / 1000:
+            return
+        _cache_generations["checked_at"] = now
+    with _session() as db:
+        generations = _read_generations(db.connection())
+    with _cache_generations_lock:
+        known_generations = _cache_generations["generations"] or {}
+        changed_tables = {name for name, generation in generations.items() if known_generations.get(name) != generation}
+        if not changed_tables:
+            return
+        _cache_generations["generations"] = {**known_generations, **generations}
+    LOGGER.info("Id mappings of %s changed, clearing the id cache", sorted(changed_tables))
+    id_cache.clear()
+    if stale_indexes := changed_tables & _indexed_table_names():
+        preload_id_indexes(stale_indexes)
+
+
+def _bump_generation(db, table) -> None:
+    # in the transaction of every write that renumbers or removes mappings of table, so the other process drops its
+    # cached copies
+    generations = IdMappingGeneration.__table__
+    db.execute(update(generations).where(generations.c.table_name == table.name)
+               .values(generation=generations.c.generation + 1))
+    generation = db.execute(select(generations.c.generation).where(generations.c.table_name == table.name)).scalar_one()
+    with _cache_generations_lock:
+        known_generations = _cache_generations["generations"]
+        # this process updates its own cache along with the write, unless it missed another write in between
+        if known_generations is not None and known_generations.get(table.name) == generation - 1:
+            known_generations[table.name] = generation
+
+
+def _get_cached(key):
+    revalidate_id_cache()
+    service, direction, id_ = key
+    indexed = _id_indexes_by_direction.get((service, direction))
+    if indexed is None:
+        return id_cache.get(key)
+    index, by_internal_id = indexed
+    value = index.get_external_id(id_) if by_internal_id else index.get_internal_id(id_)
+    if value is None:
+        return MISSING
+    if direction == MANAGEMENT_EVENT_BY_INTERNAL:
+        return IdRecord(id_, value)
+    return value
+
+
+def _put_cached(key, value):
+    # the generation is known before the first entry is cached
+    revalidate_id_cache()
+    service, direction, id_ = key
+    indexed = _id_indexes_by_direction.get((service, direction))
+    if indexed is None:
+        id_cache.put(key, value)
+        return
+    index, by_internal_id = indexed
+    if direction == MANAGEMENT_EVENT_BY_INTERNAL:
+        value = value.external_id
+    if by_internal_id:
+        index.add(id_, value)
+    else:
+        index.add(value, id_)
+
+
+def _invalidate_cached(key):
+    service, direction, id_ = key
+    indexed = _id_indexes_by_direction.get((service, direction))
+    if indexed is None:
+        id_cache.invalidate(key)
+        return
+    index, by_internal_id = indexed
+    if by_internal_id:
+        index.remove_internal(id_)
+    else:
+        index.remove_external(id_)
+
+
+@contextmanager
+def message_session():
+    # all crud calls inside the block reuse one session, committed once when the block exits without errors
+    db = SessionLocal()
+    token = _message_session.set(db)
+    try:
+        yield db
+        db.commit()
+    except Exception:
+        db.rollback()
+        # the cache and indexes may hold rows written by the rolled back transaction, and the generations the
+        # bumps of the transaction that were never committed
+        with _cache_generations_lock:
+            _cache_generations.update(generations=None, checked_at=float("-inf"))
+        id_cache.clear()
+        if _id_indexes_by_direction:
+            preload_id_indexes()
+        raise
+    finally:
+        _message_session.reset(token)
+        db.close()
+
+
+@contextmanager
+def _session():
+    db = _message_session.get()
+    if db is not None:
+        yield db
+        return
     with SessionLocal() as db:
-        PropertyIdMapper = property_id_mapper_by_service[service]
-        property_record = db.query(PropertyIdMapper).get(internal_property_id)
-        return property_record.external_id if property_record is not None else property_record
+        yield db
+
+
+def _commit(db):
+    if db is _message_session.get():
+        db.flush()
+    else:
+        db.commit()
+
+
+def _allocate_ids(db, allocator, count: int) -> list[int]:
+    if db is _message_session.get():
+        # in SQLite a separate connection would wait on the write lock held by the message's transaction
+        return allocator.allocate(count, db.connection())
+    return allocator.allocate(count)
+
+
+def _chunks(values: list, size: int = BULK_QUERY_CHUNK_SIZE):
+    for start in range(0, len(values), size):
+        yield values[start:start + size]
+
+
+# Read fast path: the lookups below run Core select() statements on the session's connection and return plain
+# values or __slots__ records instead of ORM instances (no identity map, no instance state)
+class IdRecord:
+    __slots__ = ("internal_id", "external_id")
+
+    def __init__(self, internal_id, external_id) -> None:
+        self.internal_id = internal_id
+        self.external_id = external_id
+
+    def __repr__(self) -> str:
+        return f"{type(self).__name__}(internal_id={self.internal_id!r}, external_id={self.external_id!r})"
+
+
+class ReservationRecord(IdRecord):
+    __slots__ = ("reservation_status",)
+
+    def __init__(self, internal_id, external_id, reservation_status) -> None:
+        super().__init__(internal_id, external_id)
+        self.reservation_status = reservation_status
+
+    def __repr__(self) -> str:
+        return f"{super().__repr__()[:-1]}, reservation_status={self.reservation_status!r})"
+
+
+# (table, selected columns, filter column, expanding) -> select() statement, built once and reused with new parameters
+_statements = {}
+
+
+def _select_by(table, columns: tuple, by_column: str, expanding: bool = False):
+    key = (table.name, columns, by_column, expanding)
+    statement = _statements.get(key)
+    if statement is None:
+        condition = table.c[by_column].in_(bindparam("values", expanding=True)) if expanding \
+            else table.c[by_column] == bindparam("value")
+        statement = _statements[key] = select(*(table.c[column] for column in columns)).where(condition)
+    return statement
+
+
+def _fetch_one(db, table, columns: tuple, by_column: str, value):
+    return db.connection().execute(_select_by(table, columns, by_column), {"value": value}).first()
+
+
+def _fetch_all(db, table, columns: tuple, by_column: str, values: list):
+    return db.connection().execute(_select_by(table, columns, by_column, expanding=True), {"values": values}).all()
+
+
+def get_property_external_id(service: Service, internal_property_id: int) -> int:
+    cached = _get_cached((service, PROPERTY_INTERNAL_TO_EXTERNAL, internal_property_id))
+    if cached is not MISSING:
+        return cached
+    with _session() as db:
+        row = _fetch_one(db, property_id_mapper_by_service[service].__table__, ("external_id",), "internal_id",
+                         internal_property_id)
+        if row is None:
+            return None
+        _put_cached((service, PROPERTY_INTERNAL_TO_EXTERNAL, internal_property_id), row.external_id)
+        return row.external_id
 
 
 def get_property_internal_id(service: Service, external_property_id: int) -> int:
-    with SessionLocal() as db:
+    cached = _get_cached((service, PROPERTY_EXTERNAL_TO_INTERNAL, external_property_id))
+    if cached is not MISSING:
+        return cached
+    with _session() as db:
+        PropertyIdMapper = property_id_mapper_by_service[service]
+        row = _fetch_one(db, PropertyIdMapper.__table__, ("internal_id",), "external_id", external_property_id)
+        LOGGER.info("Querying '%s' with external_property_id '%s'. Response: '%s'", PropertyIdMapper, external_property_id, row)
+        if row is None:
+            return None
+        _put_cached((service, PROPERTY_EXTERNAL_TO_INTERNAL, external_property_id), row.internal_id)
+        return row.internal_id
+
+
+# returns {external_id: internal_id} for the mapped properties only
+def get_property_internal_ids(service: Service, external_property_ids) -> dict:
+    internal_ids = {}
+    ids_to_query = []
+    for external_property_id in dict.fromkeys(external_property_ids):
+        cached = _get_cached((service, PROPERTY_EXTERNAL_TO_INTERNAL, external_property_id))
+        if cached is MISSING:
+            ids_to_query.append(external_property_id)
+        else:
+            internal_ids[external_property_id] = cached
+    if not ids_to_query:
+        return internal_ids
+    with _session() as db:
         PropertyIdMapper = property_id_mapper_by_service[service]
-        property_record = db.query(PropertyIdMapper).filter(
-            PropertyIdMapper.external_id == external_property_id).first()
-        LOGGER.info("Querying '%s' with external_property_id '%s'. Response: '%s'", PropertyIdMapper, external_property_id, property_record)
-        return property_record.internal_id if property_record is not None else property_record
+        for chunk in _chunks(ids_to_query):
+            for internal_id, external_id in _fetch_all(db, PropertyIdMapper.__table__, ("internal_id", "external_id"),
+                                                       "external_id", chunk):
+                internal_ids[external_id] = internal_id
+                _put_cached((service, PROPERTY_EXTERNAL_TO_INTERNAL, external_id), internal_id)
+                _put_cached((service, PROPERTY_INTERNAL_TO_EXTERNAL, internal_id), external_id)
+    LOGGER.info("Querying '%s' with %s external_property_ids. Found %s mapped properties.",
+                property_id_mapper_by_service[service], len(ids_to_query), len(internal_ids))
+    return internal_ids
 
 
 def set_property_internal_id(service: Service, external_property_id) -> int:
-    with SessionLocal() as db:
+    with _session() as db:
         PropertyIdMapper = property_id_mapper_by_service[service]
-        mapped_id = PropertyIdMapper(external_id=external_property_id)
+        mapped_id = PropertyIdMapper(internal_id=_allocate_ids(db, property_id_allocator, 1)[0],
+                                     external_id=external_property_id)
         LOGGER.info("Creating property in '%s' with external_property_id: '%s'", PropertyIdMapper, external_property_id)
         db.add(mapped_id)
-        db.commit()
+        _commit(db)
         db.refresh(mapped_id)
+        _put_cached((service, PROPERTY_INTERNAL_TO_EXTERNAL, mapped_id.internal_id), mapped_id.external_id)
+        _put_cached((service, PROPERTY_EXTERNAL_TO_INTERNAL, mapped_id.external_id), mapped_id.internal_id)
         return mapped_id.internal_id
 
 
-def set_property_mapped_id(service: Service, old_internal_id, new_internal_id):
-    with SessionLocal() as db:
-        IdMapperService = property_id_mapper_by_service[service]
-        property_with_same_internal_id = db.query(IdMapperService).get(new_internal_id)
-        property_to_update_or_delete = db.query(IdMapperService).get(old_internal_id)
-        if property_with_same_internal_id is not None:
-            # delete
-            LOGGER.info("Deleting property with internal_id '%s' from '%s'", old_internal_id, IdMapperService)
-            db.delete(property_to_update_or_delete)
-        else:
-            # update
-            LOGGER.info("Updating property with old_internal_id '%s' to new_internal_id '%s' in %s since it's a duplicate.",
-                        old_internal_id, new_internal_id, IdMapperService)
-            property_to_update_or_delete.internal_id = new_internal_id
-        db.commit()
+# returns {external_id: internal_id}, creating the missing mappings in a single transaction
+def set_property_internal_ids(service: Service, external_property_ids) -> dict:
+    external_ids = list(dict.fromkeys(external_property_ids))
+    with _session() as db:
+        PropertyIdMapper = property_id_mapper_by_service[service]
+        internal_ids = {}
+        for chunk in _chunks(external_ids):
+            for internal_id, external_id in _fetch_all(db, PropertyIdMapper.__table__, ("internal_id", "external_id"),
+                                                       "external_id", chunk):
+                internal_ids[external_id] = internal_id
+        external_ids_to_create = [external_id for external_id in external_ids if external_id not in internal_ids]
+        if external_ids_to_create:
+            LOGGER.info("Creating %s properties in '%s'", len(external_ids_to_create), PropertyIdMapper)
+            # ids are reserved before any write is issued in this session
+            new_internal_ids = _allocate_ids(db, property_id_allocator, len(external_ids_to_create))
+            internal_ids.update(zip(external_ids_to_create, new_internal_ids))
+            db.execute(insert(PropertyIdMapper), [
+                {"internal_id": internal_ids[external_id], "external_id": external_id}
+                for external_id in external_ids_to_create
+            ])
+            _commit(db)
+    for external_id, internal_id in internal_ids.items():
+        _put_cached((service, PROPERTY_INTERNAL_TO_EXTERNAL, internal_id), external_id)
+        _put_cached((service, PROPERTY_EXTERNAL_TO_INTERNAL, external_id), internal_id)
+    return internal_ids
+
+
+# applies old_new_id_map ({old_internal_id: new_internal_id}) one entry after the other, in a single transaction:
+# the property is deleted when new_internal_id is already mapped, renumbered otherwise.
+# The reservations of the remapped properties follow them.
+def set_property_mapped_ids(service: Service, old_new_id_map: dict):
+    id_map = [(as_int(old_internal_id), as_int(new_internal_id)) for old_internal_id, new_internal_id in old_new_id_map.items()]
+    if not id_map:
+        return
+    with _session() as db:
+        table = property_id_mapper_by_service[service].__table__
+        reservations_table = reservation_id_mapper_by_service[service].__table__
+        involved_ids = list({internal_id for ids in id_map for internal_id in ids})
+        initial_ids = {}  # external_id -> internal_id
+        for chunk in _chunks(involved_ids):
+            for internal_id, external_id in _fetch_all(db, table, ("internal_id", "external_id"), "internal_id", chunk):
+                initial_ids[external_id] = internal_id
+
+        # the entries are applied in memory first, so chains (a -> b, b -> c) and collisions resolve as one by one
+        external_ids = {internal_id: external_id for external_id, internal_id in initial_ids.items()}
+        property_remap = {}  # original internal_id -> internal_id its reservations end up with
+        for old_internal_id, new_internal_id in id_map:
+            if old_internal_id == new_internal_id:
+                continue
+            if old_internal_id not in external_ids:
+                LOGGER.error("Property with internal_id '%s' to remap not found in '%s'", old_internal_id, table.name)
+                continue
+            external_id = external_ids.pop(old_internal_id)
+            if new_internal_id not in external_ids:
+                external_ids[new_internal_id] = external_id
+            for original_id, remapped_id in property_remap.items():
+                if remapped_id == old_internal_id:
+                    property_remap[original_id] = new_internal_id
+            property_remap.setdefault(old_internal_id, new_internal_id)
+        final_ids = {external_id: internal_id for internal_id, external_id in external_ids.items()}
+
+        deleted = [internal_id for external_id, internal_id in initial_ids.items() if external_id not in final_ids]
+        moved = [{"old_id": internal_id, "temporary_id": -final_ids[external_id]}
+                 for external_id, internal_id in initial_ids.items()
+                 if external_id in final_ids and final_ids[external_id] != internal_id]
+        LOGGER.info("Remapping properties in '%s': %s deleted, %s renumbered", table.name, len(deleted), len(moved))
+        for chunk in _chunks(deleted):
+            db.execute(delete(table).where(table.c.internal_id.in_(chunk)))
+        # two phases through negative ids, so a property can take an id another one is leaving
+        if moved:
+            db.execute(update(table).where(table.c.internal_id == bindparam("old_id"))
+                       .values(internal_id=bindparam("temporary_id")), moved)
+            db.execute(update(table).where(table.c.internal_id < 0).values(internal_id=-table.c.internal_id))
+        reservations_moved = [{"old_id": original_id, "temporary_id": -remapped_id}
+                              for original_id, remapped_id in property_remap.items() if original_id != remapped_id]
+        if reservations_moved:
+            db.execute(update(reservations_table).where(reservations_table.c.property_internal_id == bindparam("old_id"))
+                       .values(property_internal_id=bindparam("temporary_id")), reservations_moved)
+            db.execute(update(reservations_table).where(reservations_table.c.property_internal_id < 0)
+                       .values(property_internal_id=-reservations_table.c.property_internal_id))
+        if deleted or moved:
+            _bump_generation(db, table)
+        _commit(db)
+    for external_id, internal_id in initial_ids.items():
+        if final_ids.get(external_id) != internal_id:
+            _invalidate_cached((service, PROPERTY_INTERNAL_TO_EXTERNAL, internal_id))
+            _invalidate_cached((service, PROPERTY_EXTERNAL_TO_INTERNAL, external_id))
+    for external_id, internal_id in final_ids.items():
+        if initial_ids[external_id] != internal_id:
+            _put_cached((service, PROPERTY_INTERNAL_TO_EXTERNAL, internal_id), external_id)
+            _put_cached((service, PROPERTY_EXTERNAL_TO_INTERNAL, external_id), internal_id)
 
 
 def get_reservation_external_id(service: Service, internal_reservation_id: int) -> int:
-    with SessionLocal() as db:
-        ReservationIdMapper = reservation_id_mapper_by_service[service]
-        reservation = db.query(ReservationIdMapper).get(internal_reservation_id)
-        return reservation.external_id if reservation is not None else reservation
+    cached = _get_cached((service, RESERVATION_INTERNAL_TO_EXTERNAL, internal_reservation_id))
+    if cached is not MISSING:
+        return cached
+    with _session() as db:
+        row = _fetch_one(db, reservation_id_mapper_by_service[service].__table__, ("external_id",), "internal_id",
+                         internal_reservation_id)
+        if row is None:
+            return None
+        _put_cached((service, RESERVATION_INTERNAL_TO_EXTERNAL, internal_reservation_id), row.external_id)
+        return row.external_id
 
 
-def get_reservation_by_external_id(service: Service, external_reservation_id: int) -> ReservationIdMapper:
-    with SessionLocal() as db:
-        ReservationIdMapper = reservation_id_mapper_by_service[service]
-        return db.query(ReservationIdMapper).filter(
-            ReservationIdMapper.external_id == external_reservation_id).first()
+RESERVATION_RECORD_COLUMNS = ("internal_id", "external_id", "reservation_status")
+
+
+def get_reservation_by_external_id(service: Service, external_reservation_id: int) -> ReservationRecord:
+    with _session() as db:
+        row = _fetch_one(db, reservation_id_mapper_by_service[service].__table__, RESERVATION_RECORD_COLUMNS,
+                         "external_id", external_reservation_id)
+        return None if row is None else ReservationRecord(*row)
 
 
 def create_reservation(service: Service, external_reservation_id: int, reservation_status: str):
-    with SessionLocal() as db:
+    with _session() as db:
         ReservationIdMapper = reservation_id_mapper_by_service[service]
         LOGGER.info("Creating reservation in '%s' with external_id '%s' and status '%s'",
                     ReservationIdMapper, external_reservation_id, reservation_status)
-        mapped_id = ReservationIdMapper(external_id=external_reservation_id,
+        mapped_id = ReservationIdMapper(internal_id=_allocate_ids(db, reservation_id_allocator, 1)[0],
+                                        external_id=external_reservation_id,
                                         reservation_status=ReservationStatus(reservation_status))
         db.add(mapped_id)
-        db.commit()
+        _commit(db)
         db.refresh(mapped_id)
+        _put_cached((service, RESERVATION_INTERNAL_TO_EXTERNAL, mapped_id.internal_id), mapped_id.external_id)
         return mapped_id
 
 
+# reservation_statuses: {external_id: reservation_status}. reservation_details (optional): {external_id: {"begin_datetime",
+# "end_datetime", "property_internal_id", "content_hash"}}, stored along. Creates the missing reservations and updates the
+# existing ones whose status or content changed in a single transaction. Returns {external_id: internal_id}.
+def save_reservations(service: Service, reservation_statuses: dict, reservation_details: dict = None) -> dict:
+    reservation_details = reservation_details or {}
+    with _session() as db:
+        ReservationIdMapper = reservation_id_mapper_by_service[service]
+        internal_ids = {}
+        reservations_to_update = []
+        for chunk in _chunks(list(reservation_statuses)):
+            for internal_id, external_id, status, content_hash in _fetch_all(
+                    db, ReservationIdMapper.__table__, ("internal_id", "external_id", "reservation_status", "content_hash"),
+                    "external_id", chunk):
+                internal_ids[external_id] = internal_id
+                details = reservation_details.get(external_id)
+                if status != (new_status := ReservationStatus(reservation_statuses[external_id])) or \
+                        (details is not None and details["content_hash"] != content_hash):
+                    reservations_to_update.append(
+                        {"internal_id": internal_id, "reservation_status": new_status, **(details or {})})
+        external_ids_to_create = [external_id for external_id in reservation_statuses if external_id not in internal_ids]
+        LOGGER.info("Saving reservations in '%s': %s new, %s changed",
+                    ReservationIdMapper, len(external_ids_to_create), len(reservations_to_update))
+        if external_ids_to_create:
+            # ids are reserved before any write is issued in this session
+            new_internal_ids = _allocate_ids(db, reservation_id_allocator, len(external_ids_to_create))
+            internal_ids.update(zip(external_ids_to_create, new_internal_ids))
+            # render_nulls: the ORM would otherwise split the batch wherever the columns left None change
+            db.execute(insert(ReservationIdMapper).execution_options(render_nulls=True), [
+                {
+                    "internal_id": internal_ids[external_id],
+                    "external_id": external_id,
+                    "reservation_status": ReservationStatus(reservation_statuses[external_id]),
+                    **reservation_details.get(external_id, {}),
+                }
+                for external_id in external_ids_to_create
+            ])
+        if reservations_to_update:
+            db.execute(update(ReservationIdMapper), reservations_to_update)
+        _commit(db)
+    for external_id, internal_id in internal_ids.items():
+        _put_cached((service, RESERVATION_INTERNAL_TO_EXTERNAL, internal_id), external_id)
+    return internal_ids
+
+
+# returns {external_id: (reservation_status, content_hash)} for the mapped reservations only, without loading the records
+def get_reservation_states(service: Service, external_reservation_ids) -> dict:
+    states = {}
+    with _session() as db:
+        table = reservation_id_mapper_by_service[service].__table__
+        for chunk in _chunks(list(dict.fromkeys(external_reservation_ids))):
+            for external_id, status, content_hash in _fetch_all(
+                    db, table, ("external_id", "reservation_status", "content_hash"), "external_id", chunk):
+                states[external_id] = (status, content_hash)
+    return states
+
+
+# returns {external_id: reservation_status} of the user's upcoming reservations handled by the last sync
+def get_reservation_watermark(service: Service, user_email: str) -> dict:
+    with _session() as db:
+        watermark = db.get(reservation_watermark_by_service[service], user_email)
+        # stored as pairs, JSON object keys would turn the external ids into strings
+        return {} if watermark is None else {external_id: status for external_id, status in watermark.reservation_statuses}
+
+
+def save_reservation_watermark(service: Service, user_email: str, reservation_statuses: dict):
+    pairs = [[external_id, status] for external_id, status in reservation_statuses.items()]
+    with _session() as db:
+        ReservationWatermark = reservation_watermark_by_service[service]
+        watermark = db.get(ReservationWatermark, user_email)
+        if watermark is None:
+            db.add(ReservationWatermark(user_email=user_email, reservation_statuses=pairs))
+        elif watermark.reservation_statuses != pairs:
+            watermark.reservation_statuses = pairs
+        else:
+            return
+        _commit(db)
+
+
 def update_reservation(service: Service, reservation_to_update_internal_id: int, reservation_status: str):
-    with SessionLocal() as db:
+    with _session() as db:
         ReservationIdMapper = reservation_id_mapper_by_service[service]
         LOGGER.info("Updating reservation in '%s' with internal_id '%s'. NEW STATUS '%s'",
                     ReservationIdMapper, reservation_to_update_internal_id, reservation_status)
-        reservation_to_update = db.query(ReservationIdMapper).get(reservation_to_update_internal_id)
+        reservation_to_update = db.get(ReservationIdMapper, reservation_to_update_internal_id)
         reservation_to_update.reservation_status = ReservationStatus(reservation_status)
-        db.commit()
+        # no longer the status received with the stored content
+        reservation_to_update.content_hash = None
+        _commit(db)
         db.refresh(reservation_to_update)
+        _put_cached((service, RESERVATION_INTERNAL_TO_EXTERNAL, reservation_to_update.internal_id),
+                     reservation_to_update.external_id)
         return reservation_to_update
 
 
 def get_management_event(service: Service, internal_management_event_id: int):
-    with SessionLocal() as db:
-        ManagementIdMapper = management_id_mapper_by_service[service]
-        return db.query(ManagementIdMapper).get(internal_management_event_id)
+    cached = _get_cached((service, MANAGEMENT_EVENT_BY_INTERNAL, internal_management_event_id))
+    if cached is not MISSING:
+        return cached
+    with _session() as db:
+        row = _fetch_one(db, management_id_mapper_by_service[service].__table__, ("internal_id", "external_id"),
+                         "internal_id", internal_management_event_id)
+        if row is None:
+            return None
+        management_event = IdRecord(*row)
+        _put_cached((service, MANAGEMENT_EVENT_BY_INTERNAL, internal_management_event_id), management_event)
+        return management_event
+
+
+# returns {internal_id: management event record} for the mapped events only
+def get_management_events(service: Service, internal_management_event_ids) -> dict:
+    management_events = {}
+    ids_to_query = []
+    for internal_id in dict.fromkeys(internal_management_event_ids):
+        cached = _get_cached((service, MANAGEMENT_EVENT_BY_INTERNAL, internal_id))
+        if cached is MISSING:
+            ids_to_query.append(internal_id)
+        else:
+            management_events[internal_id] = cached
+    if not ids_to_query:
+        return management_events
+    with _session() as db:
+        table = management_id_mapper_by_service[service].__table__
+        for chunk in _chunks(ids_to_query):
+            for row in _fetch_all(db, table, ("internal_id", "external_id"), "internal_id", chunk):
+                management_event = management_events[row.internal_id] = IdRecord(*row)
+                _put_cached((service, MANAGEMENT_EVENT_BY_INTERNAL, management_event.internal_id), management_event)
+    return management_events
 
 
 def create_management_event(service: Service, management_event_internal_id: int, management_event_external_id: int):
-    with SessionLocal() as db:
+    with _session() as db:
         ManagementIdMapper = management_id_mapper_by_service[service]
         mapped_id_record = ManagementIdMapper(
             internal_id=management_event_internal_id, external_id=management_event_external_id
@@ -106,16 +617,77 @@ def create_management_event(service: Service, management_event_internal_id: int,
         LOGGER.info("Creating management event in '%s' with external_id '%s' and internal_id '%s'",
                     ManagementIdMapper, management_event_external_id, management_event_internal_id)
         db.add(mapped_id_record)
-        db.commit()
+        _commit(db)
         db.refresh(mapped_id_record)
+        _put_cached((service, MANAGEMENT_EVENT_BY_INTERNAL, mapped_id_record.internal_id),
+                    IdRecord(mapped_id_record.internal_id, mapped_id_record.external_id))
         return mapped_id_record
 
 
 def delete_management_event(service: Service, management_event_internal_id: int):
-    with SessionLocal() as db:
+    with _session() as db:
         ManagementIdMapper = management_id_mapper_by_service[service]
-        event_to_delete = db.query(ManagementIdMapper).get(management_event_internal_id)
+        event_to_delete = db.get(ManagementIdMapper, management_event_internal_id)
         LOGGER.info("Deleting management event in '%s' with internal_id '%s'",
                     ManagementIdMapper, management_event_internal_id)
         db.delete(event_to_delete)
-        db.commit()
+        _bump_generation(db, ManagementIdMapper.__table__)
+        _commit(db)
+        _invalidate_cached((service, MANAGEMENT_EVENT_BY_INTERNAL, management_event_internal_id))
+
+
+# creates the {internal_id: external_id} management event mappings in a single transaction
+def create_management_events(service: Service, external_ids_by_internal_id: dict):
+    if not external_ids_by_internal_id:
+        return
+    with _session() as db:
+        ManagementIdMapper = management_id_mapper_by_service[service]
+        LOGGER.info("Creating %s management events in '%s'", len(external_ids_by_internal_id), ManagementIdMapper)
+        db.execute(insert(ManagementIdMapper), [
+            {"internal_id": internal_id, "external_id": external_id}
+            for internal_id, external_id in external_ids_by_internal_id.items()
+        ])
+        _commit(db)
+    for internal_id, external_id in external_ids_by_internal_id.items():
+        _put_cached((service, MANAGEMENT_EVENT_BY_INTERNAL, internal_id), IdRecord(internal_id, external_id))
+
+
+def delete_management_events(service: Service, management_event_internal_ids):
+    internal_ids = list(dict.fromkeys(management_event_internal_ids))
+    if not internal_ids:
+        return
+    with _session() as db:
+        ManagementIdMapper = management_id_mapper_by_service[service]
+        LOGGER.info("Deleting %s management events in '%s'", len(internal_ids), ManagementIdMapper)
+        for chunk in _chunks(internal_ids):
+            db.execute(delete(ManagementIdMapper).where(ManagementIdMapper.internal_id.in_(chunk)))
+        _bump_generation(db, ManagementIdMapper.__table__)
+        _commit(db)
+    for internal_id in internal_ids:
+        _invalidate_cached((service, MANAGEMENT_EVENT_BY_INTERNAL, internal_id))
+
+
+# returns {field: hash} of the last values pushed to the property, {} when nothing was recorded
+def get_property_snapshot(service: Service, external_property_id: int) -> dict:
+    with _session() as db:
+        snapshot = db.get(property_snapshot_by_service[service], external_property_id)
+        return {} if snapshot is None else dict(snapshot.field_hashes)
+
+
+# merges field_hashes into the property's snapshot: an update only pushes some of the fields
+def save_property_snapshot(service: Service, external_property_id: int, field_hashes: dict):
+    with _session() as db:
+        PropertySnapshot = property_snapshot_by_service[service]
+        snapshot = db.get(PropertySnapshot, external_property_id)
+        if snapshot is None:
+            db.add(PropertySnapshot(external_id=external_property_id, field_hashes=field_hashes))
+        else:
+            snapshot.field_hashes = {**snapshot.field_hashes, **field_hashes}
+        _commit(db)
+
+
+def delete_property_snapshot(service: Service, external_property_id: int):
+    with _session() as db:
+        PropertySnapshot = property_snapshot_by_service[service]
+        db.execute(delete(PropertySnapshot).where(PropertySnapshot.external_id == external_property_id))
+        _commit(db)
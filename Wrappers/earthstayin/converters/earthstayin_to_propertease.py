@@ -1,10 +1,8 @@
 import logging
 
 from ProjectUtils.MessagingService.schemas import Service
-from Wrappers.base_wrapper.utils import invert_map
+from Wrappers.base_wrapper.utils import content_hash, invert_map
 from Wrappers.earthstayin.converters.propertease_to_earthstayin import ProperteaseToEarthstayin
-from Wrappers.models import ReservationIdMapper, ReservationStatus
-from Wrappers.crud import get_property_internal_id, set_property_internal_id, create_reservation, update_reservation
 
 LOGGER = logging.getLogger(__name__)
 LOGGER.setLevel(logging.INFO)
@@ -17,11 +15,10 @@ class EarthstayinToPropertease:
     amenities_map = invert_map(ProperteaseToEarthstayin.amenities_map)
 
     @staticmethod
-    def convert_property(earthstayin_property):
+    def convert_property(earthstayin_property, internal_id: int):
         LOGGER.debug("INPUT CONVERTING PROPERTY - Earthstayin property: %s", earthstayin_property)
         propertease_property = {}
-        propertease_property["_id"] = set_property_internal_id(EarthstayinToPropertease.service,
-                                                               earthstayin_property.get("id"))
+        propertease_property["_id"] = internal_id
         propertease_property["user_email"] = earthstayin_property.get("user_email")
         propertease_property["title"] = earthstayin_property.get("name")
         propertease_property["address"] = earthstayin_property.get("address")
@@ -111,21 +108,12 @@ class EarthstayinToPropertease:
         }
 
     @staticmethod
-    def convert_reservation(earthstayin_reservation, owner_email: str, reservation: ReservationIdMapper = None):
-        LOGGER.debug("INPUT CONVERTING RESERVATIONS - Earthstayin reservation: %s", earthstayin_reservation)
-        reservation_status = earthstayin_reservation.get("reservation_status")
-        if reservation is not None:
-            reservation_id = reservation.internal_id
-            LOGGER.info("Existing reservation with status '%s' detected. New reservation status: '%s'", 
-                        reservation.reservation_status, reservation_status)
-            update_reservation(EarthstayinToPropertease.service, reservation_id, reservation_status)
-        else:
-            reservation_id = create_reservation(EarthstayinToPropertease.service, earthstayin_reservation.get("id"), reservation_status).internal_id
-
+    def map_reservation(earthstayin_reservation, owner_email: str, reservation_id: int, property_id: int):
+        # field mapping only, the ids are resolved by the caller
         propertease_reservation = {
             "_id": reservation_id,
-            "reservation_status": reservation_status,
-            "property_id": get_property_internal_id(EarthstayinToPropertease.service, earthstayin_reservation.get("property_id")),
+            "reservation_status": earthstayin_reservation.get("reservation_status"),
+            "property_id": property_id,
             "owner_email": owner_email,
             "begin_datetime": earthstayin_reservation.get("arrival"),
             "end_datetime": earthstayin_reservation.get("departure"),
@@ -136,3 +124,32 @@ class EarthstayinToPropertease:
         }
         LOGGER.debug("OUTPUT CONVERTING RESERVATION - PropertEase reservation: %s", propertease_reservation)
         return propertease_reservation
+
+    # Batch converters, without any database access: the ids are resolved in bulk beforehand, so they can run
+    # on big lists or in another process (see base_wrapper.conversion.convert_batch)
+    @staticmethod
+    def convert_properties(earthstayin_properties: list, internal_ids: dict) -> list:
+        # internal_ids: {external_id: internal_id} of every property (crud.set_property_internal_ids)
+        return [EarthstayinToPropertease.convert_property(p, internal_ids[p.get("id")]) for p in earthstayin_properties]
+
+    @staticmethod
+    def convert_reservations(earthstayin_reservations: list, owner_email: str, reservation_ids: dict, property_ids: dict) -> list:
+        # reservation_ids: {external_id: internal_id} of every reservation (crud.save_reservations),
+        # property_ids: {external_id: internal_id} of the mapped properties (crud.get_property_internal_ids)
+        return [
+            EarthstayinToPropertease.map_reservation(r, owner_email, reservation_ids[r.get("id")], property_ids.get(r.get("property_id")))
+            for r in earthstayin_reservations
+        ]
+
+    @staticmethod
+    def reservation_details(earthstayin_reservations: list, property_ids: dict) -> dict:
+        # {external_id: details stored with the reservation (crud.save_reservations)}
+        return {
+            r.get("id"): {
+                "begin_datetime": r.get("arrival"),
+                "end_datetime": r.get("departure"),
+                "property_internal_id": property_ids.get(r.get("property_id")),
+                "content_hash": content_hash(r),
+            }
+            for r in earthstayin_reservations
+        }
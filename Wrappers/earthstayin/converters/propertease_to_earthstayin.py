@@ -1,7 +1,6 @@
 import logging
 
 from ProjectUtils.MessagingService.schemas import Service
-from Wrappers.crud import get_property_external_id
 
 LOGGER = logging.getLogger(__name__)
 LOGGER.setLevel(logging.INFO)
@@ -21,40 +20,56 @@ class ProperteaseToEarthstayin:
         "parking_space": "car_parking",
     }
     commission = 0.05
+    # earthstayin field -> PropertEase field, for the fields copied as they are
+    fields_map = {
+        "user_email": "user_email",
+        "name": "title",
+        "address": "address",
+        "city": "location",
+        "description": "description",
+        "number_of_guests": "number_guests",
+        "square_meters": "square_meters",
+    }
 
     @staticmethod
-    def convert_property(propertease_property):
+    def convert_property(propertease_property, patch: bool = False):
+        # patch: convert only the fields present in propertease_property, for a partial update
         LOGGER.debug("INPUT CONVERTING PROPERTY - PropertEase property: %s", propertease_property)
+
+        def converts(propertease_field):
+            return not patch or propertease_field in propertease_property
+
         earthstayin_property = dict()
-        property_id = earthstayin_property.get("_id")
-        earthstayin_property["id"] = None if property_id is None else get_property_external_id(ProperteaseToEarthstayin.service,
-                                                                                               property_id)
-        earthstayin_property["user_email"] = propertease_property.get("user_email")
-        earthstayin_property["name"] = propertease_property.get("title")
-        earthstayin_property["address"] = propertease_property.get("address")
-        earthstayin_property["city"] = propertease_property.get("location")
-        earthstayin_property["description"] = propertease_property.get("description")
-        earthstayin_property["curr_price"] = ProperteaseToEarthstayin.convert_price(
-            propertease_price=propertease_property.get("price"),
-            after_commission=propertease_property.get("after_commission")
-        )
-        earthstayin_property["number_of_guests"] = propertease_property.get("number_guests")
-        earthstayin_property["square_meters"] = propertease_property.get("square_meters")
-        earthstayin_property["bedrooms"] = None \
-            if (propertease_bedrooms := propertease_property.get("bedrooms")) is None \
-            else ProperteaseToEarthstayin.convert_bedrooms(propertease_bedrooms)
-        earthstayin_property["bathrooms"] = None \
-            if (propertease_bathrooms := propertease_property.get("bathrooms")) is None \
-            else ProperteaseToEarthstayin.convert_bathrooms(propertease_bathrooms)
-        earthstayin_property["available_amenities"] = None \
-            if (propertease_amenities := propertease_property.get("amenities")) is None \
-            else ProperteaseToEarthstayin.convert_amenities(propertease_amenities)
-        earthstayin_property["house_rules"] = None \
-            if (propertease_house_rules := propertease_property.get("house_rules")) is None \
-            else ProperteaseToEarthstayin.convert_house_rules(propertease_house_rules)
-        earthstayin_property["additional_info"], earthstayin_property["accessibilities"] = (None, None) \
-            if (propertease_additional_info := propertease_property.get("additional_info")) is None \
-            else ProperteaseToEarthstayin.convert_additional_info(propertease_additional_info)
+        if not patch:
+            earthstayin_property["id"] = None
+        for earthstayin_field, propertease_field in ProperteaseToEarthstayin.fields_map.items():
+            if converts(propertease_field):
+                earthstayin_property[earthstayin_field] = propertease_property.get(propertease_field)
+        if converts("price"):
+            earthstayin_property["curr_price"] = ProperteaseToEarthstayin.convert_price(
+                propertease_price=propertease_property.get("price"),
+                after_commission=propertease_property.get("after_commission")
+            )
+        if converts("bedrooms"):
+            earthstayin_property["bedrooms"] = None \
+                if (propertease_bedrooms := propertease_property.get("bedrooms")) is None \
+                else ProperteaseToEarthstayin.convert_bedrooms(propertease_bedrooms)
+        if converts("bathrooms"):
+            earthstayin_property["bathrooms"] = None \
+                if (propertease_bathrooms := propertease_property.get("bathrooms")) is None \
+                else ProperteaseToEarthstayin.convert_bathrooms(propertease_bathrooms)
+        if converts("amenities"):
+            earthstayin_property["available_amenities"] = None \
+                if (propertease_amenities := propertease_property.get("amenities")) is None \
+                else ProperteaseToEarthstayin.convert_amenities(propertease_amenities)
+        if converts("house_rules"):
+            earthstayin_property["house_rules"] = None \
+                if (propertease_house_rules := propertease_property.get("house_rules")) is None \
+                else ProperteaseToEarthstayin.convert_house_rules(propertease_house_rules)
+        if converts("additional_info"):
+            earthstayin_property["additional_info"], earthstayin_property["accessibilities"] = (None, None) \
+                if (propertease_additional_info := propertease_property.get("additional_info")) is None \
+                else ProperteaseToEarthstayin.convert_additional_info(propertease_additional_info)
         # the following elements are not supported in earthstayin -> no need to convert:
         # - cancellation_policy
         # - contacts
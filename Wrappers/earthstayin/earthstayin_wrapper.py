@@ -1,10 +1,11 @@
 from datetime import datetime
 
-import requests
 import logging
 
 from .converters.earthstayin_to_propertease import EarthstayinToPropertease
 from .converters.propertease_to_earthstayin import ProperteaseToEarthstayin
+from ..base_wrapper.conversion import convert_batch
+from ..base_wrapper.streaming import chunked, iter_json_array
 from ..base_wrapper.wrapper import BaseWrapper
 from ProjectUtils.MessagingService.queue_definitions import (
     channel,
@@ -12,7 +13,7 @@ from ProjectUtils.MessagingService.queue_definitions import (
     WRAPPER_EARTHSTAYIN_ROUTING_KEY, WRAPPER_BROADCAST_ROUTING_KEY,
 )
 from ..models import Service, ReservationStatus
-from .. import crud
+from .. import config, crud
 
 
 LOGGER = logging.getLogger(__name__)
@@ -41,7 +42,7 @@ class EarthStayinWrapper(BaseWrapper):
     def create_property(self, property):
         url = self.url + "properties"
         LOGGER.info("Creating property in Earthstayin external API: %s", property)
-        requests.post(url=url, json=property)
+        self.session.post(url=url, json=property)
 
     def update_property(self, prop_internal_id: int, prop_update_parameters: dict):
         external_id = crud.get_property_external_id(self.service_schema, prop_internal_id)
@@ -50,13 +51,14 @@ class EarthStayinWrapper(BaseWrapper):
             return
         url = self.url + f"properties/{external_id}"
         LOGGER.info("Updating property in Earthstayin external API. Internal_id - '%s'; External_id - '%s'. Update parameters: %s", prop_internal_id, external_id, prop_update_parameters)
-        requests.put(url=url, json=ProperteaseToEarthstayin.convert_property(prop_update_parameters))
+        return self.put_property_update(url, external_id, ProperteaseToEarthstayin.convert_property(prop_update_parameters, patch=True))
 
     def delete_property(self, property):
         _id = property.get("id")
         LOGGER.info("Deleting property in Earthstayin external API: %s", property)
         url = self.url + f"properties/{_id}"
-        requests.delete(url=url)
+        self.session.delete(url=url)
+        crud.delete_property_snapshot(self.service_schema, _id)
 
     def create_management_event(self, property_internal_id: int, event_internal_id: int, begin_datetime: str,
                                 end_datetime: str):
@@ -74,7 +76,7 @@ class EarthStayinWrapper(BaseWrapper):
             "end_datetime": end_datetime
         }
         LOGGER.info("POST request call (create management event) in Earthstayin API at '%s' with body: %s", url, body)
-        response = requests.post(url=url, json=body)
+        response = self.session.post(url=url, json=body)
         if response.status_code == 200:
             LOGGER.info("Successfully created management event with internal_id '%s'", event_internal_id)
             crud.create_management_event(self.service_schema, event_internal_id, response.json()["id"])
@@ -96,7 +98,7 @@ class EarthStayinWrapper(BaseWrapper):
         event_external_id = event.external_id
         url = self.url + f"properties/closedtimeframes/{event_external_id}"
         LOGGER.info("PUT request call (to update management event) in Earthstayin API at '%s'...", url)
-        response = requests.put(url=url, json={
+        response = self.session.put(url=url, json={
             "begin_datetime": begin_datetime,
             "end_datetime": end_datetime
         })
@@ -120,7 +122,7 @@ class EarthStayinWrapper(BaseWrapper):
         url = self.url + f"properties/closedtimeframes/{event_external_id}"
         LOGGER.info("DELETE request call in Earthstayin API at '%s'... Deleting event_external_id '%s'", 
                     url, event_external_id)
-        response = requests.delete(url=url)
+        response = self.session.delete(url=url)
         if response.status_code == 204:
             LOGGER.info("Successfully deleted management event with internal_id '%s'", event_internal_id)
             crud.delete_management_event(self.service_schema, event_internal_id)
@@ -132,10 +134,9 @@ class EarthStayinWrapper(BaseWrapper):
         url = self.url + "properties?email=" + email
         LOGGER.info("Importing Earthstayin reservations for user '%s'", email)
         LOGGER.info("GET request call in Earthstayin API at '%s'..", url)
-        earthstayin_properties = requests.get(url=url).json()
-        converted_properties = [
-            EarthstayinToPropertease.convert_property(p) for p in earthstayin_properties
-        ]
+        earthstayin_properties = self.session.get(url=url, cache=True).json()
+        internal_ids = crud.set_property_internal_ids(self.service_schema, [p.get("id") for p in earthstayin_properties])
+        converted_properties = convert_batch(EarthstayinToPropertease.convert_properties, earthstayin_properties, internal_ids)
         return converted_properties
 
     def import_reservations(self, user):
@@ -143,26 +144,61 @@ class EarthStayinWrapper(BaseWrapper):
         url = self.url + "reservations?email=" + email
         LOGGER.info("Importing Earthstayin reservations for user '%s'", email)
         LOGGER.info("GET request call in Earthstayin API at '%s'..", url)
-        earthsayin_reservations = requests.get(url=url).json()
-        converted_properties = [
-            EarthstayinToPropertease.convert_reservation(r, email) for r in earthsayin_reservations
-        ]
+        earthsayin_reservations = self.session.get(url=url).json()
+        property_ids = crud.get_property_internal_ids(self.service_schema, [r.get("property_id") for r in earthsayin_reservations])
+        reservation_ids = crud.save_reservations(self.service_schema,
+                                                 {r.get("id"): r.get("reservation_status") for r in earthsayin_reservations},
+                                                 EarthstayinToPropertease.reservation_details(earthsayin_reservations, property_ids))
+        converted_properties = convert_batch(EarthstayinToPropertease.convert_reservations, earthsayin_reservations, email, reservation_ids, property_ids)
         return converted_properties
 
+    def stream_reservations(self, user):
+        email = user.get("email")
+        url = self.url + "reservations?email=" + email
+        LOGGER.info("Streaming Earthstayin reservations for user '%s'", email)
+        LOGGER.info("GET request call in Earthstayin API at '%s'..", url)
+        with self.session.get(url=url, stream=True) as response:
+            if response.status_code != 200:
+                LOGGER.error("Importing reservations failed with status code %s. Response: %s", response.status_code, response.content)
+                return
+            for earthsayin_reservations in chunked(iter_json_array(response), config.RESERVATION_IMPORT_CHUNK_SIZE):
+                property_ids = crud.get_property_internal_ids(self.service_schema, [r.get("property_id") for r in earthsayin_reservations])
+                reservation_ids = crud.save_reservations(self.service_schema,
+                                                         {r.get("id"): r.get("reservation_status") for r in earthsayin_reservations},
+                                                         EarthstayinToPropertease.reservation_details(earthsayin_reservations, property_ids))
+                yield from convert_batch(EarthstayinToPropertease.convert_reservations, earthsayin_reservations, email, reservation_ids, property_ids)
+
     def import_new_or_newly_canceled_reservations(self, user):
         email = user.get("email")
         url = f"{self.url}reservations/upcoming?email={email}"
         LOGGER.info("Importing Earthstayin NEW or NEWLY CANCELLED reservations for user '%s'", email)
         LOGGER.info("GET request call in Earthstayin API at '%s'...", url)
-        earthsayin_reservations = requests.get(url=url).json()
-        converted_reservations = [
-            EarthstayinToPropertease.convert_reservation(r, email, reservation)
-            for r in earthsayin_reservations
-            if crud.get_property_internal_id(self.service_schema, r["property_id"]) is not None and
-               ((reservation := crud.get_reservation_by_external_id(self.service_schema, r["id"])) is None or
-                (r[
-                     "reservation_status"] == "canceled" and reservation.reservation_status != ReservationStatus.CANCELED))
+        earthsayin_reservations = self.session.get(url=url).json()
+        watermark = crud.get_reservation_watermark(self.service_schema, email)
+        # reservations with the status they had in the last sync were already handled then
+        changed_reservations = [r for r in earthsayin_reservations if watermark.get(r["id"]) != r["reservation_status"]]
+        LOGGER.info("%s of %s upcoming reservations changed since the last sync", len(changed_reservations), len(earthsayin_reservations))
+        mapped_property_ids = crud.get_property_internal_ids(self.service_schema, [r["property_id"] for r in changed_reservations])
+        reservation_states = crud.get_reservation_states(self.service_schema, [r["id"] for r in changed_reservations])
+        reservation_details = EarthstayinToPropertease.reservation_details(changed_reservations, mapped_property_ids)
+        new_or_newly_canceled_reservations = [
+            r for r in changed_reservations
+            if r["property_id"] in mapped_property_ids and
+               ((state := reservation_states.get(r["id"])) is None or
+                # same content as when it was saved -> nothing new
+                (state[1] != reservation_details[r["id"]]["content_hash"] and
+                 r["reservation_status"] == "canceled" and state[0] != ReservationStatus.CANCELED))
         ]
+        reservation_ids = crud.save_reservations(self.service_schema, {
+            r["id"]: r["reservation_status"] for r in new_or_newly_canceled_reservations
+        }, reservation_details)
+        # reservations of unmapped properties are checked again until their property gets mapped
+        crud.save_reservation_watermark(self.service_schema, email, {
+            r["id"]: r["reservation_status"] for r in earthsayin_reservations
+            if watermark.get(r["id"]) == r["reservation_status"] or r["property_id"] in mapped_property_ids
+        })
+        converted_reservations = convert_batch(EarthstayinToPropertease.convert_reservations, new_or_newly_canceled_reservations, email,
+                                               reservation_ids, mapped_property_ids)
         return converted_reservations
 
     def confirm_reservation(self, reservation_internal_id: int, property_internal_id: int, begin_datetime: str,
@@ -173,7 +209,7 @@ class EarthStayinWrapper(BaseWrapper):
             LOGGER.info("Confirming Earthstayin reservation with: internal_id - '%s'; external_id '%s'", reservation_internal_id, _id)
             url = self.url + f"reservations/{_id}"
             LOGGER.info("PUT request call in Earthstayin API to confirm reservation at '%s'...", url)
-            response = requests.put(url=url, json={"reservation_status": "confirmed"})
+            response = self.session.put(url=url, json={"reservation_status": "confirmed"})
             if response.status_code == 200:
                 crud.update_reservation(self.service_schema, reservation_internal_id,
                                         response.json()["reservation_status"])
@@ -190,7 +226,7 @@ class EarthStayinWrapper(BaseWrapper):
             LOGGER.info("Cancelling Earthstayin OVERLAPPING reservation with: internal_id - '%s'; external_id '%s'", reservation_internal_id, _id)
             url = self.url + f"reservations/{_id}"
             LOGGER.info("PUT request call in Earthstayin API at '%s'...", url)
-            response = requests.put(url=url, json={"reservation_status": "canceled"})
+            response = self.session.put(url=url, json={"reservation_status": "canceled"})
             if response.status_code == 200:
                 crud.update_reservation(self.service_schema, reservation_internal_id, response.json()["reservation_status"])
             else:
@@ -205,7 +241,7 @@ class EarthStayinWrapper(BaseWrapper):
             LOGGER.info("Cancelling Earthstayin reservation with: internal_id - '%s'; external_id '%s'", reservation_internal_id, _id)
             url = self.url + f"reservations/{_id}"
             LOGGER.info("PUT request call in Earthstayin API at '%s'...", url)
-            response = requests.put(url=url, json={"reservation_status": "canceled"})
+            response = self.session.put(url=url, json={"reservation_status": "canceled"})
             if response.status_code == 200:
                 crud.update_reservation(self.service_schema, reservation_internal_id, response.json()["reservation_status"])
             else:
@@ -219,15 +255,14 @@ class EarthStayinWrapper(BaseWrapper):
         LOGGER.info("Importing Earthstayin NEW properties for user '%s'", email)
         url = f"{self.url}properties?email={email}"
         LOGGER.info("GET request call in Earthstayin API at '%s'...", url)
-        response = requests.get(url=url)
+        response = self.session.get(url=url, cache=True)
         if response.status_code == 200:
             earthstayin_properties = response.json()
+            mapped_property_ids = crud.get_property_internal_ids(self.service_schema, [prop.get("id") for prop in earthstayin_properties])
             # import properties that don't exist -> not mapped in our database
-            converted_properties = [
-                EarthstayinToPropertease.convert_property(prop)
-                for prop in earthstayin_properties
-                if (crud.get_property_internal_id(self.service_schema, prop.get("id")) is None)
-            ]
+            new_properties = [prop for prop in earthstayin_properties if prop.get("id") not in mapped_property_ids]
+            internal_ids = crud.set_property_internal_ids(self.service_schema, [prop.get("id") for prop in new_properties])
+            converted_properties = convert_batch(EarthstayinToPropertease.convert_properties, new_properties, internal_ids)
             return converted_properties
         LOGGER.error("Importing new properties failed with status code %s. Response: %s", response.status_code, response.content)
         return []
@@ -0,0 +1,52 @@
+import threading
+from collections import OrderedDict
+
+# Lookup directions (second element of every cache key)
+PROPERTY_INTERNAL_TO_EXTERNAL = "property_internal_to_external"
+PROPERTY_EXTERNAL_TO_INTERNAL = "property_external_to_internal"
+RESERVATION_INTERNAL_TO_EXTERNAL = "reservation_internal_to_external"
+MANAGEMENT_EVENT_BY_INTERNAL = "management_event_by_internal"
+
+MISSING = object()
+
+
+class LRUCache:
+    """Thread-safe bounded LRU map that keeps hit/miss counters."""
+
+    def __init__(self, max_size: int) -> None:
+        self.max_size = max_size
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            value = self._entries.get(key, MISSING)
+            if value is MISSING:
+                self.misses += 1
+            else:
+                self.hits += 1
+                self._entries.move_to_end(key)
+            return value
+
+    def put(self, key, value) -> None:
+        if self.max_size <= 0:
+            return
+        with self._lock:
+            self._entries[key] = value
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, key) -> None:
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {"size": len(self._entries), "max_size": self.max_size, "hits": self.hits, "misses": self.misses}
@@ -0,0 +1,116 @@
+import threading
+from array import array
+from bisect import bisect_left
+
+_DELETED = object()
+
+
+def as_int(value):
+    # ids coming from messages (e.g. JSON object keys) may be strings
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return None
+
+
+class IdIndex:
+    """
+        Bidirectional internal_id <-> external_id index kept in sorted array('q') columns (8 bytes per id),
+        looked up with bisect. Recent writes go to small delta dicts that are merged back into the arrays
+        once they grow, so write-through updates don't shift the whole arrays on every insert.
+    """
+
+    MIN_DELTA_SIZE = 1024
+
+    def __init__(self, pairs=()) -> None:
+        self._lock = threading.Lock()
+        self._load(pairs)
+
+    def _load(self, pairs) -> None:
+        pairs = list(pairs)
+        pairs.sort()
+        self._internal_keys = array("q", (internal_id for internal_id, _ in pairs))
+        self._external_by_internal = array("q", (external_id for _, external_id in pairs))
+        pairs.sort(key=lambda pair: pair[1])
+        self._external_keys = array("q", (external_id for _, external_id in pairs))
+        self._internal_by_external = array("q", (internal_id for internal_id, _ in pairs))
+        self._delta_by_internal = {}
+        self._delta_by_external = {}
+
+    @staticmethod
+    def _search(keys: array, values: array, key: int):
+        position = bisect_left(keys, key)
+        if position < len(keys) and keys[position] == key:
+            return values[position]
+        return None
+
+    def get_external_id(self, internal_id):
+        if (internal_id := as_int(internal_id)) is None:
+            return None
+        with self._lock:
+            external_id = self._delta_by_internal.get(internal_id)
+            if external_id is None:
+                return self._search(self._internal_keys, self._external_by_internal, internal_id)
+            return None if external_id is _DELETED else external_id
+
+    def get_internal_id(self, external_id):
+        if (external_id := as_int(external_id)) is None:
+            return None
+        with self._lock:
+            internal_id = self._delta_by_external.get(external_id)
+            if internal_id is None:
+                return self._search(self._external_keys, self._internal_by_external, external_id)
+            return None if internal_id is _DELETED else internal_id
+
+    def add(self, internal_id, external_id) -> None:
+        internal_id, external_id = as_int(internal_id), as_int(external_id)
+        if internal_id is None or external_id is None:
+            return
+        with self._lock:
+            self._delta_by_internal[internal_id] = external_id
+            self._delta_by_external[external_id] = internal_id
+            self._compact_if_needed()
+
+    def remove_internal(self, internal_id) -> None:
+        if (internal_id := as_int(internal_id)) is None:
+            return
+        with self._lock:
+            self._delta_by_internal[internal_id] = _DELETED
+            self._compact_if_needed()
+
+    def remove_external(self, external_id) -> None:
+        if (external_id := as_int(external_id)) is None:
+            return
+        with self._lock:
+            self._delta_by_external[external_id] = _DELETED
+            self._compact_if_needed()
+
+    def _pairs(self):
+        # current (internal_id, external_id) pairs, base arrays with the deltas applied
+        pairs = {}
+        for internal_id, external_id in zip(self._internal_keys, self._external_by_internal):
+            pairs[internal_id] = external_id
+        for internal_id, external_id in self._delta_by_internal.items():
+            if external_id is _DELETED:
+                pairs.pop(internal_id, None)
+            else:
+                pairs[internal_id] = external_id
+        removed_external_ids = {
+            external_id for external_id, internal_id in self._delta_by_external.items() if internal_id is _DELETED
+        }
+        return [(internal_id, external_id) for internal_id, external_id in pairs.items()
+                if external_id not in removed_external_ids]
+
+    def _compact_if_needed(self) -> None:
+        delta_size = max(len(self._delta_by_internal), len(self._delta_by_external))
+        if delta_size > max(self.MIN_DELTA_SIZE, len(self._internal_keys) // 8):
+            self._load(self._pairs())
+
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self._pairs()) if self._delta_by_internal or self._delta_by_external else len(self._internal_keys)
+
+    def nbytes(self) -> int:
+        with self._lock:
+            columns = (self._internal_keys, self._external_by_internal, self._external_keys, self._internal_by_external)
+            return sum(column.itemsize * len(column) for column in columns)
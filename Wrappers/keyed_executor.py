@@ -0,0 +1,83 @@
+import asyncio
+import threading
+
+from concurrent.futures import Future, ThreadPoolExecutor
+
+
+class KeyedExecutor:
+    """
+        Thread pool of single-threaded lanes: tasks submitted with the same key always run on the same lane,
+        in submission order, while tasks of different keys run in parallel.
+    """
+
+    def __init__(self, lanes: int, thread_name_prefix: str = "") -> None:
+        self._lanes = [
+            ThreadPoolExecutor(max_workers=1, thread_name_prefix=f"{thread_name_prefix}-{lane}")
+            for lane in range(max(1, lanes))
+        ]
+
+    def submit(self, key, fn, *args, **kwargs) -> Future:
+        return self._lanes[hash(str(key)) % len(self._lanes)].submit(fn, *args, **kwargs)
+
+    def submit_exclusive(self, fn, *args, **kwargs) -> Future:
+        # runs fn once every task submitted before it has finished, and holds back every task submitted after it
+        started = [threading.Event() for _ in self._lanes[1:]]
+        done = threading.Event()
+
+        def gate(gate_started: threading.Event) -> None:
+            gate_started.set()
+            done.wait()
+
+        for lane, gate_started in zip(self._lanes[1:], started):
+            lane.submit(gate, gate_started)
+
+        def run():
+            for gate_started in started:
+                gate_started.wait()
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                done.set()
+        return self._lanes[0].submit(run)
+
+    def shutdown(self, wait: bool = True) -> None:
+        for lane in self._lanes:
+            lane.shutdown(wait=wait)
+
+
+class AsyncKeyedLanes:
+    """
+        asyncio counterpart of KeyedExecutor's ordering: coroutines run with the same key run one at a time, in the
+        order run() was called, while those of different keys run concurrently. A coroutine run with the key None
+        runs alone, once everything started before it has finished, and holds back everything started after it.
+    """
+
+    def __init__(self) -> None:
+        self._last_by_key = {}  # key -> done future of the last coroutine run with it
+        self._last_exclusive = None
+        self._pending = set()
+
+    async def run(self, key, coroutine_function, *args, **kwargs):
+        # the coroutine's place is taken before the first await, so the order of the run() calls is kept
+        if key is None:
+            predecessors = list(self._pending)
+        else:
+            predecessors = [future for future in (self._last_by_key.get(key), self._last_exclusive) if future is not None]
+        done = asyncio.get_running_loop().create_future()
+        self._pending.add(done)
+        if key is None:
+            self._last_exclusive = done
+        else:
+            self._last_by_key[key] = done
+        try:
+            if predecessors:
+                # asyncio.wait doesn't cancel the predecessors if this coroutine is cancelled
+                await asyncio.wait(predecessors)
+            return await coroutine_function(*args, **kwargs)
+        finally:
+            done.set_result(None)
+            self._pending.discard(done)
+            if key is None and self._last_exclusive is done:
+                self._last_exclusive = None
+            elif key is not None and self._last_by_key.get(key) is done:
+                del self._last_by_key[key]
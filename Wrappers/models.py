@@ -1,23 +1,52 @@
 import logging
+import threading
 
-from sqlalchemy import Column, Integer, event, text, Enum
-from sqlalchemy import create_engine
+from sqlalchemy import Column, Integer, JSON, String, event, text, Enum, update, select
+from sqlalchemy import create_engine, inspect, make_url
 from sqlalchemy.event import listen
-from sqlalchemy.exc import SQLAlchemyError
+from sqlalchemy.exc import SQLAlchemyError, IntegrityError, OperationalError
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
+from sqlalchemy.schema import CreateIndex
 from enum import Enum as EnumType
 
 from ProjectUtils.MessagingService.schemas import Service
+from Wrappers import config
 
 LOGGER = logging.getLogger(__name__)
 LOGGER.setLevel(logging.INFO)
 
-SQLALCHEMY_DATABASE_URL = "sqlite:///./idMapping.db"
+SQLALCHEMY_DATABASE_URL = config.DATABASE_URL
+IS_SQLITE = make_url(SQLALCHEMY_DATABASE_URL).get_backend_name() == "sqlite"
+
+
+def _engine_options() -> dict:
+    options = {"pool_pre_ping": config.DB_POOL_PRE_PING, "pool_recycle": config.DB_POOL_RECYCLE}
+    if IS_SQLITE:
+        options["connect_args"] = {"check_same_thread": False}
+        if make_url(SQLALCHEMY_DATABASE_URL).database in (None, "", ":memory:"):
+            # in-memory databases use a SingletonThreadPool, which doesn't take the queue pool options
+            return options
+    options.update(pool_size=config.DB_POOL_SIZE, max_overflow=config.DB_MAX_OVERFLOW,
+                   pool_timeout=config.DB_POOL_TIMEOUT)
+    return options
+
+
+engine = create_engine(SQLALCHEMY_DATABASE_URL, **_engine_options())
+
+
+if IS_SQLITE:
+    @event.listens_for(engine, "connect")
+    def set_sqlite_pragmas(dbapi_connection, connection_record):
+        # WAL lets the regular and scheduled handlers read while the other one writes
+        cursor = dbapi_connection.cursor()
+        cursor.execute(f"PRAGMA journal_mode={config.SQLITE_JOURNAL_MODE}")
+        cursor.execute(f"PRAGMA synchronous={config.SQLITE_SYNCHRONOUS}")
+        cursor.execute(f"PRAGMA busy_timeout={config.SQLITE_BUSY_TIMEOUT_MS}")
+        cursor.execute(f"PRAGMA cache_size={config.SQLITE_CACHE_SIZE}")
+        cursor.close()
+
 
-engine = create_engine(
-    SQLALCHEMY_DATABASE_URL, connect_args={"check_same_thread": False}
-)
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
 Base = declarative_base()
@@ -40,20 +69,51 @@ class SequenceId(Base):
 class IdMapper(Base):
     __abstract__ = True
     internal_id = Column(Integer, primary_key=True)
-    external_id = Column(Integer)
+    external_id = Column(Integer, index=True)
 
 
-class PropertyIdMapper(IdMapper): __abstract__ = True
+class PropertyIdMapper(IdMapper):
+    __abstract__ = True
+    external_id = Column(Integer, index=True, unique=True)
 
 
 class ReservationIdMapper(IdMapper):
     __abstract__ = True
+    external_id = Column(Integer, index=True, unique=True)
     reservation_status = Column(Enum(ReservationStatus))
+    # as received from the platform, so syncs can tell locally whether a reservation changed or is over
+    begin_datetime = Column(String)
+    end_datetime = Column(String)
+    property_internal_id = Column(Integer)
+    content_hash = Column(String(16))
 
 
+# closed time frame ids are only unique within a property in Zooking and ClickAndGo -> indexed, not unique
 class ManagementIdMapper(IdMapper): __abstract__ = True
 
 
+# hashes of the last converted values successfully pushed to the platform, by field (see update_property)
+class PropertySnapshot(Base):
+    __abstract__ = True
+    external_id = Column(Integer, primary_key=True)
+    field_hashes = Column(JSON, nullable=False)
+
+
+# [[external_id, reservation_status], ...] of the user's upcoming reservations handled by the last sync
+class ReservationWatermark(Base):
+    __abstract__ = True
+    user_email = Column(String, primary_key=True)
+    reservation_statuses = Column(JSON, nullable=False)
+
+
+# one row per id mapper table, incremented by every write that renumbers or removes its mappings
+# (see crud.revalidate_id_cache)
+class IdMappingGeneration(Base):
+    __tablename__ = "id_mapping_generation"
+    table_name = Column(String, primary_key=True)
+    generation = Column(Integer, nullable=False)
+
+
 # Concrete Classes - SequenceId
 class SequenceIdProperties(SequenceId): __tablename__ = "sequence_id_properties"
 
@@ -91,6 +151,26 @@ class ManagementIdMapperClickAndGo(ManagementIdMapper): __tablename__ = "managem
 class ManagementIdMapperEarthStayin(ManagementIdMapper): __tablename__ = "management_id_mapper_earthstayin"
 
 
+# Concrete Classes - PropertySnapshots
+class PropertySnapshotZooking(PropertySnapshot): __tablename__ = "property_snapshot_zooking"
+
+
+class PropertySnapshotClickAndGo(PropertySnapshot): __tablename__ = "property_snapshot_clickandgo"
+
+
+class PropertySnapshotEarthStayin(PropertySnapshot): __tablename__ = "property_snapshot_earthstayin"
+
+
+# Concrete Classes - ReservationWatermarks
+class ReservationWatermarkZooking(ReservationWatermark): __tablename__ = "reservation_watermark_zooking"
+
+
+class ReservationWatermarkClickAndGo(ReservationWatermark): __tablename__ = "reservation_watermark_clickandgo"
+
+
+class ReservationWatermarkEarthStayin(ReservationWatermark): __tablename__ = "reservation_watermark_earthstayin"
+
+
 # Mappers (service -> corresponding Property or Reservation IdMapper)
 property_id_mapper_by_service = {
     Service.ZOOKING: PropertyIdMapperZooking,
@@ -110,6 +190,18 @@ management_id_mapper_by_service = {
     Service.EARTHSTAYIN: ManagementIdMapperEarthStayin
 }
 
+property_snapshot_by_service = {
+    Service.ZOOKING: PropertySnapshotZooking,
+    Service.CLICKANDGO: PropertySnapshotClickAndGo,
+    Service.EARTHSTAYIN: PropertySnapshotEarthStayin
+}
+
+reservation_watermark_by_service = {
+    Service.ZOOKING: ReservationWatermarkZooking,
+    Service.CLICKANDGO: ReservationWatermarkClickAndGo,
+    Service.EARTHSTAYIN: ReservationWatermarkEarthStayin
+}
+
 
 # Triggers
 @event.listens_for(SequenceIdProperties.__table__, 'after_create')
@@ -118,16 +210,75 @@ def insert_initial_id(target, connection, **kw):
     connection.execute(target.insert().values(auto_incremented=1))
 
 
+@event.listens_for(IdMappingGeneration.__table__, 'after_create')
+def insert_initial_generations(target, connection, **kw):
+    id_mappers = [
+        *property_id_mapper_by_service.values(),
+        *reservation_id_mapper_by_service.values(),
+        *management_id_mapper_by_service.values(),
+    ]
+    connection.execute(target.insert(), [
+        {"table_name": IdMapperService.__tablename__, "generation": 0} for IdMapperService in id_mappers
+    ])
+
+
+class IdBlockAllocator:
+    """
+        Hi/lo allocator for internal ids. Reserves a block of ids from a sequence table in a single short transaction
+        and hands them out from memory. Blocks are disjoint across processes sharing the database, since the UPDATE
+        takes the write lock before the new value is read back.
+    """
+
+    def __init__(self, sequence_table, block_size: int) -> None:
+        self.sequence_table = sequence_table
+        self.block_size = block_size
+        self._next_id = 0
+        self._block_end = 0
+        self._lock = threading.Lock()
+
+    def _reserve_block(self, size: int, connection) -> tuple[int, int]:
+        connection.execute(update(self.sequence_table).values(
+            auto_incremented=self.sequence_table.c.auto_incremented + size))
+        block_end = connection.execute(select(self.sequence_table.c.auto_incremented)).scalar_one()
+        return block_end - size, block_end
+
+    def allocate(self, count: int = 1, connection=None) -> list[int]:
+        if connection is not None:
+            # reserved inside the caller's transaction: exactly the ids needed, rolled back together with the caller
+            return list(range(*self._reserve_block(count, connection)))
+        with self._lock:
+            ids = []
+            while len(ids) < count:
+                if self._next_id >= self._block_end:
+                    # own connection, so the block stays reserved even if the insert that needed it rolls back
+                    with engine.begin() as block_connection:
+                        self._next_id, self._block_end = self._reserve_block(
+                            max(self.block_size, count - len(ids)), block_connection)
+                taken = min(self._block_end - self._next_id, count - len(ids))
+                ids.extend(range(self._next_id, self._next_id + taken))
+                self._next_id += taken
+            return ids
+
+    def next_id(self) -> int:
+        return self.allocate(1)[0]
+
+    def reset(self) -> None:
+        # drops the ids left in the current block (they are never reused)
+        with self._lock:
+            self._next_id = self._block_end = 0
+
+
+property_id_allocator = IdBlockAllocator(SequenceIdProperties.__table__, config.ID_BLOCK_SIZE)
+reservation_id_allocator = IdBlockAllocator(SequenceIdReservations.__table__, config.ID_BLOCK_SIZE)
+
+
 def increment_property_sequence_id_before_insert(mapper, connection, target):
-    session = SessionLocal()
+    if target.internal_id is not None:
+        return
     try:
-        with session.begin():
-            global_counter = session.execute(text("SELECT auto_incremented FROM sequence_id_properties")).scalar()
-            target.internal_id = global_counter
-            session.execute(text("UPDATE sequence_id_properties SET auto_incremented = auto_incremented + 1"))
+        target.internal_id = property_id_allocator.next_id()
     except SQLAlchemyError as e:
         LOGGER.error("Error while incrementing auto_incremented sequence_id for PROPERTIES: '%s'", e._message)
-        session.rollback()
 
 
 for PropertyIdMapper in property_id_mapper_by_service.values():
@@ -135,18 +286,90 @@ for PropertyIdMapper in property_id_mapper_by_service.values():
 
 
 def increment_reservation_sequence_id_before_insert(mapper, connection, target):
-    session = SessionLocal()
+    if target.internal_id is not None:
+        return
     try:
-        with session.begin():
-            global_counter = session.execute(text("SELECT auto_incremented FROM sequence_id_reservations")).scalar()
-            target.internal_id = global_counter
-            session.execute(text("UPDATE sequence_id_reservations SET auto_incremented = auto_incremented + 1"))
+        target.internal_id = reservation_id_allocator.next_id()
     except SQLAlchemyError as e:
         LOGGER.error("Error while incrementing auto_incremented sequence_id for RESERVATIONS: '%s'", e._message)
-        session.rollback()
 
 
 for ReservationIdMapper in reservation_id_mapper_by_service.values():
     listen(ReservationIdMapper, "before_insert", increment_reservation_sequence_id_before_insert)
 
-Base.metadata.create_all(bind=engine)
+def create_tables():
+    try:
+        Base.metadata.create_all(bind=engine)
+    except OperationalError:
+        # created by the other handler process between the existence check and the CREATE TABLE
+        Base.metadata.create_all(bind=engine)
+
+
+create_tables()
+
+
+# Migrations (create_all doesn't touch tables that already exist)
+def _has_column(table_name: str, column_name: str) -> bool:
+    # queried rather than inspected: a query naming a column the connection doesn't know makes SQLite check
+    # whether the schema was changed by another connection
+    try:
+        with engine.connect() as connection:
+            connection.execute(text(f"SELECT {column_name} FROM {table_name} LIMIT 0"))
+    except OperationalError:
+        return False
+    return True
+
+
+def add_missing_reservation_columns():
+    existing_tables = set(inspect(engine).get_table_names())
+    for ReservationIdMapperService in reservation_id_mapper_by_service.values():
+        table = ReservationIdMapperService.__table__
+        if table.name not in existing_tables:
+            continue
+        existing_columns = {column["name"] for column in inspect(engine).get_columns(table.name)}
+        for column in table.columns:
+            if column.name not in existing_columns:
+                LOGGER.info("Adding column '%s' to '%s'", column.name, table.name)
+                try:
+                    with engine.begin() as connection:
+                        connection.execute(text(
+                            f"ALTER TABLE {table.name} ADD COLUMN {column.name} {column.type.compile(dialect=engine.dialect)}"))
+                except OperationalError:
+                    # the regular and scheduled handlers run this at the same time when they start
+                    if not _has_column(table.name, column.name):
+                        raise
+
+
+def _has_index(table_name: str, index_name: str) -> bool:
+    return any(index["name"] == index_name for index in inspect(engine).get_indexes(table_name))
+
+
+def create_missing_external_id_indexes():
+    id_mappers = [
+        *property_id_mapper_by_service.values(),
+        *reservation_id_mapper_by_service.values(),
+        *management_id_mapper_by_service.values(),
+    ]
+    for IdMapperService in id_mappers:
+        for index in IdMapperService.__table__.indexes:
+            try:
+                # IF NOT EXISTS: the regular and scheduled handlers run this at the same time when they start
+                with engine.begin() as connection:
+                    connection.execute(CreateIndex(index, if_not_exists=True))
+            except OperationalError:
+                # e.g. the write lock held by the other process beyond the busy timeout
+                if not _has_index(IdMapperService.__tablename__, index.name):
+                    raise
+            except IntegrityError:
+                if _has_index(IdMapperService.__tablename__, index.name):
+                    # PostgreSQL reports an index created concurrently by the other process this way
+                    continue
+                LOGGER.error("Duplicated external ids in '%s', creating non-unique index '%s' instead.",
+                             IdMapperService.__tablename__, index.name)
+                with engine.begin() as connection:
+                    connection.execute(text(
+                        f"CREATE INDEX IF NOT EXISTS {index.name} ON {IdMapperService.__tablename__} (external_id)"))
+
+
+add_missing_reservation_columns()
+create_missing_external_id_indexes()
@@ -1,7 +1,12 @@
 import logging
-import Wrappers.crud
 
+from abc import ABC, abstractmethod
+from contextlib import nullcontext
+from functools import partial
 from sys import stdout
+
+import requests
+
 from ProjectUtils.MessagingService.queue_definitions import channel, EXCHANGE_NAME, WRAPPER_TO_APP_ROUTING_KEY, \
     WRAPPER_TO_CALENDAR_ROUTING_KEY
 from ProjectUtils.MessagingService.schemas import (
@@ -9,20 +14,26 @@ from ProjectUtils.MessagingService.schemas import (
     MessageType,
     to_json, from_json
 )
+from Wrappers import config, crud
+from Wrappers.async_events_handler import run_async_events_handler
+from Wrappers.base_wrapper.http_session import RETRY_STATUS_CODES
+from Wrappers.base_wrapper.streaming import chunked
 from Wrappers.base_wrapper.wrapper import BaseWrapper
-from Wrappers.crud import set_property_mapped_id, get_management_event, create_management_event
+from Wrappers.crud import set_property_mapped_ids, get_management_event, create_management_event
+from Wrappers.keyed_executor import KeyedExecutor
 
 logging.basicConfig(level=logging.INFO, stream=stdout)
 LOGGER = logging.getLogger(__name__)
 LOGGER.setLevel(logging.INFO)
 
 
-def handle_recv(channel, method, properties, body, wrapper):
-    delivery_tag = method.delivery_tag
-    try:
-        message = from_json(body)
-        LOGGER.info("%s - received message", wrapper.service_schema.name)
-        body = message.body
+def process_message(wrapper: BaseWrapper, message, publish):
+    # publish(routing_key, message) sends a response; it's provided by the engine that consumes the queue
+    body = message.body
+    # id mappings renumbered or removed by the other handler process aren't served from the cache
+    crud.revalidate_id_cache(force=True)
+    # with a message scoped session, all the crud work of this message is committed once, at the end
+    with crud.message_session() if config.MESSAGE_SCOPED_SESSION else nullcontext():
         match message.message_type:
             case MessageType.PROPERTY_UPDATE:
                 LOGGER.info("%s - MessageType: PROPERTY_UPDATE.", wrapper.service_schema.name)
@@ -31,30 +42,36 @@ def handle_recv(channel, method, properties, body, wrapper):
                 LOGGER.info("%s - MessageType: PROPERTY_IMPORT. Body: %s", wrapper.service_schema.name, body)
                 properties = wrapper.import_properties(body)
                 LOGGER.info("%s - Sending PROPERTY_IMPORT_RESPONSE with Properties: %s", wrapper.service_schema.name, properties)
-                channel.basic_publish(exchange=EXCHANGE_NAME, routing_key=WRAPPER_TO_APP_ROUTING_KEY, body=to_json(
-                    MessageFactory.create_import_properties_response_message(wrapper.service_schema, properties)
-                ))
+                publish(WRAPPER_TO_APP_ROUTING_KEY,
+                        MessageFactory.create_import_properties_response_message(wrapper.service_schema, properties))
             case MessageType.RESERVATION_IMPORT_INITIAL_REQUEST:
                 # 1. Update the internal ids of the properties (because of duplicated properties in PropertyService)
                 # 2. Import the reservations with the newly updated internal ids to map those into
                 LOGGER.info("%s - MessageType: RESERVATION_IMPORT_INITIAL_REQUEST - Duplicate properties ID map: %s", wrapper.service_schema.name, body)
                 old_new_id_map = body["old_new_id_map"]
-                new_internal_ids = []
-                for old_internal_id, new_internal_id in old_new_id_map.items():
-                    set_property_mapped_id(wrapper.service_schema, old_internal_id, new_internal_id)
-                    new_internal_ids.append(new_internal_id)
-
-                channel.basic_publish(exchange=EXCHANGE_NAME, routing_key=WRAPPER_TO_CALENDAR_ROUTING_KEY, body=to_json(
-                    MessageFactory.create_reservation_import_request_other_services_confirmed_reservations_message(
-                        wrapper.service_schema, new_internal_ids
-                    )
-                ))
-
-                reservations = wrapper.import_reservations(body)
-                LOGGER.info("%s - Sending RESERVATION_IMPORT response to initial import request. Body: %s", wrapper.service_schema.name, reservations)
-                channel.basic_publish(exchange=EXCHANGE_NAME, routing_key=WRAPPER_TO_CALENDAR_ROUTING_KEY, body=to_json(
-                    MessageFactory.create_import_reservations_response_message(wrapper.service_schema, reservations)
-                ))
+                set_property_mapped_ids(wrapper.service_schema, old_new_id_map)
+                new_internal_ids = list(old_new_id_map.values())
+
+                publish(WRAPPER_TO_CALENDAR_ROUTING_KEY,
+                        MessageFactory.create_reservation_import_request_other_services_confirmed_reservations_message(
+                            wrapper.service_schema, new_internal_ids
+                        ))
+
+                if config.RESERVATION_IMPORT_STREAMING:
+                    reservation_chunks = chunked(wrapper.stream_reservations(body), config.RESERVATION_IMPORT_CHUNK_SIZE,
+                                                 config.RESERVATION_IMPORT_CHUNK_BYTES)
+                else:
+                    reservation_chunks = [wrapper.import_reservations(body)]
+                published = False
+                for reservations in reservation_chunks:
+                    LOGGER.info("%s - Sending RESERVATION_IMPORT response to initial import request. Body: %s", wrapper.service_schema.name, reservations)
+                    publish(WRAPPER_TO_CALENDAR_ROUTING_KEY,
+                            MessageFactory.create_import_reservations_response_message(wrapper.service_schema, reservations))
+                    published = True
+                if not published:
+                    # the calendar still gets an (empty) answer to the initial request
+                    publish(WRAPPER_TO_CALENDAR_ROUTING_KEY,
+                            MessageFactory.create_import_reservations_response_message(wrapper.service_schema, []))
             case MessageType.MANAGEMENT_EVENT_CREATE:
                 LOGGER.info("%s - MessageType: MANAGEMENT_EVENT_CREATE. Body: %s", wrapper.service_schema.name, body)
                 wrapper.create_management_event(
@@ -77,18 +94,247 @@ def handle_recv(channel, method, properties, body, wrapper):
                     body["property_internal_id"],
                     body["event_internal_id"],
                 )
+
+
+def message_key(message):
+    # property the message applies to: messages of one property are processed in order, None -> exclusively
+    match message.message_type:
+        case MessageType.PROPERTY_UPDATE:
+            return message.body.get("internal_id")
+        case MessageType.MANAGEMENT_EVENT_CREATE | MessageType.MANAGEMENT_EVENT_UPDATE | MessageType.MANAGEMENT_EVENT_DELETE:
+            return message.body.get("property_internal_id")
+    return None
+
+
+def handle_recv(channel, method, properties, body, wrapper):
+    delivery_tag = method.delivery_tag
+    try:
+        message = from_json(body)
+        LOGGER.info("%s - received message", wrapper.service_schema.name)
+        process_message(wrapper, message, lambda routing_key, response: channel.basic_publish(
+            exchange=EXCHANGE_NAME, routing_key=routing_key, body=to_json(response)
+        ))
     except Exception as e:
         LOGGER.error(f"Error in handle_recv: {e}")
     finally:
         channel.basic_ack(delivery_tag)
 
 
+class PropertyMessageBuffer(ABC):
+    """
+        Buffers the messages of each property for a short window (or until max_size of them are buffered) and
+        processes them together. The buffered messages are acked once processed successfully and rejected if the
+        platform refused them. Transient failures (connection errors, timeouts, an open circuit breaker, 429 and 5xx
+        answers) put them back in the buffer, processed again after a backoff that doubles with every attempt, until
+        config.BUFFER_RETRY_ATTEMPTS attempts failed. Only used from the connection thread.
+    """
+
+    message_types = ()
+
+    def __init__(self, channel, wrapper: BaseWrapper, window_seconds: float, submit, max_size: int = 0) -> None:
+        # submit(key, task) runs task for the property key, inline or on the property's lane
+        self.channel = channel
+        self.wrapper = wrapper
+        self.window_seconds = window_seconds
+        self.submit = submit
+        self.max_size = max_size
+        self._pending = {}
+
+    def accepts(self, message) -> bool:
+        return message.message_type in self.message_types
+
+    def add(self, key, message, delivery_tag) -> None:
+        pending = self._pending.get(key)
+        if pending is None:
+            pending = self._pending[key] = self._buffer(key, self.window_seconds)
+        pending["messages"].append(message)
+        pending["delivery_tags"].append(delivery_tag)
+        # messages waiting for a retry wait for its backoff, however many they are
+        if not pending["attempts"] and 0 < self.max_size <= len(pending["messages"]):
+            self.flush(key)
+
+    def _buffer(self, key, delay: float, attempts: int = 0) -> dict:
+        return {
+            "messages": [],
+            "delivery_tags": [],
+            "attempts": attempts,
+            "timer": self.channel.connection.call_later(delay, partial(self.flush, key)),
+        }
+
+    def _retry(self, key, messages: list, delivery_tags: list, attempts: int) -> None:
+        # the failed messages go back to the buffer, before those received for the property since they were flushed
+        pending = self._pending.pop(key, None)
+        if pending is not None:
+            self.channel.connection.remove_timeout(pending["timer"])
+        retry = self._pending[key] = self._buffer(key, config.BUFFER_RETRY_BACKOFF_MS / 1000 * 2 ** (attempts - 1), attempts)
+        retry["messages"] = messages + (pending["messages"] if pending is not None else [])
+        retry["delivery_tags"] = delivery_tags + (pending["delivery_tags"] if pending is not None else [])
+
+    def flush(self, key) -> None:
+        pending = self._pending.pop(key, None)
+        if pending is None:
+            return
+        self.channel.connection.remove_timeout(pending["timer"])
+        messages, delivery_tags, attempts = pending["messages"], pending["delivery_tags"], pending["attempts"] + 1
+        threadsafe = self.channel.connection.add_callback_threadsafe
+
+        def run():
+            try:
+                response = self.process(key, messages)
+            except (requests.exceptions.ConnectionError, requests.exceptions.Timeout) as e:
+                # CircuitOpenError included
+                LOGGER.error(f"Error in {type(self).__name__}: {e}")
+                transient = True
+            except Exception as e:
+                LOGGER.error(f"Error in {type(self).__name__}: {e}")
+                transient = False
+            else:
+                if response is None or response.ok:
+                    for delivery_tag in delivery_tags:
+                        threadsafe(partial(self.channel.basic_ack, delivery_tag))
+                    return
+                transient = response.status_code >= 500 or response.status_code in RETRY_STATUS_CODES
+                LOGGER.error("%s - %s of property %s failed with status %s", self.wrapper.service_schema.name,
+                             type(self).__name__, key, response.status_code)
+            if transient and attempts < config.BUFFER_RETRY_ATTEMPTS:
+                LOGGER.info("%s - Retrying the %s messages of property %s (attempt %s failed).", self.wrapper.service_schema.name,
+                            len(messages), key, attempts)
+                threadsafe(partial(self._retry, key, messages, delivery_tags, attempts))
+                return
+            # rejected: dead-lettered if the queue has a dead letter exchange
+            for delivery_tag in delivery_tags:
+                threadsafe(partial(self.channel.basic_nack, delivery_tag, requeue=False))
+
+        self.submit(key, run)
+
+    def flush_all(self) -> None:
+        for key in list(self._pending):
+            self.flush(key)
+
+    @abstractmethod
+    def process(self, key, messages: list):
+        # returns the response of the platform, if any
+        pass
+
+
+class PropertyUpdateCoalescer(PropertyMessageBuffer):
+    # PROPERTY_UPDATE messages of a property become a single update, update_parameters merged (last write wins)
+    message_types = (MessageType.PROPERTY_UPDATE,)
+    # price is converted with the after_commission of its own message: a message with a price replaces both, and
+    # an after_commission without a price (which changes nothing on the platform) leaves a buffered price as sent
+    paired_parameters = ("price", "after_commission")
+
+    def process(self, key, messages: list):
+        update_parameters = {}
+        for message in messages:
+            message_parameters = message.body["update_parameters"]
+            if "price" in message_parameters:
+                for parameter in self.paired_parameters:
+                    update_parameters.pop(parameter, None)
+            elif "price" in update_parameters:
+                message_parameters = {parameter: value for parameter, value in message_parameters.items()
+                                      if parameter not in self.paired_parameters}
+            update_parameters.update(message_parameters)
+        LOGGER.info("%s - Merged %s PROPERTY_UPDATE messages of property %s.", self.wrapper.service_schema.name, len(messages), key)
+        crud.revalidate_id_cache(force=True)
+        with crud.message_session() if config.MESSAGE_SCOPED_SESSION else nullcontext():
+            return self.wrapper.update_property(key, update_parameters)
+
+
+class ManagementEventBatcher(PropertyMessageBuffer):
+    # MANAGEMENT_EVENT_* messages of a property are written with one wrapper.apply_management_event_batch call
+    message_types = (MessageType.MANAGEMENT_EVENT_CREATE, MessageType.MANAGEMENT_EVENT_UPDATE, MessageType.MANAGEMENT_EVENT_DELETE)
+    operation_types = {
+        MessageType.MANAGEMENT_EVENT_CREATE: "create",
+        MessageType.MANAGEMENT_EVENT_UPDATE: "update",
+        MessageType.MANAGEMENT_EVENT_DELETE: "delete",
+    }
+
+    def process(self, key, messages: list):
+        operations = [
+            {"type": self.operation_types[message.message_type], **{
+                field: message.body[field] for field in ("event_internal_id", "begin_datetime", "end_datetime")
+                if field in message.body
+            }}
+            for message in messages
+        ]
+        LOGGER.info("%s - Writing %s management events of property %s.", self.wrapper.service_schema.name, len(operations), key)
+        crud.revalidate_id_cache(force=True)
+        with crud.message_session() if config.MESSAGE_SCOPED_SESSION else nullcontext():
+            self.wrapper.apply_management_event_batch(key, operations)
+
+
+def dispatch_recv(channel, method, properties, body, wrapper, submit, buffers: list = ()):
+    # runs on the connection thread: submit(key, task) runs the message inline or on its property's lane,
+    # publishes and acks go through add_callback_threadsafe since pika channels may only be used from that thread
+    delivery_tag = method.delivery_tag
+    threadsafe = channel.connection.add_callback_threadsafe
+    try:
+        message = from_json(body)
+        LOGGER.info("%s - received message", wrapper.service_schema.name)
+    except Exception as e:
+        LOGGER.error(f"Error in dispatch_recv: {e}")
+        channel.basic_ack(delivery_tag)
+        return
+
+    key = message_key(message)
+    accepting_buffer = None
+    for buffer in buffers:
+        if key is not None and buffer.accepts(message):
+            accepting_buffer = buffer
+        # whatever else is buffered for the property (or, for unkeyed messages, for every property) goes first
+        elif key is None:
+            buffer.flush_all()
+        else:
+            buffer.flush(key)
+    if accepting_buffer is not None:
+        accepting_buffer.add(key, message, delivery_tag)
+        return
+
+    def publish(routing_key, response):
+        threadsafe(partial(channel.basic_publish, exchange=EXCHANGE_NAME, routing_key=routing_key, body=to_json(response)))
+
+    def process():
+        try:
+            process_message(wrapper, message, publish)
+        except Exception as e:
+            LOGGER.error(f"Error in handle_recv: {e}")
+        finally:
+            threadsafe(partial(channel.basic_ack, delivery_tag))
+
+    submit(key, process)
+
+
 def run_regular_events_handler(wrapper: BaseWrapper):
-    channel.basic_consume(
-        queue=wrapper.queue,
-        on_message_callback=lambda ch, method, properties, body: handle_recv(ch, method, properties, body, wrapper)
-    )
+    if config.PRELOAD_ID_INDEX:
+        crud.preload_id_indexes()
+    if config.ENGINE == "async":
+        run_async_events_handler(wrapper, process_message, message_key)
+        return
+    workers = config.REGULAR_HANDLER_WORKERS
+    prefetch = config.REGULAR_HANDLER_PREFETCH or (workers * 4 if workers > 1 else 0)
+    if prefetch > 0:
+        channel.basic_qos(prefetch_count=prefetch)
+    executor = KeyedExecutor(workers, thread_name_prefix=f"{wrapper.service_schema.value}-regular") if workers > 1 else None
+    if executor is not None:
+        submit = lambda key, task: executor.submit_exclusive(task) if key is None else executor.submit(key, task)
+    else:
+        submit = lambda key, task: task()
+    buffers = []
+    if config.PROPERTY_UPDATE_COALESCE_MS > 0:
+        buffers.append(PropertyUpdateCoalescer(channel, wrapper, config.PROPERTY_UPDATE_COALESCE_MS / 1000, submit))
+    if config.MANAGEMENT_EVENT_BATCH_MS > 0:
+        buffers.append(ManagementEventBatcher(channel, wrapper, config.MANAGEMENT_EVENT_BATCH_MS / 1000, submit,
+                                              max_size=config.MANAGEMENT_EVENT_BATCH_MAX_SIZE))
+    if executor is not None or buffers:
+        on_message_callback = lambda ch, method, properties, body: dispatch_recv(ch, method, properties, body, wrapper, submit, buffers)
+    else:
+        on_message_callback = lambda ch, method, properties, body: handle_recv(ch, method, properties, body, wrapper)
+    channel.basic_consume(queue=wrapper.queue, on_message_callback=on_message_callback)
     try:
         channel.start_consuming()
     except KeyboardInterrupt:
         channel.stop_consuming()
+    finally:
+        if executor is not None:
+            executor.shutdown()
@@ -1,5 +1,6 @@
 import logging
 
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from sys import stdout
 from ProjectUtils.MessagingService.queue_definitions import channel, EXCHANGE_NAME, WRAPPER_TO_APP_ROUTING_KEY, \
     WRAPPER_TO_CALENDAR_ROUTING_KEY
@@ -8,6 +9,8 @@ from ProjectUtils.MessagingService.schemas import (
     MessageType,
     to_json, from_json
 )
+from Wrappers import config, crud
+from Wrappers.async_events_handler import run_async_events_handler
 from Wrappers.base_wrapper.wrapper import BaseWrapper
 
 logging.basicConfig(level=logging.INFO, stream=stdout)
@@ -15,50 +18,90 @@ LOGGER = logging.getLogger(__name__)
 LOGGER.setLevel(logging.INFO)
 
 
+# one pool per service, sized by config.scheduled_import_concurrency
+_import_executors = {}
+
+
+def import_for_each_user(wrapper: BaseWrapper, users_with_services: dict, import_function):
+    """
+        Runs import_function for every user of this service on a bounded thread pool and yields
+        (user_email, result) pairs as they complete. Results are yielded to the calling (consumer) thread,
+        so publishing them stays on the thread that processes the message: pika channels are not thread-safe.
+    """
+    executor = _import_executors.get(wrapper.service_schema)
+    if executor is None:
+        executor = _import_executors[wrapper.service_schema] = ThreadPoolExecutor(
+            max_workers=config.scheduled_import_concurrency(wrapper.service_schema.value),
+            thread_name_prefix=f"{wrapper.service_schema.value}-import",
+        )
+    futures = {
+        executor.submit(import_function, {"email": user_email}): user_email
+        for user_email, user_service in users_with_services.items()
+        if wrapper.service_schema.value in user_service
+    }
+    for future in as_completed(futures):
+        user_email = futures[future]
+        try:
+            yield user_email, future.result()
+        except Exception as e:
+            # one failing user doesn't prevent publishing the others
+            LOGGER.error("%s - Import failed for user '%s': %s", wrapper.service_schema.name, user_email, e)
+
+
+def process_message(wrapper: BaseWrapper, message, publish):
+    # publish(routing_key, message) sends a response; it's provided by the engine that consumes the queue
+    body = message.body
+    # id mappings renumbered or removed by the other handler process aren't served from the cache
+    crud.revalidate_id_cache(force=True)
+    match message.message_type:
+        case MessageType.RESERVATION_IMPORT_OVERLAP:
+            LOGGER.info("%s - MessageType: RESERVATION_IMPORT_OVERLAP. Body: %s", wrapper.service_schema.name, body)
+            wrapper.cancel_overlapping_reservation(body["old_reservation_internal_id"])
+        case MessageType.RESERVATION_CANCEL_MESSAGE:
+            LOGGER.info("%s - MessageType: RESERVATION_CANCEL_MESSAGE. Body: %s", wrapper.service_schema.name, body)
+            wrapper.cancel_reservation(body["old_reservation_internal_id"], body["property_internal_id"])
+        case MessageType.RESERVATION_IMPORT_REQUEST:
+            LOGGER.info("%s - MessageType: RESERVATION_IMPORT_REQUEST.", wrapper.service_schema.name)
+            for user_email, reservations in import_for_each_user(
+                    wrapper, body["users_with_services"], wrapper.import_new_or_newly_canceled_reservations):
+                LOGGER.info("%s - Sending RESERVATION_IMPORT response. Reservations: %s", wrapper.service_schema.name, reservations)
+                publish(WRAPPER_TO_CALENDAR_ROUTING_KEY,
+                        MessageFactory.create_import_reservations_response_message(wrapper.service_schema, reservations))
+        case MessageType.RESERVATION_IMPORT_CONFIRM:
+            LOGGER.info("%s - MessageType: RESERVATION_IMPORT_CONFIRM. Body: %s", wrapper.service_schema.name, body)
+            wrapper.confirm_reservation(
+                body["reservation_internal_id"],
+                body["property_internal_id"],
+                body["begin_datetime"],
+                body["end_datetime"],
+            )
+        case MessageType.SCHEDULED_PROPERTY_IMPORT:
+            LOGGER.info("%s - MessageType: SCHEDULED_PROPERTY_IMPORT.", wrapper.service_schema.name)
+            for user_email, properties in import_for_each_user(
+                    wrapper, body["users_with_services"], wrapper.import_new_properties):
+                if len(properties) > 0:
+                    LOGGER.info("%s - Detected new properties. Addresses: %s", wrapper.service_schema.name, [p.get("address") for p in properties])
+                    publish(WRAPPER_TO_APP_ROUTING_KEY,
+                            MessageFactory.create_import_properties_response_message(wrapper.service_schema, properties))
+
+
+def message_key(message):
+    # property the message applies to, for the async engine: messages of one property are processed in order,
+    # None -> exclusively
+    match message.message_type:
+        case MessageType.RESERVATION_IMPORT_CONFIRM | MessageType.RESERVATION_CANCEL_MESSAGE:
+            return message.body.get("property_internal_id")
+    return None
+
+
 def handle_recv(channel, method, properties, body, wrapper:BaseWrapper):
     delivery_tag = method.delivery_tag
     try:
         LOGGER.info("%s - received message", wrapper.service_schema.name)
         message = from_json(body)
-        body = message.body
-        match message.message_type:
-            case MessageType.RESERVATION_IMPORT_OVERLAP:
-                LOGGER.info("%s - MessageType: RESERVATION_IMPORT_OVERLAP. Body: %s", wrapper.service_schema.name, body)
-                wrapper.cancel_overlapping_reservation(body["old_reservation_internal_id"])
-            case MessageType.RESERVATION_CANCEL_MESSAGE:
-                LOGGER.info("%s - MessageType: RESERVATION_CANCEL_MESSAGE. Body: %s", wrapper.service_schema.name, body)
-                wrapper.cancel_reservation(body["old_reservation_internal_id"], body["property_internal_id"])
-            case MessageType.RESERVATION_IMPORT_REQUEST:
-                LOGGER.info("%s - MessageType: RESERVATION_IMPORT_REQUEST.", wrapper.service_schema.name)
-                for user_email, user_service in body["users_with_services"].items():
-                    if wrapper.service_schema.value in user_service:
-                        reservations = wrapper.import_new_or_newly_canceled_reservations({"email": user_email})
-                        LOGGER.info("%s - Sending RESERVATION_IMPORT response. Reservations: %s", wrapper.service_schema.name, reservations)
-                        channel.basic_publish(exchange=EXCHANGE_NAME, routing_key=WRAPPER_TO_CALENDAR_ROUTING_KEY,
-                                              body=to_json(
-                                                  MessageFactory.create_import_reservations_response_message(
-                                                      wrapper.service_schema, reservations)
-                                              ))
-            case MessageType.RESERVATION_IMPORT_CONFIRM:
-                LOGGER.info("%s - MessageType: RESERVATION_IMPORT_CONFIRM. Body: %s", wrapper.service_schema.name, body)
-                wrapper.confirm_reservation(
-                    body["reservation_internal_id"],
-                    body["property_internal_id"],
-                    body["begin_datetime"],
-                    body["end_datetime"],
-                )
-            case MessageType.SCHEDULED_PROPERTY_IMPORT:
-                LOGGER.info("%s - MessageType: SCHEDULED_PROPERTY_IMPORT.", wrapper.service_schema.name)
-                for user_email, user_service in body["users_with_services"].items():
-                    if wrapper.service_schema.value in user_service:
-                        properties = wrapper.import_new_properties({"email": user_email})
-                        if len(properties) > 0:
-                            LOGGER.info("%s - Detected new properties. Addresses: %s", wrapper.service_schema.name, [p.get("address") for p in properties])
-                            channel.basic_publish(exchange=EXCHANGE_NAME, routing_key=WRAPPER_TO_APP_ROUTING_KEY,
-                                                  body=to_json(
-                                                      MessageFactory.create_import_properties_response_message(
-                                                          wrapper.service_schema, properties)
-                                                  ))
+        process_message(wrapper, message, lambda routing_key, response: channel.basic_publish(
+            exchange=EXCHANGE_NAME, routing_key=routing_key, body=to_json(response)
+        ))
     except Exception as e:
         LOGGER.error(f"Error in handle_recv: {e}")
     finally:
@@ -66,6 +109,11 @@ def handle_recv(channel, method, properties, body, wrapper:BaseWrapper):
 
 
 def run_scheduled_events_handler(wrapper: BaseWrapper):
+    if config.PRELOAD_ID_INDEX:
+        crud.preload_id_indexes()
+    if config.ENGINE == "async":
+        run_async_events_handler(wrapper, process_message, message_key)
+        return
     channel.basic_consume(
         queue=wrapper.queue,
         on_message_callback=lambda ch, method, properties, body: handle_recv(ch, method, properties, body, wrapper)
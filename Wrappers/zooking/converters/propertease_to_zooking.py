@@ -1,7 +1,6 @@
 import logging
 
 from ProjectUtils.MessagingService.schemas import Service
-from Wrappers.crud import get_property_external_id
 
 LOGGER = logging.getLogger(__name__)
 LOGGER.setLevel(logging.INFO)
@@ -21,36 +20,50 @@ class ProperteaseToZooking:
         "parking_space": "open_parking",
     }
     commission = 0.03
+    # zooking field -> PropertEase field, for the fields copied as they are
+    fields_map = {
+        "user_email": "user_email",
+        "name": "title",
+        "address": "address",
+        "location": "location",
+        "description": "description",
+        "number_of_guests": "number_guests",
+        "square_meters": "square_meters",
+        "additional_info": "additional_info",
+        "closed_time_frames": "closed_time_frames",
+    }
 
     @staticmethod
-    def convert_property(propertease_property):
+    def convert_property(propertease_property, patch: bool = False):
+        # patch: convert only the fields present in propertease_property, for a partial update
         LOGGER.debug("INPUT CONVERTING PROPERTY - PropertEase property: %s", propertease_property)
+
+        def converts(propertease_field):
+            return not patch or propertease_field in propertease_property
+
         zooking_property = dict()
-        property_id = zooking_property.get("_id")
-        zooking_property["id"] = None if property_id is None else get_property_external_id(ProperteaseToZooking.service,
-                                                                                           property_id)
-        zooking_property["user_email"] = propertease_property.get("user_email")
-        zooking_property["name"] = propertease_property.get("title")
-        zooking_property["address"] = propertease_property.get("address")
-        zooking_property["location"] = propertease_property.get("location")
-        zooking_property["description"] = propertease_property.get("description")
-        zooking_property["curr_price"] = ProperteaseToZooking.convert_price(
-            propertease_price=propertease_property.get("price"),
-            after_commission=propertease_property.get("after_commission")
-        )
-        zooking_property["number_of_guests"] = propertease_property.get("number_guests")
-        zooking_property["square_meters"] = propertease_property.get("square_meters")
-        zooking_property["bedrooms"] = None \
-            if (propertease_bedrooms := propertease_property.get("bedrooms")) is None \
-            else ProperteaseToZooking.convert_bedrooms(propertease_bedrooms)
-        zooking_property["bathrooms"] = None \
-            if (propertease_bathrooms := propertease_property.get("bathrooms")) is None \
-            else ProperteaseToZooking.convert_bathrooms(propertease_bathrooms)
-        zooking_property["amenities"] = None \
-            if (propertease_amenities := propertease_property.get("amenities")) is None \
-            else ProperteaseToZooking.convert_amenities(propertease_amenities)
-        zooking_property["additional_info"] = propertease_property.get("additional_info")
-        zooking_property["closed_time_frames"] = propertease_property.get("closed_time_frames")
+        if not patch:
+            zooking_property["id"] = None
+        for zooking_field, propertease_field in ProperteaseToZooking.fields_map.items():
+            if converts(propertease_field):
+                zooking_property[zooking_field] = propertease_property.get(propertease_field)
+        if converts("price"):
+            zooking_property["curr_price"] = ProperteaseToZooking.convert_price(
+                propertease_price=propertease_property.get("price"),
+                after_commission=propertease_property.get("after_commission")
+            )
+        if converts("bedrooms"):
+            zooking_property["bedrooms"] = None \
+                if (propertease_bedrooms := propertease_property.get("bedrooms")) is None \
+                else ProperteaseToZooking.convert_bedrooms(propertease_bedrooms)
+        if converts("bathrooms"):
+            zooking_property["bathrooms"] = None \
+                if (propertease_bathrooms := propertease_property.get("bathrooms")) is None \
+                else ProperteaseToZooking.convert_bathrooms(propertease_bathrooms)
+        if converts("amenities"):
+            zooking_property["amenities"] = None \
+                if (propertease_amenities := propertease_property.get("amenities")) is None \
+                else ProperteaseToZooking.convert_amenities(propertease_amenities)
         # the following elements are not supported in zooking -> no need to convert:
         # - house rules
         # - cancellation_policy
@@ -1,9 +1,7 @@
 import logging
 
 from ProjectUtils.MessagingService.schemas import Service
-from Wrappers.base_wrapper.utils import invert_map
-from Wrappers.models import ReservationIdMapper, ReservationStatus
-from Wrappers.crud import get_property_internal_id, set_property_internal_id, create_reservation, update_reservation
+from Wrappers.base_wrapper.utils import content_hash, invert_map
 from Wrappers.zooking.converters.propertease_to_zooking import ProperteaseToZooking
 
 LOGGER = logging.getLogger(__name__)
@@ -16,10 +14,10 @@ class ZookingToPropertease:
     amenities_map = invert_map(ProperteaseToZooking.amenities_map)
 
     @staticmethod
-    def convert_property(zooking_property):
+    def convert_property(zooking_property, internal_id: int):
         LOGGER.debug("INPUT CONVERTING PROPERTY - Zooking property: %s", zooking_property)
         propertease_property = dict()
-        propertease_property["_id"] = set_property_internal_id(ZookingToPropertease.service, zooking_property.get("id"))
+        propertease_property["_id"] = internal_id
         propertease_property["user_email"] = zooking_property.get("user_email")
         propertease_property["title"] = zooking_property.get("name")
         propertease_property["address"] = zooking_property.get("address")
@@ -109,21 +107,12 @@ class ZookingToPropertease:
         }
 
     @staticmethod
-    def convert_reservation(zooking_reservation, owner_email: str, reservation: ReservationIdMapper = None):
-        LOGGER.debug("INPUT CONVERTING RESERVATIONS - Zooking reservation: %s", zooking_reservation)
-        reservation_status = zooking_reservation.get("reservation_status")
-        if reservation is not None:
-            reservation_id = reservation.internal_id
-            LOGGER.info("Existing reservation with status '%s' detected. New reservation status: '%s'", 
-                        reservation.reservation_status, reservation_status)
-            update_reservation(ZookingToPropertease.service, reservation_id, reservation_status)
-        else:
-            reservation_id = create_reservation(ZookingToPropertease.service, zooking_reservation.get("id"), reservation_status).internal_id
-
+    def map_reservation(zooking_reservation, owner_email: str, reservation_id: int, property_id: int):
+        # field mapping only, the ids are resolved by the caller
         propertease_reservation = {
             "_id": reservation_id,
-            "reservation_status": reservation_status,
-            "property_id": get_property_internal_id(ZookingToPropertease.service, zooking_reservation.get("property_id")),
+            "reservation_status": zooking_reservation.get("reservation_status"),
+            "property_id": property_id,
             "owner_email": owner_email,
             "begin_datetime": zooking_reservation.get("arrival"),
             "end_datetime": zooking_reservation.get("departure"),
@@ -134,3 +123,32 @@ class ZookingToPropertease:
         }
         LOGGER.debug("OUTPUT CONVERTING RESERVATION - PropertEase reservation: %s", propertease_reservation)
         return propertease_reservation
+
+    # Batch converters, without any database access: the ids are resolved in bulk beforehand, so they can run
+    # on big lists or in another process (see base_wrapper.conversion.convert_batch)
+    @staticmethod
+    def convert_properties(zooking_properties: list, internal_ids: dict) -> list:
+        # internal_ids: {external_id: internal_id} of every property (crud.set_property_internal_ids)
+        return [ZookingToPropertease.convert_property(p, internal_ids[p.get("id")]) for p in zooking_properties]
+
+    @staticmethod
+    def convert_reservations(zooking_reservations: list, owner_email: str, reservation_ids: dict, property_ids: dict) -> list:
+        # reservation_ids: {external_id: internal_id} of every reservation (crud.save_reservations),
+        # property_ids: {external_id: internal_id} of the mapped properties (crud.get_property_internal_ids)
+        return [
+            ZookingToPropertease.map_reservation(r, owner_email, reservation_ids[r.get("id")], property_ids.get(r.get("property_id")))
+            for r in zooking_reservations
+        ]
+
+    @staticmethod
+    def reservation_details(zooking_reservations: list, property_ids: dict) -> dict:
+        # {external_id: details stored with the reservation (crud.save_reservations)}
+        return {
+            r.get("id"): {
+                "begin_datetime": r.get("arrival"),
+                "end_datetime": r.get("departure"),
+                "property_internal_id": property_ids.get(r.get("property_id")),
+                "content_hash": content_hash(r),
+            }
+            for r in zooking_reservations
+        }
@@ -1,17 +1,18 @@
 from datetime import datetime
 
-import requests
 import logging
 
 from Wrappers.zooking.converters.propertease_to_zooking import ProperteaseToZooking
 from Wrappers.zooking.converters.zooking_to_propertease import ZookingToPropertease
+from ..base_wrapper.conversion import convert_batch
+from ..base_wrapper.streaming import chunked, iter_json_array
 from ..base_wrapper.wrapper import BaseWrapper
 from ProjectUtils.MessagingService.queue_definitions import (
     channel,
     EXCHANGE_NAME,
     WRAPPER_ZOOKING_ROUTING_KEY, WRAPPER_BROADCAST_ROUTING_KEY,
 )
-from .. import crud
+from .. import config, crud
 from ..models import Service, ReservationStatus
 
 LOGGER = logging.getLogger(__name__)
@@ -39,7 +40,7 @@ class ZookingWrapper(BaseWrapper):
     def create_property(self, property):
         url = self.url + "properties"
         LOGGER.info("Creating property in Zooking external API: %s", property)
-        requests.post(url=url, json=property)
+        self.session.post(url=url, json=property)
 
     def update_property(self, prop_internal_id: int, prop_update_parameters: dict):
         external_id = crud.get_property_external_id(self.service_schema, prop_internal_id)
@@ -48,107 +49,144 @@ class ZookingWrapper(BaseWrapper):
             return
         url = self.url + f"properties/{external_id}"
         LOGGER.info("Updating property in Zooking external API. Internal_id - '%s'; External_id - '%s'. Update parameters: %s", prop_internal_id, external_id, prop_update_parameters)
-        response = requests.put(url=url, json=ProperteaseToZooking.convert_property(prop_update_parameters))
-        return response
+        return self.put_property_update(url, external_id, ProperteaseToZooking.convert_property(prop_update_parameters, patch=True))
 
     def delete_property(self, property):
         _id = property.get("id")
         LOGGER.info("Deleting property in Zooking external API: %s", property)
         url = self.url + f"properties/{_id}"
-        requests.delete(url=url)
+        self.session.delete(url=url)
+        crud.delete_property_snapshot(self.service_schema, _id)
 
     def create_management_event(self, property_internal_id: int, event_internal_id: int, begin_datetime: str,
                                 end_datetime: str):
         LOGGER.info("Creating Management Event in Zooking external API for property_internal_id '%s': Event_internal_id - '%s'; Begin_datetime - '%s'; End_datetime - '%s'", 
                     property_internal_id, event_internal_id, begin_datetime, end_datetime)
-        external_id = crud.get_property_external_id(self.service_schema, property_internal_id)
-        if external_id is None:
-            LOGGER.error("Trying to create a management event for a non-existing property with internal_id '%s'", property_internal_id)
-            return
-
-        url = self.url + f"properties/{external_id}"
-        update_parameters = {"closed_time_frames": [{
+        self.apply_management_event_batch(property_internal_id, [{
+            "type": "create",
+            "event_internal_id": event_internal_id,
             "begin_datetime": begin_datetime,
-            "end_datetime": end_datetime
-        }]}
-        LOGGER.info("PUT request call (to create management event for property_external_id '%s') in Zooking API at '%s'...", external_id, url)
-        response = requests.put(url=url, json=ProperteaseToZooking.convert_property(update_parameters))
-        # TODO implement check against different status codes later
-        if response.status_code == 200:
-            LOGGER.info("Success created management event...")
-            updated_property = response.json()
-            returned_closed_time_frames = updated_property["closed_time_frames"]
-            for management_event_id, management_event in returned_closed_time_frames.items():
-                if (management_event["begin_datetime"] == begin_datetime and
-                        management_event["end_datetime"] == end_datetime):
-                    # management_event_id is the external id
-                    crud.create_management_event(self.service_schema, event_internal_id, management_event_id)
-                    break
-        else:
-            LOGGER.error("Failed creating management event for property_internal_id '%s'. Response data: ", response.content)
+            "end_datetime": end_datetime,
+        }])
 
     def update_management_event(self, property_internal_id: int, event_internal_id: int, begin_datetime: str,
                                 end_datetime: str):
         LOGGER.info("Updating Management Event in Zooking external API for property_internal_id '%s': Event_internal_id - '%s'; Begin_datetime - '%s'; End_datetime - '%s'", 
                     property_internal_id, event_internal_id, begin_datetime, end_datetime)
-
-        external_id = crud.get_property_external_id(self.service_schema, property_internal_id)
-        if external_id is None:
-            LOGGER.error("Trying to update a management event for a non-existing property with internal_id '%s'", property_internal_id)
-            return
-
-        url = self.url + f"properties/{external_id}"
-        update_parameters = {"closed_time_frames": [{
-            "id": crud.get_management_event(self.service_schema, event_internal_id).external_id,
+        self.apply_management_event_batch(property_internal_id, [{
+            "type": "update",
+            "event_internal_id": event_internal_id,
             "begin_datetime": begin_datetime,
-            "end_datetime": end_datetime
-        }]}
-        LOGGER.info("PUT request call (to update management event for property_external_id '%s') in Zooking API at '%s'...", external_id, url)
-        response = requests.put(url=url, json=ProperteaseToZooking.convert_property(update_parameters))
-        if response.status_code == 200:
-            LOGGER.info("Successfully updated management event")
-        else:
-            LOGGER.error("Failed updating management event. Response: '%s'", response.content)
-        # TODO implement check against different status codes later
-        # don't need to update anything on the mappers
+            "end_datetime": end_datetime,
+        }])
 
     def delete_management_event(self, property_internal_id: int, event_internal_id: int):
         LOGGER.info("Deleting Management Event in Zooking external API for property_internal_id '%s': Event_internal_id - '%s'", 
                     property_internal_id, event_internal_id)
+        self.apply_management_event_batch(property_internal_id, [{
+            "type": "delete",
+            "event_internal_id": event_internal_id,
+        }])
 
+    def apply_management_event_batch(self, property_internal_id: int, operations: list[dict]):
+        # Zooking's PUT properties/{id} takes a list of closed_time_frames: frames without id are created,
+        # frames with an id and datetimes are updated, frames with only an id are deleted
         external_id = crud.get_property_external_id(self.service_schema, property_internal_id)
         if external_id is None:
-            LOGGER.error("Trying to delete a management event for a non-existing property with internal_id '%s'", property_internal_id)
+            LOGGER.error("Trying to write management events for a non-existing property with internal_id '%s'", property_internal_id)
             return
 
         url = self.url + f"properties/{external_id}"
-        event = crud.get_management_event(self.service_schema, event_internal_id)
-        if event is None:
-            LOGGER.error("External counterpart of management event with internal_id '%s' not found.", event_internal_id)
+        for batch in self.merge_management_event_operations(operations):
+            self.put_closed_time_frames(url, external_id, batch)
+
+    @staticmethod
+    def merge_management_event_operations(operations: list[dict]) -> list[list[dict]]:
+        # folds the operations of each event so it appears at most once per request (create + update -> create
+        # with the new datetimes, create + delete -> nothing, ...); what can't be folded goes to the next request
+        batches = [{}]
+        for operation in operations:
+            batch = batches[-1]
+            event_internal_id = operation["event_internal_id"]
+            previous = batch.get(event_internal_id)
+            if previous is None:
+                batch[event_internal_id] = operation
+            elif operation["type"] == "update" and previous["type"] in ("create", "update"):
+                batch[event_internal_id] = {**operation, "type": previous["type"]}
+            elif operation["type"] == "delete" and previous["type"] == "create":
+                del batch[event_internal_id]
+            elif operation["type"] == "delete" and previous["type"] == "update":
+                batch[event_internal_id] = operation
+            else:
+                batches.append({event_internal_id: operation})
+        return [list(batch.values()) for batch in batches if batch]
+
+    def put_closed_time_frames(self, url: str, property_external_id: int, operations: list[dict]):
+        existing_events = crud.get_management_events(
+            self.service_schema, [operation["event_internal_id"] for operation in operations if operation["type"] != "create"]
+        )
+        closed_time_frames = []
+        sent_operations = []
+        for operation in operations:
+            if operation["type"] == "create":
+                closed_time_frame = {}
+            else:
+                event = existing_events.get(operation["event_internal_id"])
+                if event is None:
+                    LOGGER.error("External counterpart of management event with internal_id '%s' not found.", operation["event_internal_id"])
+                    continue
+                closed_time_frame = {"id": event.external_id}
+            if operation["type"] != "delete":
+                closed_time_frame["begin_datetime"] = operation["begin_datetime"]
+                closed_time_frame["end_datetime"] = operation["end_datetime"]
+            closed_time_frames.append(closed_time_frame)
+            sent_operations.append(operation)
+        if not closed_time_frames:
             return
 
-        update_parameters = {"closed_time_frames": [{
-            "id": event.external_id,
-        }]}
-        LOGGER.info("PUT request call (to delete management event for property_external_id '%s') in Zooking API at '%s'... Deleting event_external_id '%s'", 
-                    external_id, url, event.external_id)
-        response = requests.put(url=url, json=ProperteaseToZooking.convert_property(update_parameters))
+        LOGGER.info("PUT request call (to write %s management events for property_external_id '%s') in Zooking API at '%s'...",
+                    len(closed_time_frames), property_external_id, url)
+        # frames without id are created on every call: such a PUT must not be retried
+        response = self.session.put(url=url, json=ProperteaseToZooking.convert_property({"closed_time_frames": closed_time_frames}, patch=True),
+                                    idempotent=all("id" in closed_time_frame for closed_time_frame in closed_time_frames))
+        # the property's closed_time_frames no longer match the snapshot of the last update_property
+        crud.delete_property_snapshot(self.service_schema, property_external_id)
         # TODO implement check against different status codes later
-        if response.status_code == 200:
-            LOGGER.info("Successfully deleted management event")
-            crud.delete_management_event(self.service_schema, event_internal_id)
-        else:
-            LOGGER.error("Failed to delete management event. Response: '%s'", response.content)
+        if response.status_code != 200:
+            LOGGER.error("Failed writing management events for property_external_id '%s'. Response: '%s'", property_external_id, response.content)
+            return
+        LOGGER.info("Successfully wrote %s management events", len(closed_time_frames))
+
+        # created frames are matched back by their datetimes, newest first, each returned frame used once
+        sent_ids = {str(closed_time_frame["id"]) for closed_time_frame in closed_time_frames if "id" in closed_time_frame}
+        returned_ids_by_datetimes = {}
+        for management_event_id, management_event in reversed(list(response.json()["closed_time_frames"].items())):
+            if str(management_event_id) not in sent_ids:
+                returned_ids_by_datetimes.setdefault(
+                    (management_event["begin_datetime"], management_event["end_datetime"]), []
+                ).append(management_event_id)
+        created_events = {}
+        for operation in sent_operations:
+            if operation["type"] == "create":
+                returned_ids = returned_ids_by_datetimes.get((operation["begin_datetime"], operation["end_datetime"]))
+                if returned_ids:
+                    # management_event_id is the external id
+                    created_events[operation["event_internal_id"]] = returned_ids.pop(0)
+                else:
+                    LOGGER.error("Created management event with internal_id '%s' not found in the response.", operation["event_internal_id"])
+        crud.create_management_events(self.service_schema, created_events)
+        crud.delete_management_events(self.service_schema, [
+            operation["event_internal_id"] for operation in sent_operations if operation["type"] == "delete"
+        ])
 
     def import_properties(self, user):
         email = user.get("email")
         url = self.url + "properties?email=" + email
         LOGGER.info("Importing Zooking properties for user '%s'", email)
         LOGGER.info("GET request call in Zooking API at '%s'", url)
-        zooking_properties = requests.get(url=url).json()
-        converted_properties = [
-            ZookingToPropertease.convert_property(p) for p in zooking_properties
-        ]
+        zooking_properties = self.session.get(url=url, cache=True).json()
+        internal_ids = crud.set_property_internal_ids(self.service_schema, [p.get("id") for p in zooking_properties])
+        converted_properties = convert_batch(ZookingToPropertease.convert_properties, zooking_properties, internal_ids)
         return converted_properties
 
     def import_reservations(self, user):
@@ -156,26 +194,61 @@ class ZookingWrapper(BaseWrapper):
         url = self.url + "reservations?email=" + email
         LOGGER.info("Importing Zooking reservations for user '%s'", email)
         LOGGER.info("GET request call in Zooking API at '%s'..", url)
-        zooking_reservations = requests.get(url=url).json()
-        converted_reservations = [
-            ZookingToPropertease.convert_reservation(r, email) for r in zooking_reservations
-        ]
+        zooking_reservations = self.session.get(url=url).json()
+        property_ids = crud.get_property_internal_ids(self.service_schema, [r.get("property_id") for r in zooking_reservations])
+        reservation_ids = crud.save_reservations(self.service_schema,
+                                                 {r.get("id"): r.get("reservation_status") for r in zooking_reservations},
+                                                 ZookingToPropertease.reservation_details(zooking_reservations, property_ids))
+        converted_reservations = convert_batch(ZookingToPropertease.convert_reservations, zooking_reservations, email, reservation_ids, property_ids)
         return converted_reservations
 
+    def stream_reservations(self, user):
+        email = user.get("email")
+        url = self.url + "reservations?email=" + email
+        LOGGER.info("Streaming Zooking reservations for user '%s'", email)
+        LOGGER.info("GET request call in Zooking API at '%s'..", url)
+        with self.session.get(url=url, stream=True) as response:
+            if response.status_code != 200:
+                LOGGER.error("Importing reservations failed with status code %s. Response: %s", response.status_code, response.content)
+                return
+            for zooking_reservations in chunked(iter_json_array(response), config.RESERVATION_IMPORT_CHUNK_SIZE):
+                property_ids = crud.get_property_internal_ids(self.service_schema, [r.get("property_id") for r in zooking_reservations])
+                reservation_ids = crud.save_reservations(self.service_schema,
+                                                         {r.get("id"): r.get("reservation_status") for r in zooking_reservations},
+                                                         ZookingToPropertease.reservation_details(zooking_reservations, property_ids))
+                yield from convert_batch(ZookingToPropertease.convert_reservations, zooking_reservations, email, reservation_ids, property_ids)
+
     def import_new_or_newly_canceled_reservations(self, user):
         email = user.get("email")
         url = f"{self.url}reservations/upcoming?email={email}"
         LOGGER.info("Importing Zooking NEW or NEWLY CANCELLED reservations for user '%s'", email)
         LOGGER.info("GET request call in Zooking API at '%s'...", url)
-        zooking_reservations = requests.get(url=url).json()
-        converted_reservations = [
-            ZookingToPropertease.convert_reservation(r, email, reservation)
-            for r in zooking_reservations
-            if crud.get_property_internal_id(self.service_schema, r["property_id"]) is not None and
-               ((reservation := crud.get_reservation_by_external_id(self.service_schema, r["id"])) is None or
-                (r[
-                     "reservation_status"] == "canceled" and reservation.reservation_status != ReservationStatus.CANCELED))
+        zooking_reservations = self.session.get(url=url).json()
+        watermark = crud.get_reservation_watermark(self.service_schema, email)
+        # reservations with the status they had in the last sync were already handled then
+        changed_reservations = [r for r in zooking_reservations if watermark.get(r["id"]) != r["reservation_status"]]
+        LOGGER.info("%s of %s upcoming reservations changed since the last sync", len(changed_reservations), len(zooking_reservations))
+        mapped_property_ids = crud.get_property_internal_ids(self.service_schema, [r["property_id"] for r in changed_reservations])
+        reservation_states = crud.get_reservation_states(self.service_schema, [r["id"] for r in changed_reservations])
+        reservation_details = ZookingToPropertease.reservation_details(changed_reservations, mapped_property_ids)
+        new_or_newly_canceled_reservations = [
+            r for r in changed_reservations
+            if r["property_id"] in mapped_property_ids and
+               ((state := reservation_states.get(r["id"])) is None or
+                # same content as when it was saved -> nothing new
+                (state[1] != reservation_details[r["id"]]["content_hash"] and
+                 r["reservation_status"] == "canceled" and state[0] != ReservationStatus.CANCELED))
         ]
+        reservation_ids = crud.save_reservations(self.service_schema, {
+            r["id"]: r["reservation_status"] for r in new_or_newly_canceled_reservations
+        }, reservation_details)
+        # reservations of unmapped properties are checked again until their property gets mapped
+        crud.save_reservation_watermark(self.service_schema, email, {
+            r["id"]: r["reservation_status"] for r in zooking_reservations
+            if watermark.get(r["id"]) == r["reservation_status"] or r["property_id"] in mapped_property_ids
+        })
+        converted_reservations = convert_batch(ZookingToPropertease.convert_reservations, new_or_newly_canceled_reservations, email,
+                                               reservation_ids, mapped_property_ids)
         return converted_reservations
 
     def confirm_reservation(self, reservation_internal_id: int, property_internal_id: int, begin_datetime: str,
@@ -186,7 +259,7 @@ class ZookingWrapper(BaseWrapper):
             LOGGER.info("Confirming Zooking reservation with: internal_id - '%s'; external_id '%s'", reservation_internal_id, _id)
             url = self.url + f"reservations/{_id}"
             LOGGER.info("PUT request call in Zooking API to confirm reservation at '%s'...", url)
-            response = requests.put(url=url, json={"reservation_status": "confirmed"})
+            response = self.session.put(url=url, json={"reservation_status": "confirmed"})
             if response.status_code == 200:
                 crud.update_reservation(self.service_schema, reservation_internal_id,
                                         response.json()["reservation_status"])
@@ -203,7 +276,7 @@ class ZookingWrapper(BaseWrapper):
             LOGGER.info("Cancelling Zooking OVERLAPPING reservation with: internal_id - '%s'; external_id '%s'", reservation_internal_id, _id)
             url = self.url + f"reservations/{_id}"
             LOGGER.info("PUT request call in Zooking API at '%s'...", url)
-            response = requests.put(url=url, json={"reservation_status": "canceled"})
+            response = self.session.put(url=url, json={"reservation_status": "canceled"})
             if response.status_code == 200:
                 crud.update_reservation(self.service_schema, reservation_internal_id,
                                         response.json()["reservation_status"])
@@ -219,7 +292,7 @@ class ZookingWrapper(BaseWrapper):
             LOGGER.info("Cancelling Zooking reservation with: internal_id - '%s'; external_id '%s'", reservation_internal_id, _id)
             url = self.url + f"reservations/{_id}"
             LOGGER.info("PUT request call in Zooking API at '%s'...", url)
-            response = requests.put(url=url, json={"reservation_status": "canceled"})
+            response = self.session.put(url=url, json={"reservation_status": "canceled"})
             if response.status_code == 200:
                 crud.update_reservation(self.service_schema, reservation_internal_id,
                                         response.json()["reservation_status"])
@@ -235,15 +308,14 @@ class ZookingWrapper(BaseWrapper):
         LOGGER.info("Importing Zooking NEW properties for user '%s'", email)
         url = f"{self.url}properties?email={email}"
         LOGGER.info("GET request call in Zooking API at '%s'...", url)
-        response = requests.get(url=url)
+        response = self.session.get(url=url, cache=True)
         if response.status_code == 200:
             zooking_properties = response.json()
+            mapped_property_ids = crud.get_property_internal_ids(self.service_schema, [prop.get("id") for prop in zooking_properties])
             # import properties that don't exist -> not mapped in our database
-            converted_properties = [
-                ZookingToPropertease.convert_property(prop)
-                for prop in zooking_properties
-                if (crud.get_property_internal_id(self.service_schema, prop.get("id")) is None)
-            ]
+            new_properties = [prop for prop in zooking_properties if prop.get("id") not in mapped_property_ids]
+            internal_ids = crud.set_property_internal_ids(self.service_schema, [prop.get("id") for prop in new_properties])
+            converted_properties = convert_batch(ZookingToPropertease.convert_properties, new_properties, internal_ids)
             return converted_properties
         LOGGER.error("Importing new properties failed with status code %s. Response: %s", response.status_code, response.content)
         return []
@@ -0,0 +1,82 @@
+"""
+    Measures the latency of single id mapping lookups: the ORM queries crud used to run (Query.get and
+    Query.filter().first(), one ORM instance per row) against crud's Core read path (cached select() statements,
+    plain values and __slots__ records). The id cache is disabled, so every lookup reaches the database.
+
+    Usage (from the repository root):
+        python -m benchmarks.bench_crud_lookups [--rows 100000] [--lookups 5000]
+"""
+
+import argparse
+import os
+import random
+import tempfile
+import time
+
+# the id mapping database is chosen when Wrappers.models is imported
+os.environ.setdefault("WRAPPERS_DATABASE_URL", f"sqlite:///{os.path.join(tempfile.mkdtemp(), 'bench.db')}")
+os.environ.setdefault("WRAPPERS_ID_CACHE_MAX_SIZE", "0")
+
+from sqlalchemy import delete, insert
+
+from ProjectUtils.MessagingService.schemas import Service
+from Wrappers import crud
+from Wrappers.models import SessionLocal, engine, property_id_mapper_by_service, reservation_id_mapper_by_service
+
+SERVICE = Service.ZOOKING
+INSERT_CHUNK_SIZE = 50_000
+
+
+def fill(size: int) -> None:
+    with engine.begin() as connection:
+        for IdMapper in (property_id_mapper_by_service[SERVICE], reservation_id_mapper_by_service[SERVICE]):
+            connection.execute(delete(IdMapper))
+            for start in range(0, size, INSERT_CHUNK_SIZE):
+                connection.execute(insert(IdMapper), [
+                    {"internal_id": i, "external_id": i * 7} for i in range(start + 1, min(start + INSERT_CHUNK_SIZE, size) + 1)
+                ])
+        connection.execute(reservation_id_mapper_by_service[SERVICE].__table__.update().values(reservation_status="CONFIRMED"))
+
+
+def orm_property_external_id(internal_id: int):
+    with SessionLocal() as db:
+        return db.query(property_id_mapper_by_service[SERVICE]).get(internal_id).external_id
+
+
+def orm_reservation_by_external_id(external_id: int):
+    with SessionLocal() as db:
+        ReservationIdMapper = reservation_id_mapper_by_service[SERVICE]
+        return db.query(ReservationIdMapper).filter(ReservationIdMapper.external_id == external_id).first()
+
+
+def time_lookups(lookup, ids: list) -> float:
+    start = time.perf_counter()
+    for id_ in ids:
+        lookup(id_)
+    return (time.perf_counter() - start) / len(ids) * 1e6
+
+
+def run(rows: int, lookups: int) -> None:
+    fill(rows)
+    internal_ids = [random.randint(1, rows) for _ in range(lookups)]
+    external_ids = [internal_id * 7 for internal_id in internal_ids]
+    cases = [
+        ("property external_id by internal_id", internal_ids, orm_property_external_id,
+         lambda internal_id: crud.get_property_external_id(SERVICE, internal_id)),
+        ("reservation by external_id", external_ids, orm_reservation_by_external_id,
+         lambda external_id: crud.get_reservation_by_external_id(SERVICE, external_id)),
+    ]
+    print(f"{'lookup':<36} | {'ORM (us/lookup)':>16} | {'Core (us/lookup)':>17}")
+    for name, ids, orm_lookup, core_lookup in cases:
+        # warm up both paths (statement compilation, connection pool)
+        time_lookups(orm_lookup, ids[:100])
+        time_lookups(core_lookup, ids[:100])
+        print(f"{name:<36} | {time_lookups(orm_lookup, ids):>16.1f} | {time_lookups(core_lookup, ids):>17.1f}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, default=100_000)
+    parser.add_argument("--lookups", type=int, default=5000)
+    args = parser.parse_args()
+    run(args.rows, args.lookups)
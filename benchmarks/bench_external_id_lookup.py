@@ -0,0 +1,67 @@
+"""
+    Measures the cost of looking up a reservation mapper row by external_id as the table grows,
+    with and without the external_id index.
+
+    Usage (from the repository root):
+        python -m benchmarks.bench_external_id_lookup [--sizes 10000,100000,1000000] [--lookups 2000]
+"""
+
+import argparse
+import os
+import random
+import tempfile
+import time
+
+from sqlalchemy import Column, Integer, MetaData, Table, create_engine, insert, select
+
+from Wrappers.models import ReservationIdMapperZooking
+
+INSERT_CHUNK_SIZE = 50_000
+
+
+def unindexed_copy(table: Table) -> Table:
+    return Table(table.name, MetaData(), *[
+        Column(column.name, column.type, primary_key=column.primary_key) for column in table.columns
+    ])
+
+
+def fill(engine, table: Table, size: int) -> None:
+    with engine.begin() as connection:
+        for start in range(0, size, INSERT_CHUNK_SIZE):
+            connection.execute(insert(table), [
+                {"internal_id": i, "external_id": i * 7, "reservation_status": "CONFIRMED"}
+                for i in range(start + 1, min(start + INSERT_CHUNK_SIZE, size) + 1)
+            ])
+
+
+def time_lookups(engine, table: Table, size: int, lookups: int) -> float:
+    external_ids = [random.randint(1, size) * 7 for _ in range(lookups)]
+    with engine.connect() as connection:
+        start = time.perf_counter()
+        for external_id in external_ids:
+            connection.execute(select(table.c.internal_id).where(table.c.external_id == external_id)).first()
+        elapsed = time.perf_counter() - start
+    return elapsed / lookups * 1e6
+
+
+def run(sizes: list[int], lookups: int) -> None:
+    print(f"{'rows':>10} | {'indexed (us/lookup)':>20} | {'unindexed (us/lookup)':>22}")
+    for size in sizes:
+        results = []
+        for table in (ReservationIdMapperZooking.__table__, unindexed_copy(ReservationIdMapperZooking.__table__)):
+            with tempfile.TemporaryDirectory() as directory:
+                engine = create_engine(f"sqlite:///{os.path.join(directory, 'bench.db')}")
+                table.create(engine)
+                fill(engine, table, size)
+                # full scans get slow quickly, time fewer of them
+                results.append(time_lookups(engine, table, size, lookups if table.indexes else max(lookups // 20, 10)))
+                engine.dispose()
+        print(f"{size:>10} | {results[0]:>20.1f} | {results[1]:>22.1f}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", default="10000,100000,1000000")
+    parser.add_argument("--lookups", type=int, default=2000)
+    args = parser.parse_args()
+    run([int(size) for size in args.sizes.split(",")], args.lookups)
@@ -0,0 +1,64 @@
+"""
+    Points the wrappers at throwaway databases and a mocked broker connection before any test imports them (the id
+    mapping database is chosen when Wrappers.models is imported) and provides fixtures to use them.
+"""
+
+import os
+import tempfile
+from unittest import mock
+
+import pika
+import pytest
+
+_DATABASE_DIR = tempfile.mkdtemp(prefix="wrappers-tests-")
+os.environ["WRAPPERS_DATABASE_URL"] = f"sqlite:///{os.path.join(_DATABASE_DIR, 'idMapping.db')}"
+os.environ["WRAPPERS_RATE_LIMIT_DATABASE_URL"] = f"sqlite:///{os.path.join(_DATABASE_DIR, 'rateLimits.db')}"
+
+# the wrappers and handlers declare their queues when imported (ProjectUtils' queue_definitions connects to the
+# broker): unit tests run without one
+mock.patch.object(pika, "BlockingConnection").start()
+
+
+@pytest.fixture
+def database():
+    # empty id mapping tables, caches and id blocks; yields the engine
+    from sqlalchemy import delete, update
+
+    from Wrappers import crud
+    from Wrappers.models import Base, IdMappingGeneration, SequenceIdProperties, SequenceIdReservations, engine, \
+        property_id_allocator, reservation_id_allocator
+
+    with engine.begin() as connection:
+        for table in Base.metadata.sorted_tables:
+            if table.name in (SequenceIdProperties.__tablename__, SequenceIdReservations.__tablename__):
+                connection.execute(update(table).values(auto_incremented=1))
+            elif table.name == IdMappingGeneration.__tablename__:
+                connection.execute(update(table).values(generation=0))
+            else:
+                connection.execute(delete(table))
+    property_id_allocator.reset()
+    reservation_id_allocator.reset()
+    crud.id_cache.clear()
+    crud._id_indexes_by_direction.clear()
+    crud._cache_generations.update(generations=None, checked_at=float("-inf"))
+    yield engine
+
+
+@pytest.fixture
+def fake_response():
+    # fake_response(json, status_code) -> stand-in for the requests.Response of an external API call
+    def build(json=None, status_code: int = 200):
+        response = mock.Mock(status_code=status_code, ok=status_code < 400, content=b"")
+        response.json.return_value = json
+        return response
+    return build
+
+
+@pytest.fixture
+def zooking_wrapper(database):
+    # ZookingWrapper whose HTTP session is a mock, e.g. wrapper.session.get.return_value = fake_response([...])
+    from Wrappers.zooking.zooking_wrapper import ZookingWrapper
+
+    wrapper = ZookingWrapper(queue="zooking_test")
+    wrapper.session = mock.Mock()
+    return wrapper
@@ -0,0 +1,118 @@
+"""
+    Checks the message ordering of the async engine: messages of one property are processed in the order received,
+    messages of different properties concurrently, and messages without a property alone.
+"""
+
+import asyncio
+import json
+import time
+from types import SimpleNamespace
+from unittest import mock
+
+import pytest
+
+from ProjectUtils.MessagingService.schemas import MessageType, Service
+from Wrappers import async_events_handler
+from Wrappers.keyed_executor import AsyncKeyedLanes
+from Wrappers.regular_events_handler import message_key
+
+
+def run_all(lanes: AsyncKeyedLanes, keyed_delays: list) -> list:
+    # runs (key, name, delay) in order and returns the (event, name) log
+    log = []
+
+    async def work(name, delay):
+        log.append(("start", name))
+        await asyncio.sleep(delay)
+        log.append(("end", name))
+
+    async def main():
+        tasks = [asyncio.create_task(lanes.run(key, work, name, delay)) for key, name, delay in keyed_delays]
+        await asyncio.gather(*tasks)
+
+    asyncio.run(main())
+    return log
+
+
+def test_same_key_runs_in_order():
+    log = run_all(AsyncKeyedLanes(), [(1, "a", 0.05), (1, "b", 0), (1, "c", 0.01)])
+    assert log == [("start", "a"), ("end", "a"), ("start", "b"), ("end", "b"), ("start", "c"), ("end", "c")]
+
+
+def test_different_keys_run_concurrently():
+    log = run_all(AsyncKeyedLanes(), [(1, "a", 0.05), (2, "b", 0)])
+    assert log == [("start", "a"), ("start", "b"), ("end", "b"), ("end", "a")]
+
+
+def test_unkeyed_runs_alone():
+    log = run_all(AsyncKeyedLanes(), [(1, "a", 0.05), (2, "b", 0.02), (None, "x", 0.02), (1, "c", 0), (3, "d", 0)])
+    assert log.index(("start", "x")) > max(log.index(("end", "a")), log.index(("end", "b")))
+    assert log.index(("end", "x")) < min(log.index(("start", "c")), log.index(("start", "d")))
+
+
+def test_failure_releases_the_key():
+    lanes = AsyncKeyedLanes()
+
+    async def fail():
+        raise RuntimeError
+
+    async def succeed():
+        return "done"
+
+    async def main():
+        first = asyncio.create_task(lanes.run(1, fail))
+        second = asyncio.create_task(lanes.run(1, succeed))
+        with pytest.raises(RuntimeError):
+            await first
+        return await second
+
+    assert asyncio.run(main()) == "done"
+    assert not lanes._pending and not lanes._last_by_key
+
+
+def incoming(message_type: MessageType, body: dict):
+    message = mock.Mock(body=json.dumps({"message_type": message_type.value, "body": body}).encode())
+    message.ack = mock.AsyncMock()
+    return message
+
+
+def test_consume_keeps_the_order_of_each_property(monkeypatch):
+    # two updates of property 1 and one of property 2; the first one of property 1 is the slowest
+    processed = []
+
+    def process_message(wrapper, message, publish):
+        if message.body["update_parameters"]["n"] == 1:
+            time.sleep(0.1)
+        processed.append((message.body["internal_id"], message.body["update_parameters"]["n"]))
+
+    messages = [
+        incoming(MessageType.PROPERTY_UPDATE, {"internal_id": 1, "update_parameters": {"n": 1}}),
+        incoming(MessageType.PROPERTY_UPDATE, {"internal_id": 2, "update_parameters": {"n": 2}}),
+        incoming(MessageType.PROPERTY_UPDATE, {"internal_id": 1, "update_parameters": {"n": 3}}),
+    ]
+    queue = mock.Mock()
+
+    async def deliver(on_message):
+        for message in messages:
+            asyncio.get_running_loop().create_task(on_message(message))
+
+    queue.consume = deliver
+    channel = mock.AsyncMock()
+    channel.get_queue.return_value = queue
+    connection = mock.MagicMock()
+    connection.channel = mock.AsyncMock(return_value=channel)
+    connection.__aenter__.return_value = connection
+    monkeypatch.setattr(async_events_handler.aio_pika, "connect_robust", mock.AsyncMock(return_value=connection))
+    monkeypatch.setattr(async_events_handler, "from_json", lambda body: SimpleNamespace(**{
+        "message_type": MessageType(json.loads(body)["message_type"]), "body": json.loads(body)["body"],
+    }))
+    wrapper = SimpleNamespace(service_schema=Service.ZOOKING, queue="zooking_test")
+
+    async def main():
+        task = asyncio.create_task(async_events_handler.consume(wrapper, process_message, message_key))
+        while not all(message.ack.await_count for message in messages):
+            await asyncio.sleep(0.01)
+        task.cancel()
+
+    asyncio.run(asyncio.wait_for(main(), timeout=5))
+    assert processed == [(2, 2), (1, 1), (1, 3)]
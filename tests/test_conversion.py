@@ -0,0 +1,80 @@
+"""
+    Checks the batch conversion of imported lists: converted in the handler below the threshold, split across the
+    process pool above it, in both cases in the order received.
+"""
+
+import os
+import subprocess
+import sys
+
+import pytest
+
+from Wrappers import config
+from Wrappers.base_wrapper import conversion
+from Wrappers.base_wrapper.conversion import convert_batch
+from Wrappers.zooking.converters.zooking_to_propertease import ZookingToPropertease
+
+RESERVATIONS = [
+    {"id": 100 + n, "property_id": 10 + n % 3, "arrival": "2024-05-01", "departure": "2024-05-03",
+     "reservation_status": "confirmed", "client_name": f"Client {n}", "client_email": f"client{n}@example.com",
+     "client_phone": "+351 900 000 000", "cost": 100.0 + n}
+    for n in range(40)
+]
+RESERVATION_IDS = {reservation["id"]: n + 1 for n, reservation in enumerate(RESERVATIONS)}
+PROPERTY_IDS = {10: 1, 11: 2}  # property 12 isn't mapped
+
+
+def convert_with_pid(items: list) -> list:
+    # which process converted each item
+    return [(item, os.getpid()) for item in items]
+
+
+@pytest.fixture
+def process_pool(monkeypatch):
+    monkeypatch.setattr(config, "CONVERSION_PROCESS_POOL_THRESHOLD", 8)
+    monkeypatch.setattr(config, "CONVERSION_PROCESSES", 2)
+    monkeypatch.setattr(conversion, "_pool", None)
+    yield
+    if conversion._pool is not None:
+        conversion._pool.shutdown()
+
+
+def test_small_lists_are_converted_inline(process_pool):
+    assert convert_batch(convert_with_pid, list(range(7))) == [(n, os.getpid()) for n in range(7)]
+    assert conversion._pool is None
+
+
+def test_disabled_pool(monkeypatch):
+    monkeypatch.setattr(config, "CONVERSION_PROCESS_POOL_THRESHOLD", 0)
+    assert [pid for _, pid in convert_batch(convert_with_pid, list(range(100)))] == [os.getpid()] * 100
+
+
+def test_big_lists_are_converted_in_order_by_the_pool(process_pool):
+    converted = convert_batch(convert_with_pid, list(range(40)))
+    assert [item for item, _ in converted] == list(range(40))
+    assert os.getpid() not in {pid for _, pid in converted}
+
+
+def test_pool_conversion_matches_inline_conversion(process_pool, monkeypatch):
+    converted = convert_batch(ZookingToPropertease.convert_reservations, RESERVATIONS, "owner@example.com",
+                              RESERVATION_IDS, PROPERTY_IDS)
+    monkeypatch.setattr(config, "CONVERSION_PROCESS_POOL_THRESHOLD", 0)
+    assert converted == convert_batch(ZookingToPropertease.convert_reservations, RESERVATIONS, "owner@example.com",
+                                      RESERVATION_IDS, PROPERTY_IDS)
+    assert [reservation["_id"] for reservation in converted] == list(range(1, 41))
+
+
+def test_pool_workers_are_not_forked(process_pool):
+    convert_batch(convert_with_pid, list(range(8)))
+    assert conversion._pool._mp_context.get_start_method() == "forkserver"
+
+
+@pytest.mark.parametrize("module", [
+    "Wrappers.zooking.converters.zooking_to_propertease",
+    "Wrappers.clickandgo.converters.clickandgo_to_propertease",
+    "Wrappers.earthstayin.converters.earthstayin_to_propertease",
+])
+def test_converters_do_not_import_the_database(module):
+    # what a pool worker imports to run a converter: no id mapping database, no migration
+    code = f"import sys, {module}; assert 'Wrappers.crud' not in sys.modules and 'Wrappers.models' not in sys.modules"
+    subprocess.run([sys.executable, "-c", code], check=True, cwd=os.path.dirname(os.path.dirname(__file__)))
@@ -0,0 +1,65 @@
+"""
+    Checks that the patch mode of the PropertEase -> platform converters converts only the fields present in the
+    update, with the same values as the full conversion.
+"""
+
+import json
+import os
+
+import pytest
+from Wrappers.clickandgo.converters.propertease_to_clickandgo import ProperteaseToClickandgo
+from Wrappers.earthstayin.converters.propertease_to_earthstayin import ProperteaseToEarthstayin
+from Wrappers.zooking.converters.propertease_to_zooking import ProperteaseToZooking
+
+PROPERTEASE_EXAMPLE = os.path.join(os.path.dirname(__file__), "..", "Wrappers", "all_schema_examples", "PROPERTEASE.json")
+
+CONVERTERS = [ProperteaseToZooking, ProperteaseToClickandgo, ProperteaseToEarthstayin]
+# (converter, PropertEase fields of the update, platform fields of the patch)
+UPDATES = [
+    (ProperteaseToZooking, ["title"], {"name"}),
+    (ProperteaseToZooking, ["price", "after_commission"], {"curr_price"}),
+    (ProperteaseToZooking, ["bedrooms", "amenities"], {"bedrooms", "amenities"}),
+    (ProperteaseToZooking, ["house_rules", "contacts"], set()),  # not in Zooking's schema
+    (ProperteaseToZooking, ["additional_info", "square_meters"], {"additional_info", "square_meters"}),
+    (ProperteaseToClickandgo, ["title"], {"name"}),
+    (ProperteaseToClickandgo, ["price", "after_commission"], {"curr_price"}),
+    (ProperteaseToClickandgo, ["bedrooms", "amenities"], {"bedrooms", "available_amenities"}),
+    (ProperteaseToClickandgo, ["house_rules", "contacts"], {"house_rules", "house_managers"}),
+    (ProperteaseToClickandgo, ["additional_info", "square_meters"], {"additional_info", "house_area"}),
+    (ProperteaseToEarthstayin, ["title"], {"name"}),
+    (ProperteaseToEarthstayin, ["price", "after_commission"], {"curr_price"}),
+    (ProperteaseToEarthstayin, ["bedrooms", "amenities"], {"bedrooms", "available_amenities"}),
+    (ProperteaseToEarthstayin, ["house_rules", "contacts"], {"house_rules"}),
+    (ProperteaseToEarthstayin, ["additional_info", "square_meters"], {"additional_info", "accessibilities", "square_meters"}),
+]
+
+
+@pytest.fixture
+def propertease_property():
+    with open(PROPERTEASE_EXAMPLE, encoding="utf-8") as f:
+        return json.load(f)
+
+
+@pytest.mark.parametrize("converter, fields, patched_fields", UPDATES)
+def test_patch_matches_full_conversion(converter, fields, patched_fields, propertease_property):
+    update = {field: propertease_property[field] for field in fields}
+    full = converter.convert_property(propertease_property)
+    patch = converter.convert_property(update, patch=True)
+    assert set(patch) == patched_fields
+    assert patch == {field: full[field] for field in patched_fields}
+
+
+@pytest.mark.parametrize("converter", CONVERTERS)
+def test_patch_of_whole_property_matches_full_conversion(converter, propertease_property):
+    propertease_property["closed_time_frames"] = {}
+    full = converter.convert_property(propertease_property)
+    full.pop("id")
+    assert converter.convert_property(propertease_property, patch=True) == full
+
+
+@pytest.mark.parametrize("converter", CONVERTERS)
+def test_patch_skips_absent_fields(converter):
+    assert converter.convert_property({"cancellation_policy": "none"}, patch=True) == {}
+    assert converter.convert_property({"title": None}, patch=True) == {
+        field: None for field, propertease_field in converter.fields_map.items() if propertease_field == "title"
+    }
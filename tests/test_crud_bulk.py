@@ -0,0 +1,91 @@
+"""
+    Checks the bulk id lookups used by the imports: one query per chunk of ids instead of one per id.
+"""
+
+from sqlalchemy import event
+
+from ProjectUtils.MessagingService.schemas import Service
+from Wrappers import crud
+from Wrappers.models import ReservationStatus
+
+SERVICE = Service.ZOOKING
+
+
+class QueryCounter:
+    def __init__(self, engine) -> None:
+        self.engine = engine
+        self.selects = 0
+
+    def __enter__(self):
+        event.listen(self.engine, "before_cursor_execute", self.count)
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        event.remove(self.engine, "before_cursor_execute", self.count)
+
+    def count(self, connection, cursor, statement, parameters, context, executemany) -> None:
+        if statement.lstrip().upper().startswith("SELECT") and "id_mapping_generation" not in statement:
+            self.selects += 1
+
+
+def test_get_property_internal_ids_returns_mapped_only(database):
+    internal_ids = crud.set_property_internal_ids(SERVICE, [1001, 1002])
+    crud.id_cache.clear()
+    assert crud.get_property_internal_ids(SERVICE, [1001, 1003, 1002, 1001]) == internal_ids
+
+
+def test_get_property_internal_ids_queries_by_chunk(database, monkeypatch):
+    external_ids = list(range(1, 1201))
+    crud.set_property_internal_ids(SERVICE, external_ids)
+    crud.id_cache.clear()
+    with QueryCounter(database) as counter:
+        internal_ids = crud.get_property_internal_ids(SERVICE, external_ids)
+    assert len(internal_ids) == 1200
+    assert counter.selects == 3  # chunks of BULK_QUERY_CHUNK_SIZE ids
+    with QueryCounter(database) as counter:
+        crud.get_property_internal_ids(SERVICE, external_ids[:100])
+    assert counter.selects == 0  # served by the cache
+
+
+def test_set_property_internal_ids_creates_missing_only(database):
+    first = crud.set_property_internal_ids(SERVICE, [1001, 1002])
+    second = crud.set_property_internal_ids(SERVICE, [1002, 1003, 1003])
+    assert second[1002] == first[1002]
+    assert len(set(first.values()) | set(second.values())) == 3
+    assert crud.get_property_external_id(SERVICE, second[1003]) == 1003
+
+
+def test_save_reservations_creates_and_updates_in_bulk(database):
+    internal_ids = crud.save_reservations(SERVICE, {1: "confirmed", 2: "pending"})
+    assert crud.save_reservations(SERVICE, {2: "canceled", 3: "confirmed"})[2] == internal_ids[2]
+    assert crud.get_reservation_by_external_id(SERVICE, 2).reservation_status.value == "canceled"
+    assert crud.get_reservation_external_id(SERVICE, internal_ids[1]) == 1
+
+
+def details(property_internal_id: int, content_hash: str) -> dict:
+    return {"begin_datetime": "2024-05-01", "end_datetime": "2024-05-03",
+            "property_internal_id": property_internal_id, "content_hash": content_hash}
+
+
+def test_save_reservations_stores_the_details(database):
+    crud.save_reservations(SERVICE, {1: "confirmed", 2: "pending"}, {1: details(7, "a" * 16)})
+    assert crud.get_reservation_states(SERVICE, [1, 2, 3]) == {
+        1: (ReservationStatus.CONFIRMED, "a" * 16), 2: (ReservationStatus.PENDING, None),
+    }
+
+
+def test_save_reservations_only_updates_changed_content(database):
+    crud.save_reservations(SERVICE, {1: "confirmed", 2: "confirmed"}, {1: details(7, "a" * 16), 2: details(7, "b" * 16)})
+    updates = []
+
+    def count_updates(connection, cursor, statement, parameters, context, executemany):
+        if statement.lstrip().startswith("UPDATE reservation_id_mapper"):
+            updates.append(len(parameters) if executemany else 1)
+
+    event.listen(database, "before_cursor_execute", count_updates)
+    try:
+        crud.save_reservations(SERVICE, {1: "confirmed", 2: "confirmed"}, {1: details(7, "a" * 16), 2: details(8, "c" * 16)})
+    finally:
+        event.remove(database, "before_cursor_execute", count_updates)
+    assert updates == [1]
+    assert crud.get_reservation_states(SERVICE, [2]) == {2: (ReservationStatus.CONFIRMED, "c" * 16)}
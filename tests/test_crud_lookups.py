@@ -0,0 +1,80 @@
+"""
+    Checks the crud point lookups: plain records instead of ORM objects, read through select statements built once
+    per table, columns and filter.
+"""
+
+import pytest
+from sqlalchemy import event
+
+from ProjectUtils.MessagingService.schemas import Service
+from Wrappers import crud
+from Wrappers.crud import IdRecord, ReservationRecord
+from Wrappers.id_cache import LRUCache
+from Wrappers.models import ReservationStatus, property_id_mapper_by_service
+
+SERVICE = Service.ZOOKING
+
+
+@pytest.fixture
+def uncached(monkeypatch):
+    # every lookup reaches the database
+    monkeypatch.setattr(crud, "id_cache", LRUCache(0))
+
+
+def test_records():
+    management_event = IdRecord(1, 1001)
+    reservation = ReservationRecord(2, 9002, ReservationStatus.CONFIRMED)
+    assert repr(management_event) == "IdRecord(internal_id=1, external_id=1001)"
+    assert repr(reservation) == \
+           "ReservationRecord(internal_id=2, external_id=9002, reservation_status=<ReservationStatus.CONFIRMED: 'confirmed'>)"
+    with pytest.raises(AttributeError):
+        management_event.other = None  # __slots__
+
+
+def test_lookups(database, uncached):
+    internal_ids = crud.set_property_internal_ids(SERVICE, [1001])
+    reservation_ids = crud.save_reservations(SERVICE, {9001: "pending"})
+    crud.create_management_events(SERVICE, {5: 5001})
+    assert crud.get_property_internal_id(SERVICE, 1001) == internal_ids[1001]
+    assert crud.get_property_external_id(SERVICE, internal_ids[1001]) == 1001
+    assert crud.get_property_external_id(SERVICE, 999) is None and crud.get_property_internal_id(SERVICE, 999) is None
+    reservation = crud.get_reservation_by_external_id(SERVICE, 9001)
+    assert (reservation.internal_id, reservation.external_id, reservation.reservation_status) == \
+           (reservation_ids[9001], 9001, ReservationStatus.PENDING)
+    assert crud.get_reservation_external_id(SERVICE, reservation_ids[9001]) == 9001
+    assert crud.get_reservation_by_external_id(SERVICE, 999) is None
+    management_event = crud.get_management_event(SERVICE, 5)
+    assert (type(management_event), management_event.internal_id, management_event.external_id) == (IdRecord, 5, 5001)
+    assert crud.get_management_events(SERVICE, [5, 6]).keys() == {5}
+
+
+def test_statements_are_built_once(database, uncached, monkeypatch):
+    monkeypatch.setattr(crud, "_statements", {})
+    crud.set_property_internal_ids(SERVICE, [1001, 1002])
+    crud.get_property_internal_id(SERVICE, 1001)
+    statements = dict(crud._statements)
+    crud.get_property_internal_id(SERVICE, 1002)
+    crud.get_property_internal_ids(SERVICE, [1001, 1002])
+    crud.get_property_internal_ids(SERVICE, [1001])
+    assert all(crud._statements[key] is statement for key, statement in statements.items())
+    table = property_id_mapper_by_service[SERVICE].__table__
+    assert crud._select_by(table, ("internal_id",), "external_id") is \
+           crud._select_by(table, ("internal_id",), "external_id")
+    assert crud._select_by(table, ("internal_id",), "external_id") is not \
+           crud._select_by(table, ("internal_id",), "external_id", expanding=True)
+
+
+def test_bulk_lookup_expands_the_ids(database, uncached):
+    crud.set_property_internal_ids(SERVICE, [1001, 1002, 1003])
+    statements = []
+
+    def collect(connection, cursor, statement, parameters, context, executemany):
+        if "property_id_mapper_zooking" in statement:
+            statements.append(statement)
+
+    event.listen(database, "before_cursor_execute", collect)
+    try:
+        assert crud.get_property_internal_ids(SERVICE, [1001, 1003, 1004]).keys() == {1001, 1003}
+    finally:
+        event.remove(database, "before_cursor_execute", collect)
+    assert len(statements) == 1 and statements[0].count("?") == 3
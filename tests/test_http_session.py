@@ -0,0 +1,162 @@
+"""
+    Checks the HTTP session of the wrappers: one keep-alive connection pool per wrapper, sized from the settings,
+    retries of the failed calls that can be resent, and the circuit breaker counting every attempt.
+"""
+
+import socket
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+import requests
+
+from ProjectUtils.MessagingService.schemas import Service
+from Wrappers.base_wrapper import http_session
+from Wrappers.base_wrapper.http_session import CircuitBreaker, CircuitOpenError, ServiceSession, create_http_session
+
+
+class LocalService(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"  # keep-alive
+
+    def do_GET(self):
+        self.server.connections.add(self.client_address)
+        self.server.calls.append(self.command)
+        if self.headers.get("Content-Length"):
+            self.rfile.read(int(self.headers["Content-Length"]))
+        time.sleep(self.server.delay)
+        # answers the queued statuses first, then 200
+        status = self.server.statuses.pop(0) if self.server.statuses else 200
+        body = b"[]"
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    do_PUT = do_POST = do_GET
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def local_service():
+    server = ThreadingHTTPServer(("127.0.0.1", 0), LocalService)
+    server.connections = set()
+    server.calls = []
+    server.statuses = []
+    server.delay = 0
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+def test_session_pool_settings(monkeypatch):
+    monkeypatch.setenv("WRAPPERS_HTTP_POOL_CONNECTIONS", "3")
+    monkeypatch.setenv("WRAPPERS_ZOOKING_HTTP_POOL_MAXSIZE", "20")
+    monkeypatch.setenv("WRAPPERS_HTTP_POOL_BLOCK", "true")
+    session = create_http_session(Service.ZOOKING)
+    adapter = session.get_adapter("http://host.docker.internal:8000/properties")
+    assert isinstance(session, ServiceSession)
+    assert (adapter._pool_connections, adapter._pool_maxsize, adapter._pool_block) == (3, 20, True)
+    # one pool for both schemes
+    assert session.get_adapter("https://example.com/") is adapter
+
+
+def test_requests_reuse_the_connection(local_service):
+    session = create_http_session(Service.ZOOKING)
+    url = f"http://127.0.0.1:{local_service.server_port}/properties"
+    for _ in range(5):
+        assert session.get(url).json() == []
+    assert len(local_service.connections) == 1
+
+
+def test_wrapper_keeps_one_session(database):
+    from Wrappers.zooking.zooking_wrapper import ZookingWrapper
+
+    wrapper = ZookingWrapper(queue="zooking_test")
+    assert isinstance(wrapper.session, ServiceSession)
+    assert wrapper.session.service_schema == Service.ZOOKING
+
+
+@pytest.fixture
+def fast_retries(monkeypatch):
+    # a new circuit breaker per test, retries without backoff
+    monkeypatch.setattr(http_session, "_circuit_breakers", {})
+    monkeypatch.setenv("WRAPPERS_HTTP_RETRY_BACKOFF_MS", "0")
+    monkeypatch.setenv("WRAPPERS_HTTP_IDEMPOTENT_RETRIES", "3")
+    monkeypatch.setenv("WRAPPERS_HTTP_MAX_RETRIES", "2")
+    monkeypatch.setenv("WRAPPERS_HTTP_CIRCUIT_FAILURE_THRESHOLD", "10")
+
+
+def closed_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def test_idempotent_calls_are_retried(local_service, fast_retries):
+    local_service.statuses = [503, 502]
+    session = create_http_session(Service.ZOOKING)
+    assert session.get(f"http://127.0.0.1:{local_service.server_port}/properties").status_code == 200
+    assert local_service.calls == ["GET"] * 3
+
+
+def test_retries_are_bounded(local_service, fast_retries):
+    local_service.statuses = [503] * 10
+    session = create_http_session(Service.ZOOKING)
+    assert session.put(f"http://127.0.0.1:{local_service.server_port}/properties/1", json={}).status_code == 503
+    assert local_service.calls == ["PUT"] * 4
+
+
+def test_non_idempotent_calls_that_reached_the_service_are_not_retried(local_service, fast_retries):
+    local_service.statuses = [503]
+    session = create_http_session(Service.ZOOKING)
+    url = f"http://127.0.0.1:{local_service.server_port}/properties"
+    assert session.post(url, json={}).status_code == 503
+    local_service.delay = 0.3
+    with pytest.raises(requests.exceptions.ReadTimeout):
+        session.put(url, json={}, idempotent=False, timeout=(1, 0.1))
+    assert local_service.calls == ["POST", "PUT"]
+
+
+def test_non_idempotent_calls_are_retried_when_not_sent(fast_retries):
+    session = create_http_session(Service.ZOOKING)
+    before = http_session.get_http_stats().get(Service.ZOOKING.value, {}).get("requests", 0)
+    with pytest.raises(requests.exceptions.ConnectionError):
+        session.post(f"http://127.0.0.1:{closed_port()}/properties", json={})
+    # one layer of retries: 1 + WRAPPERS_HTTP_MAX_RETRIES attempts, none of them by the adapter
+    assert http_session.get_http_stats()[Service.ZOOKING.value]["requests"] - before == 3
+    assert session.get_adapter("http://127.0.0.1/").max_retries.total == 0
+
+
+def test_every_attempt_counts_for_the_breaker(local_service, fast_retries, monkeypatch):
+    monkeypatch.setenv("WRAPPERS_HTTP_CIRCUIT_FAILURE_THRESHOLD", "2")
+    local_service.statuses = [503] * 10
+    session = create_http_session(Service.ZOOKING)
+    url = f"http://127.0.0.1:{local_service.server_port}/properties"
+    with pytest.raises(CircuitOpenError):
+        session.get(url)
+    assert local_service.calls == ["GET"] * 2
+    assert session.circuit_breaker.state == CircuitBreaker.OPEN
+
+
+def test_breaker_opens_half_opens_and_closes():
+    breaker = CircuitBreaker(failure_threshold=2, reset_timeout=0.05)
+    breaker.record_failure()
+    assert breaker.allow() and breaker.state == CircuitBreaker.CLOSED
+    breaker.record_failure()
+    assert not breaker.allow() and breaker.state == CircuitBreaker.OPEN
+    time.sleep(0.06)
+    assert breaker.state == CircuitBreaker.HALF_OPEN
+    # a single trial call
+    assert breaker.allow() and not breaker.allow()
+    breaker.record_failure()
+    assert not breaker.allow() and breaker.state == CircuitBreaker.OPEN
+    time.sleep(0.06)
+    assert breaker.allow()
+    breaker.record_success()
+    assert breaker.state == CircuitBreaker.CLOSED and breaker.allow() and breaker.allow()
@@ -0,0 +1,70 @@
+"""
+    Checks the block-based internal id allocator: ids are handed out from memory, blocks roll over, and ids never
+    repeat across threads or allocators (processes) sharing the sequence table.
+"""
+
+from concurrent.futures import ThreadPoolExecutor
+
+from sqlalchemy import event, select
+
+from Wrappers.models import IdBlockAllocator, SequenceIdProperties
+
+SEQUENCE = SequenceIdProperties.__table__
+
+
+def sequence_value(engine) -> int:
+    with engine.connect() as connection:
+        return connection.execute(select(SEQUENCE.c.auto_incremented)).scalar_one()
+
+
+def test_block_rollover(database):
+    allocator = IdBlockAllocator(SEQUENCE, 10)
+    assert allocator.allocate(4) == [1, 2, 3, 4]
+    assert sequence_value(database) == 11
+    # 6 ids left in the block, the other 6 come from a new one
+    assert allocator.allocate(12) == list(range(5, 17))
+    assert sequence_value(database) == 21
+    assert allocator.next_id() == 17
+
+
+def test_one_update_per_block(database):
+    allocator = IdBlockAllocator(SEQUENCE, 100)
+    updates = []
+
+    def listener(connection, cursor, statement, *args):
+        if statement.startswith("UPDATE"):
+            updates.append(statement)
+
+    event.listen(database, "before_cursor_execute", listener)
+    try:
+        ids = [allocator.next_id() for _ in range(250)]
+    finally:
+        event.remove(database, "before_cursor_execute", listener)
+    assert ids == list(range(1, 251))
+    assert len(updates) == 3
+
+
+def test_concurrent_allocation_is_disjoint(database):
+    # two allocators stand for the regular and scheduled handlers sharing the database
+    allocators = [IdBlockAllocator(SEQUENCE, 7), IdBlockAllocator(SEQUENCE, 7)]
+    with ThreadPoolExecutor(max_workers=8) as executor:
+        batches = list(executor.map(lambda i: allocators[i % 2].allocate(1 + i % 5), range(200)))
+    ids = [id_ for batch in batches for id_ in batch]
+    assert len(ids) == len(set(ids)) == sum(1 + i % 5 for i in range(200))
+
+
+def test_allocation_in_caller_transaction_rolls_back(database):
+    allocator = IdBlockAllocator(SEQUENCE, 100)
+    with database.connect() as connection:
+        with connection.begin() as transaction:
+            assert allocator.allocate(3, connection) == [1, 2, 3]
+            transaction.rollback()
+    assert sequence_value(database) == 1
+    assert allocator.allocate(2) == [1, 2]
+
+
+def test_reset_drops_the_current_block(database):
+    allocator = IdBlockAllocator(SEQUENCE, 10)
+    assert allocator.next_id() == 1
+    allocator.reset()
+    assert allocator.next_id() == 11
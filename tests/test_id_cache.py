@@ -0,0 +1,98 @@
+"""
+    Checks the id cache in front of the crud lookups: hits and misses, write-through, and that mappings renumbered
+    or removed by another process (simulated with writes that bypass crud) are not served from it.
+"""
+
+import pytest
+from sqlalchemy import update
+
+from ProjectUtils.MessagingService.schemas import Service
+from Wrappers import config, crud
+from Wrappers.id_cache import LRUCache, MISSING
+from Wrappers.models import IdMappingGeneration, management_id_mapper_by_service, property_id_mapper_by_service
+
+SERVICE = Service.ZOOKING
+
+
+def other_process_write(engine, table, values: dict, where) -> None:
+    # what the other handler does when it renumbers or removes mappings: the write and a generation bump
+    generations = IdMappingGeneration.__table__
+    with engine.begin() as connection:
+        connection.execute(update(table).where(where).values(**values))
+        connection.execute(update(generations).where(generations.c.table_name == table.name)
+                           .values(generation=generations.c.generation + 1))
+
+
+def test_lru_cache_evicts_least_recently_used():
+    cache = LRUCache(2)
+    cache.put("a", 1)
+    cache.put("b", 2)
+    assert cache.get("a") == 1
+    cache.put("c", 3)
+    assert cache.get("b") is MISSING
+    assert (cache.get("a"), cache.get("c")) == (1, 3)
+    assert cache.stats() == {"size": 2, "max_size": 2, "hits": 3, "misses": 1}
+
+
+def test_lookups_are_cached(database):
+    internal_id = crud.set_property_internal_id(SERVICE, 1001)
+    hits = crud.id_cache.hits
+    assert crud.get_property_external_id(SERVICE, internal_id) == 1001
+    assert crud.get_property_internal_id(SERVICE, 1001) == internal_id
+    assert crud.id_cache.hits == hits + 2
+
+
+def test_misses_always_reach_the_database(database):
+    assert crud.get_property_internal_id(SERVICE, 1001) is None
+    table = property_id_mapper_by_service[SERVICE].__table__
+    with database.begin() as connection:
+        connection.execute(table.insert().values(internal_id=7, external_id=1001))
+    assert crud.get_property_internal_id(SERVICE, 1001) == 7
+
+
+def test_renumbered_mapping_is_revalidated(database, monkeypatch):
+    monkeypatch.setattr(config, "ID_CACHE_REVALIDATE_MS", 60_000)
+    internal_id = crud.set_property_internal_id(SERVICE, 1001)
+    assert crud.get_property_internal_id(SERVICE, 1001) == internal_id
+    table = property_id_mapper_by_service[SERVICE].__table__
+    other_process_write(database, table, {"internal_id": 500}, table.c.internal_id == internal_id)
+    # within the revalidation interval the cache still answers, a forced check (once per message) doesn't
+    assert crud.get_property_internal_id(SERVICE, 1001) == internal_id
+    crud.revalidate_id_cache(force=True)
+    assert crud.get_property_internal_id(SERVICE, 1001) == 500
+    assert crud.get_property_external_id(SERVICE, internal_id) is None
+
+
+def test_removed_mapping_is_revalidated_on_lookup(database, monkeypatch):
+    monkeypatch.setattr(config, "ID_CACHE_REVALIDATE_MS", 0)
+    crud.create_management_event(SERVICE, 1, 2001)
+    assert crud.get_management_event(SERVICE, 1).external_id == 2001
+    table = management_id_mapper_by_service[SERVICE].__table__
+    other_process_write(database, table, {"external_id": 2002}, table.c.internal_id == 1)
+    assert crud.get_management_event(SERVICE, 1).external_id == 2002
+
+
+def test_own_writes_keep_the_cache(database, monkeypatch):
+    monkeypatch.setattr(config, "ID_CACHE_REVALIDATE_MS", 0)
+    internal_ids = crud.set_property_internal_ids(SERVICE, [1001, 1002])
+    crud.revalidate_id_cache(force=True)
+    crud.set_property_mapped_ids(SERVICE, {internal_ids[1001]: 900})
+    size = crud.id_cache.stats()["size"]
+    assert crud.get_property_internal_id(SERVICE, 1002) == internal_ids[1002]
+    assert crud.get_property_internal_id(SERVICE, 1001) == 900
+    assert crud.id_cache.stats()["size"] == size
+
+
+@pytest.mark.parametrize("other_writes", [0, 1])
+def test_missed_generation_clears_the_cache(database, monkeypatch, other_writes):
+    monkeypatch.setattr(config, "ID_CACHE_REVALIDATE_MS", 60_000)
+    crud.create_management_events(SERVICE, {1: 2001, 2: 2002})
+    crud.revalidate_id_cache(force=True)
+    table = management_id_mapper_by_service[SERVICE].__table__
+    for _ in range(other_writes):
+        # another process' write this process hasn't seen yet
+        other_process_write(database, table, {"external_id": 3002}, table.c.internal_id == 2)
+    crud.delete_management_events(SERVICE, [1])
+    crud.revalidate_id_cache(force=True)
+    assert crud.get_management_event(SERVICE, 1) is None
+    assert crud.get_management_event(SERVICE, 2).external_id == (3002 if other_writes else 2002)
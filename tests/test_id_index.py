@@ -0,0 +1,75 @@
+"""
+    Checks the preloaded id indexes: IdIndex itself, lookups served from it, and that the indexes of tables
+    renumbered or removed by another process are reloaded.
+"""
+
+from sqlalchemy import update
+
+from ProjectUtils.MessagingService.schemas import Service
+from Wrappers import config, crud
+from Wrappers.id_cache import MANAGEMENT_EVENT_BY_INTERNAL, PROPERTY_EXTERNAL_TO_INTERNAL
+from Wrappers.id_index import IdIndex
+from Wrappers.models import IdMappingGeneration, management_id_mapper_by_service, property_id_mapper_by_service
+
+SERVICE = Service.ZOOKING
+
+
+def test_id_index_lookups_and_deltas():
+    index = IdIndex([(3, 30), (1, 10), (2, 20)])
+    assert (index.get_external_id(2), index.get_internal_id(30), index.get_external_id("1")) == (20, 3, 10)
+    assert index.get_external_id(4) is None and index.get_internal_id("x") is None
+    index.add(4, 40)
+    index.remove_internal(1)
+    index.remove_external(20)
+    assert (index.get_external_id(4), index.get_internal_id(40)) == (40, 4)
+    assert index.get_external_id(1) is None and index.get_internal_id(20) is None
+    assert len(index) == 2
+
+
+def test_id_index_compaction_keeps_the_pairs():
+    index = IdIndex((internal_id, internal_id * 10) for internal_id in range(1, 101))
+    for internal_id in range(101, 101 + IdIndex.MIN_DELTA_SIZE + 1):
+        index.add(internal_id, internal_id * 10)
+    assert not index._delta_by_internal  # merged back into the arrays
+    assert index.nbytes() == 4 * 8 * (100 + IdIndex.MIN_DELTA_SIZE + 1)
+    assert index.get_internal_id(10_000) == 1000
+
+
+def test_lookups_are_served_by_the_index(database, monkeypatch):
+    monkeypatch.setattr(config, "ID_CACHE_MAX_SIZE", 0)
+    internal_ids = crud.set_property_internal_ids(SERVICE, [1001, 1002])
+    crud.preload_id_indexes()
+    table = property_id_mapper_by_service[SERVICE].__table__
+    with database.begin() as connection:
+        # not a crud write, so only visible if the lookup reached the database
+        connection.execute(update(table).where(table.c.external_id == 1002).values(external_id=1003))
+    assert crud.get_property_internal_id(SERVICE, 1002) == internal_ids[1002]
+    assert crud.get_id_cache_stats()["indexed_ids"] == 2
+
+
+def test_own_writes_update_the_index(database):
+    crud.preload_id_indexes()
+    crud.create_management_events(SERVICE, {1: 2001, 2: 2002})
+    crud.delete_management_event(SERVICE, 1)
+    index, _ = crud._id_indexes_by_direction[(SERVICE, MANAGEMENT_EVENT_BY_INTERNAL)]
+    assert (index.get_external_id(1), index.get_external_id(2)) == (None, 2002)
+
+
+def test_indexes_changed_by_another_process_are_reloaded(database, monkeypatch):
+    monkeypatch.setattr(config, "ID_CACHE_MAX_SIZE", 0)
+    monkeypatch.setattr(config, "ID_CACHE_REVALIDATE_MS", 60_000)
+    crud.create_management_events(SERVICE, {1: 2001, 2: 2002})
+    crud.preload_id_indexes()
+    property_index = crud._id_indexes_by_direction[(SERVICE, PROPERTY_EXTERNAL_TO_INTERNAL)]
+    table = management_id_mapper_by_service[SERVICE].__table__
+    generations = IdMappingGeneration.__table__
+    with database.begin() as connection:
+        connection.execute(table.delete().where(table.c.internal_id == 1))
+        connection.execute(update(generations).where(generations.c.table_name == table.name)
+                           .values(generation=generations.c.generation + 1))
+    assert crud.get_management_event(SERVICE, 1).external_id == 2001  # until the next check
+    crud.revalidate_id_cache(force=True)
+    assert crud.get_management_event(SERVICE, 1) is None
+    assert crud.get_management_event(SERVICE, 2).external_id == 2002
+    # only the changed table was reloaded
+    assert crud._id_indexes_by_direction[(SERVICE, PROPERTY_EXTERNAL_TO_INTERNAL)] is property_index
@@ -0,0 +1,66 @@
+"""
+    Checks the property and reservation imports: the id mappings of a whole import are allocated and inserted in
+    bulk, and the converted items carry them.
+"""
+
+import json
+import os
+
+import pytest
+from sqlalchemy import event
+
+from ProjectUtils.MessagingService.schemas import Service
+from Wrappers import crud
+
+ZOOKING_PROPERTY = os.path.join(os.path.dirname(__file__), "..", "Wrappers", "all_schema_examples", "zooking.json")
+
+
+@pytest.fixture
+def zooking_properties():
+    with open(ZOOKING_PROPERTY, encoding="utf-8") as f:
+        example = json.load(f)
+    return [{**example, "id": external_id} for external_id in (11, 12, 13)]
+
+
+def zooking_reservation(external_id: int, property_id: int, status: str = "confirmed") -> dict:
+    return {"id": external_id, "property_id": property_id, "reservation_status": status,
+            "arrival": "2026-11-01T14:00:00", "departure": "2026-11-03T11:00:00",
+            "client_email": "client@example.com", "client_name": "Client", "client_phone": "+351000000000", "cost": 120}
+
+
+@pytest.fixture
+def inserts(database):
+    statements = []
+
+    def record(connection, cursor, statement, parameters, context, executemany):
+        if statement.startswith("INSERT"):
+            statements.append(statement)
+
+    event.listen(database, "before_cursor_execute", record)
+    yield statements
+    event.remove(database, "before_cursor_execute", record)
+
+
+def test_import_properties_inserts_mappings_in_bulk(zooking_wrapper, fake_response, zooking_properties, inserts):
+    zooking_wrapper.session.get.return_value = fake_response(zooking_properties)
+    properties = zooking_wrapper.import_properties({"email": "alicez@gmail.com"})
+    assert len(inserts) == 1
+    internal_ids = [p["_id"] for p in properties]
+    assert len(set(internal_ids)) == 3
+    assert [crud.get_property_external_id(Service.ZOOKING, internal_id) for internal_id in internal_ids] == [11, 12, 13]
+    # a second import finds the mappings
+    assert [p["_id"] for p in zooking_wrapper.import_properties({"email": "alicez@gmail.com"})] == internal_ids
+    assert len(inserts) == 1
+
+
+def test_import_reservations_inserts_mappings_in_bulk(zooking_wrapper, fake_response, inserts):
+    property_ids = crud.set_property_internal_ids(Service.ZOOKING, [11])
+    inserts.clear()
+    zooking_wrapper.session.get.return_value = fake_response(
+        [zooking_reservation(external_id, 11 if external_id % 2 else 99) for external_id in range(1, 8)]
+    )
+    reservations = zooking_wrapper.import_reservations({"email": "alicez@gmail.com"})
+    assert len(inserts) == 1
+    assert [r["property_id"] for r in reservations] == [property_ids[11], None] * 3 + [property_ids[11]]
+    assert [crud.get_reservation_external_id(Service.ZOOKING, r["_id"]) for r in reservations] == list(range(1, 8))
+    assert {r["owner_email"] for r in reservations} == {"alicez@gmail.com"}
@@ -0,0 +1,58 @@
+"""
+    Checks Zooking's batched management event writes: operations of one event are folded into one closed time frame,
+    and the created frames are mapped back to their events.
+"""
+
+import pytest
+
+from Wrappers import crud
+from Wrappers.zooking.zooking_wrapper import ZookingWrapper
+
+MAY_1 = {"begin_datetime": "2024-05-01T00:00:00", "end_datetime": "2024-05-02T00:00:00"}
+MAY_3 = {"begin_datetime": "2024-05-03T00:00:00", "end_datetime": "2024-05-04T00:00:00"}
+
+
+def create(event_internal_id, datetimes=MAY_1):
+    return {"type": "create", "event_internal_id": event_internal_id, **datetimes}
+
+
+def update(event_internal_id, datetimes=MAY_3):
+    return {"type": "update", "event_internal_id": event_internal_id, **datetimes}
+
+
+def delete(event_internal_id):
+    return {"type": "delete", "event_internal_id": event_internal_id}
+
+
+@pytest.mark.parametrize("operations, batches", [
+    ([create(1), update(1)], [[create(1, MAY_3)]]),
+    ([create(1), delete(1)], []),
+    ([update(1), update(1, MAY_1)], [[update(1, MAY_1)]]),
+    ([update(1), delete(1)], [[delete(1)]]),
+    ([create(1), update(2), delete(3)], [[create(1), update(2), delete(3)]]),
+    # a deleted event can't be created again in the same request
+    ([delete(1), create(1)], [[delete(1)], [create(1)]]),
+])
+def test_operations_are_folded(operations, batches):
+    assert ZookingWrapper.merge_management_event_operations(operations) == batches
+
+
+def test_batch_is_one_put(zooking_wrapper, fake_response):
+    property_internal_id = crud.set_property_internal_ids(zooking_wrapper.service_schema, [1001])[1001]
+    crud.create_management_events(zooking_wrapper.service_schema, {2: 502, 3: 503})
+    zooking_wrapper.session.put.return_value = fake_response({"closed_time_frames": {
+        "501": MAY_1, "502": MAY_3,
+    }})
+    zooking_wrapper.apply_management_event_batch(property_internal_id, [create(1), update(2), delete(3)])
+    assert zooking_wrapper.session.put.call_count == 1
+    _, kwargs = zooking_wrapper.session.put.call_args
+    assert kwargs["json"] == {"closed_time_frames": [MAY_1, {"id": 502, **MAY_3}, {"id": 503}]}
+    assert kwargs["idempotent"] is False
+    events = crud.get_management_events(zooking_wrapper.service_schema, [1, 2, 3])
+    assert {internal_id: str(event.external_id) for internal_id, event in events.items()} == {1: "501", 2: "502"}
+
+
+def test_unknown_events_are_skipped(zooking_wrapper, fake_response):
+    property_internal_id = crud.set_property_internal_ids(zooking_wrapper.service_schema, [1001])[1001]
+    zooking_wrapper.apply_management_event_batch(property_internal_id, [update(2), delete(3)])
+    zooking_wrapper.session.put.assert_not_called()
@@ -0,0 +1,86 @@
+"""
+    Checks the message scoped session: the crud calls made while handling one message share a transaction, committed
+    once at the end or rolled back as a whole.
+"""
+
+import pytest
+from sqlalchemy import event, update
+
+from ProjectUtils.MessagingService.schemas import Service
+from Wrappers import crud
+from Wrappers.models import IdMappingGeneration, PropertyIdMapperZooking
+
+SERVICE = Service.ZOOKING
+
+
+def test_crud_calls_share_one_transaction(database):
+    commits = []
+
+    def count_commit(connection):
+        commits.append(connection)
+
+    event.listen(database, "commit", count_commit)
+    try:
+        with crud.message_session():
+            internal_ids = crud.set_property_internal_ids(SERVICE, [1001, 1002])
+            crud.save_reservations(SERVICE, {1: "confirmed"}, {1: {
+                "begin_datetime": None, "end_datetime": None, "property_internal_id": internal_ids[1001],
+                "content_hash": None,
+            }})
+            crud.create_management_event(SERVICE, 5, 2001)
+            # reads see the uncommitted writes
+            crud.id_cache.clear()
+            assert crud.get_property_internal_id(SERVICE, 1002) == internal_ids[1002]
+            assert commits == []
+    finally:
+        event.remove(database, "commit", count_commit)
+    assert len(commits) == 1
+    assert crud.get_management_event(SERVICE, 5).external_id == 2001
+
+
+def test_failed_message_rolls_back_everything(database):
+    with pytest.raises(RuntimeError):
+        with crud.message_session():
+            internal_id = crud.set_property_internal_id(SERVICE, 1001)
+            crud.create_management_event(SERVICE, 5, 2001)
+            raise RuntimeError("platform call failed")
+    # neither the rows nor the cache entries written by the message are left
+    assert crud.get_property_internal_id(SERVICE, 1001) is None
+    assert crud.get_property_external_id(SERVICE, internal_id) is None
+    assert crud.get_management_event(SERVICE, 5) is None
+
+
+def test_ids_are_allocated_in_the_message_transaction(database):
+    with pytest.raises(RuntimeError):
+        with crud.message_session():
+            crud.set_property_internal_ids(SERVICE, [1001, 1002])
+            raise RuntimeError
+    # the rolled back ids are handed out again
+    assert sorted(crud.set_property_internal_ids(SERVICE, [1003, 1004]).values()) == [1, 2]
+
+
+def test_calls_outside_a_message_commit_on_their_own(database):
+    internal_id = crud.set_property_internal_id(SERVICE, 1001)
+    with pytest.raises(RuntimeError):
+        with crud.message_session():
+            raise RuntimeError
+    assert crud.get_property_internal_id(SERVICE, 1001) == internal_id
+
+
+def test_rolled_back_generation_bump_is_forgotten(database):
+    internal_id = crud.set_property_internal_id(SERVICE, 1001)
+    assert crud.get_property_internal_id(SERVICE, 1001) == internal_id
+    with pytest.raises(RuntimeError):
+        with crud.message_session():
+            crud.set_property_mapped_ids(SERVICE, {internal_id: 50})
+            raise RuntimeError
+    assert crud.get_property_internal_id(SERVICE, 1001) == internal_id
+
+    # the other handler renumbers the property, committing the generation the rolled back bump had reached
+    mappings, generations = PropertyIdMapperZooking.__table__, IdMappingGeneration.__table__
+    with database.begin() as connection:
+        connection.execute(update(mappings).where(mappings.c.external_id == 1001).values(internal_id=60))
+        connection.execute(update(generations).where(generations.c.table_name == mappings.name)
+                           .values(generation=generations.c.generation + 1))
+    crud.revalidate_id_cache(force=True)
+    assert crud.get_property_internal_id(SERVICE, 1001) == 60
@@ -0,0 +1,110 @@
+"""
+    Checks the schema migrations run when Wrappers.models is imported: they bring older databases up to date and can
+    run at the same time in both handler processes.
+"""
+
+from concurrent.futures import ThreadPoolExecutor
+
+from sqlalchemy import inspect, text
+from sqlalchemy.exc import OperationalError
+
+from Wrappers import models
+from Wrappers.models import ManagementIdMapperZooking, PropertyIdMapperZooking, ReservationIdMapperZooking
+
+TABLES = [PropertyIdMapperZooking, ReservationIdMapperZooking, ManagementIdMapperZooking]
+
+
+def indexes(engine, table_name: str) -> dict:
+    return {index["name"]: bool(index["unique"]) for index in inspect(engine).get_indexes(table_name)}
+
+
+def drop_indexes(engine) -> None:
+    with engine.begin() as connection:
+        for IdMapper in TABLES:
+            for index in IdMapper.__table__.indexes:
+                connection.execute(text(f"DROP INDEX IF EXISTS {index.name}"))
+
+
+def test_missing_indexes_are_created_concurrently(database):
+    expected = {IdMapper.__tablename__: indexes(database, IdMapper.__tablename__) for IdMapper in TABLES}
+    drop_indexes(database)
+    assert indexes(database, PropertyIdMapperZooking.__tablename__) == {}
+    with ThreadPoolExecutor(max_workers=4) as executor:
+        for future in [executor.submit(models.create_missing_external_id_indexes) for _ in range(4)]:
+            future.result()
+    assert {IdMapper.__tablename__: indexes(database, IdMapper.__tablename__) for IdMapper in TABLES} == expected
+    assert expected[ReservationIdMapperZooking.__tablename__] == {
+        "ix_reservation_id_mapper_zooking_external_id": True,
+    }
+
+
+def test_duplicated_external_ids_get_a_non_unique_index(database):
+    drop_indexes(database)
+    with database.begin() as connection:
+        connection.execute(text(f"INSERT INTO {PropertyIdMapperZooking.__tablename__} (internal_id, external_id) "
+                                "VALUES (1, 1001), (2, 1001)"))
+    models.create_missing_external_id_indexes()
+    models.create_missing_external_id_indexes()
+    assert indexes(database, PropertyIdMapperZooking.__tablename__) == {
+        "ix_property_id_mapper_zooking_external_id": False
+    }
+    with database.begin() as connection:
+        connection.execute(text(f"DELETE FROM {PropertyIdMapperZooking.__tablename__}"))
+    drop_indexes(database)
+    models.create_missing_external_id_indexes()
+
+
+def columns(engine, table_name: str) -> set:
+    return {column["name"] for column in inspect(engine).get_columns(table_name)}
+
+
+def recreate_old_reservation_table(engine) -> None:
+    # reservation_id_mapper_zooking as it was before the dates, property and content hash were stored
+    table_name = ReservationIdMapperZooking.__tablename__
+    with engine.begin() as connection:
+        connection.execute(text(f"DROP TABLE {table_name}"))
+        connection.execute(text(f"CREATE TABLE {table_name} (internal_id INTEGER PRIMARY KEY, external_id INTEGER, "
+                                "reservation_status VARCHAR(9))"))
+        connection.execute(text(f"INSERT INTO {table_name} VALUES (1, 101, 'CONFIRMED')"))
+    # as if the handlers had just started: no pooled connection knows the newer schema
+    engine.dispose()
+
+
+def test_missing_reservation_columns_are_added_concurrently(database):
+    table_name = ReservationIdMapperZooking.__tablename__
+    recreate_old_reservation_table(database)
+    with ThreadPoolExecutor(max_workers=4) as executor:
+        for future in [executor.submit(models.add_missing_reservation_columns) for _ in range(4)]:
+            future.result()
+    models.create_missing_external_id_indexes()
+    assert columns(database, table_name) == {column.name for column in ReservationIdMapperZooking.__table__.columns}
+    with database.begin() as connection:
+        assert connection.execute(text(f"SELECT external_id, content_hash FROM {table_name}")).all() == [(101, None)]
+
+
+def test_column_added_by_the_other_process_is_not_an_error(database, monkeypatch, mocker):
+    # the other handler adds the columns between this process' inspection and its ALTER TABLE
+    recreate_old_reservation_table(database)
+    stale_inspector = inspect(database)
+    stale_inspector.get_columns(ReservationIdMapperZooking.__tablename__)
+    models.add_missing_reservation_columns()
+    monkeypatch.setattr(models, "inspect", lambda engine: stale_inspector)
+    has_column = mocker.spy(models, "_has_column")
+    models.add_missing_reservation_columns()
+    assert has_column.call_count == 4 and all(has_column.spy_return_list)
+    models.create_missing_external_id_indexes()
+
+
+def test_tables_created_by_the_other_process_are_not_an_error(database, monkeypatch):
+    create_all = models.Base.metadata.create_all
+    calls = []
+
+    def create_all_after_the_other_process(bind):
+        calls.append(bind)
+        if len(calls) == 1:
+            raise OperationalError("CREATE TABLE property_id_mapper_zooking", {}, Exception("table already exists"))
+        create_all(bind=bind)
+
+    monkeypatch.setattr(models.Base.metadata, "create_all", create_all_after_the_other_process)
+    models.create_tables()
+    assert len(calls) == 2
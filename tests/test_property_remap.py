@@ -0,0 +1,81 @@
+"""
+    Checks the remapping of duplicated properties' internal ids: the entries apply one after the other, the property
+    being renumbered, or deleted when its new id is already mapped, and its reservations follow it.
+"""
+
+import pytest
+
+from ProjectUtils.MessagingService.schemas import Service
+from Wrappers import crud
+from Wrappers.models import IdMappingGeneration, property_id_mapper_by_service, reservation_id_mapper_by_service
+
+SERVICE = Service.ZOOKING
+
+
+def create_properties(service: Service) -> None:
+    # external ids 1001, 1002, 1003 mapped to internal ids 1, 2, 3, with the reservations 9001, 9002, 9003
+    internal_ids = crud.set_property_internal_ids(service, [1001, 1002, 1003])
+    crud.save_reservations(service, {9000 + n: "confirmed" for n in (1, 2, 3)}, {
+        9000 + n: {"begin_datetime": "2024-05-01", "end_datetime": "2024-05-03",
+                   "property_internal_id": internal_ids[1000 + n], "content_hash": None}
+        for n in (1, 2, 3)
+    })
+
+
+@pytest.fixture
+def properties(database):
+    create_properties(SERVICE)
+    assert mapped(SERVICE) == {1001: 1, 1002: 2, 1003: 3}
+
+
+def mapped(service: Service) -> dict:
+    # {external_id: internal_id} of every property, read from the database
+    table = property_id_mapper_by_service[service].__table__
+    with crud._session() as db:
+        return dict(db.execute(table.select().with_only_columns(table.c.external_id, table.c.internal_id)).all())
+
+
+def reservation_properties(service: Service) -> dict:
+    table = reservation_id_mapper_by_service[service].__table__
+    with crud._session() as db:
+        return dict(db.execute(table.select().with_only_columns(table.c.external_id, table.c.property_internal_id)).all())
+
+
+def generation() -> int:
+    with crud._session() as db:
+        return db.get(IdMappingGeneration, property_id_mapper_by_service[SERVICE].__tablename__).generation
+
+
+@pytest.mark.parametrize("old_new_id_map, properties_after, reservations_after", [
+    # renumbered: 7 wasn't mapped
+    ({"1": "7"}, {1001: 7, 1002: 2, 1003: 3}, {9001: 7, 9002: 2, 9003: 3}),
+    # duplicate of a mapped property: deleted, its reservations go to the property kept
+    ({"1": "2"}, {1002: 2, 1003: 3}, {9001: 2, 9002: 2, 9003: 3}),
+    # swap: 1 deleted since 2 is mapped, then 2 takes the id 1 left
+    ({"1": "2", "2": "1"}, {1002: 1, 1003: 3}, {9001: 1, 9002: 1, 9003: 3}),
+    # chain: 1 takes 4, then 2 takes the id 1 left
+    ({"1": "4", "2": "1"}, {1001: 4, 1002: 1, 1003: 3}, {9001: 4, 9002: 1, 9003: 3}),
+    # cycle through a free id
+    ({"1": "4", "2": "1", "4": "2"}, {1001: 2, 1002: 1, 1003: 3}, {9001: 2, 9002: 1, 9003: 3}),
+    # 3 deleted (1 is mapped), its reservations following 1 to 5 and then to 2
+    ({"3": "1", "1": "5", "2": "3", "5": "2"}, {1001: 2, 1002: 3}, {9001: 2, 9002: 3, 9003: 2}),
+    # identity entries and ids that aren't mapped are left alone
+    ({"1": "1", "5": "6", "3": "8"}, {1001: 1, 1002: 2, 1003: 8}, {9001: 1, 9002: 2, 9003: 8}),
+])
+def test_remap(properties, old_new_id_map, properties_after, reservations_after):
+    crud.set_property_mapped_ids(SERVICE, old_new_id_map)
+    assert mapped(SERVICE) == properties_after
+    assert reservation_properties(SERVICE) == reservations_after
+    # the lookups (and their cache) agree with the database
+    for external_id, internal_id in properties_after.items():
+        assert crud.get_property_internal_id(SERVICE, external_id) == internal_id
+        assert crud.get_property_external_id(SERVICE, internal_id) == external_id
+
+
+def test_generation_is_bumped_by_changes_only(properties):
+    before = generation()
+    crud.set_property_mapped_ids(SERVICE, {"1": "1", "5": "6"})
+    crud.set_property_mapped_ids(SERVICE, {})
+    assert generation() == before
+    crud.set_property_mapped_ids(SERVICE, {"1": "7"})
+    assert generation() == before + 1
@@ -0,0 +1,73 @@
+"""
+    Checks the property snapshots: updates only push the fields whose value the platform doesn't hold yet, and a
+    failed or interrupted update forgets what the platform holds.
+"""
+
+import pytest
+import requests
+
+from Wrappers import config, crud
+
+URL = "http://zooking/properties/1001"
+
+
+@pytest.fixture
+def wrapper(zooking_wrapper, fake_response, monkeypatch):
+    monkeypatch.setattr(config, "PROPERTY_SNAPSHOTS", True)
+    zooking_wrapper.session.put.return_value = fake_response()
+    return zooking_wrapper
+
+
+def pushed(wrapper) -> list:
+    return [kwargs["json"] for _, kwargs in wrapper.session.put.call_args_list]
+
+
+def test_only_changed_fields_are_pushed(wrapper):
+    wrapper.put_property_update(URL, 1001, {"name": "Casa", "bedrooms": 2})
+    wrapper.put_property_update(URL, 1001, {"name": "Casa", "bedrooms": 3})
+    assert pushed(wrapper) == [{"name": "Casa", "bedrooms": 2}, {"bedrooms": 3}]
+
+
+def test_unchanged_update_is_skipped(wrapper):
+    wrapper.put_property_update(URL, 1001, {"name": "Casa"})
+    assert wrapper.put_property_update(URL, 1001, {"name": "Casa"}) is None
+    assert len(pushed(wrapper)) == 1
+    # other properties have their own snapshot
+    wrapper.put_property_update(URL, 1002, {"name": "Casa"})
+    assert len(pushed(wrapper)) == 2
+
+
+def test_failed_update_forgets_the_snapshot(wrapper, fake_response):
+    wrapper.put_property_update(URL, 1001, {"name": "Casa", "bedrooms": 2})
+    wrapper.session.put.return_value = fake_response(status_code=500)
+    wrapper.put_property_update(URL, 1001, {"bedrooms": 3})
+    assert crud.get_property_snapshot(wrapper.service_schema, 1001) == {}
+    wrapper.session.put.return_value = fake_response()
+    wrapper.put_property_update(URL, 1001, {"name": "Casa", "bedrooms": 2})
+    assert pushed(wrapper)[-1] == {"name": "Casa", "bedrooms": 2}
+
+
+def test_interrupted_update_forgets_the_snapshot(wrapper):
+    wrapper.put_property_update(URL, 1001, {"name": "Casa", "bedrooms": 2})
+    wrapper.session.put.side_effect = requests.exceptions.ReadTimeout("no answer")
+    with pytest.raises(requests.exceptions.ReadTimeout):
+        wrapper.put_property_update(URL, 1001, {"bedrooms": 3})
+    assert crud.get_property_snapshot(wrapper.service_schema, 1001) == {}
+
+
+def test_disabled_snapshots_push_everything(wrapper, monkeypatch):
+    monkeypatch.setattr(config, "PROPERTY_SNAPSHOTS", False)
+    for _ in range(2):
+        wrapper.put_property_update(URL, 1001, {"name": "Casa"})
+    assert pushed(wrapper) == [{"name": "Casa"}] * 2
+    assert crud.get_property_snapshot(wrapper.service_schema, 1001) == {}
+
+
+def test_management_events_forget_the_snapshot(wrapper, fake_response):
+    property_internal_id = crud.set_property_internal_ids(wrapper.service_schema, [1001])[1001]
+    wrapper.put_property_update(URL, 1001, {"closed_time_frames": {}})
+    wrapper.session.put.return_value = fake_response({"closed_time_frames": {"501": {
+        "begin_datetime": "2024-05-01T00:00:00", "end_datetime": "2024-05-02T00:00:00",
+    }}})
+    wrapper.create_management_event(property_internal_id, 1, "2024-05-01T00:00:00", "2024-05-02T00:00:00")
+    assert crud.get_property_snapshot(wrapper.service_schema, 1001) == {}
@@ -0,0 +1,73 @@
+"""
+    Checks the rate limiter's token buckets: shared by the processes through the database, and limiting each process
+    by itself while that database is unavailable.
+"""
+
+import logging
+import uuid
+
+import pytest
+
+from Wrappers import config
+from Wrappers.base_wrapper import rate_limiter
+from Wrappers.base_wrapper.rate_limiter import RateLimiter, SharedTokenBucket, TokenBucket
+
+UNAVAILABLE_URL = "sqlite:////nonexistent-directory/rateLimits.db"
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    # time.monotonic of the rate limiter, moved by the tests
+    now = [1000.0]
+    monkeypatch.setattr(rate_limiter.time, "monotonic", lambda: now[0])
+    return now
+
+
+def test_bucket_spreads_callers_at_the_rate(clock):
+    bucket = TokenBucket(rate=2, capacity=2)
+    assert [bucket.reserve() for _ in range(4)] == [0, 0, 0.5, 1.0]
+    clock[0] += 1
+    assert bucket.reserve() == 0.5
+
+
+def test_buckets_of_the_processes_are_shared():
+    # one SharedTokenBucket per process, same name and database
+    name = f"test:{uuid.uuid4()}"
+    regular = SharedTokenBucket(config.RATE_LIMIT_DATABASE_URL, name, rate=1, capacity=1, retry_after=30)
+    scheduled = SharedTokenBucket(config.RATE_LIMIT_DATABASE_URL, name, rate=1, capacity=1, retry_after=30)
+    assert regular.reserve() == 0
+    assert scheduled.reserve() == pytest.approx(1, abs=0.1)
+
+
+def test_unavailable_database_falls_back_per_window(clock, caplog, mocker):
+    bucket = SharedTokenBucket(UNAVAILABLE_URL, "test", rate=1, capacity=1, retry_after=30)
+    reserve_shared = mocker.spy(bucket, "_reserve_shared")
+    with caplog.at_level(logging.WARNING, logger=rate_limiter.__name__):
+        assert [bucket.reserve() for _ in range(3)] == [0, 1, 2]
+        # the database is only tried again, and the warning logged again, once the window is over
+        assert reserve_shared.call_count == 1
+        clock[0] += 31
+        bucket.reserve()
+        assert reserve_shared.call_count == 2
+    assert len(caplog.records) == 2
+
+
+def test_bucket_is_shared_again_once_the_database_is_back(clock, mocker):
+    bucket = SharedTokenBucket(UNAVAILABLE_URL, "test", rate=1, capacity=1, retry_after=30)
+    bucket.reserve()
+    bucket.url = config.RATE_LIMIT_DATABASE_URL
+    bucket.name = f"test:{uuid.uuid4()}"
+    reserve_shared = mocker.spy(bucket, "_reserve_shared")
+    bucket.reserve()
+    reserve_shared.assert_not_called()
+    clock[0] += 31
+    assert bucket.reserve() == 0
+    reserve_shared.assert_called_once()
+
+
+def test_limiter_buckets_per_endpoint():
+    limiter = RateLimiter("zooking", rate=5, burst=5, per_endpoint=True)
+    properties = limiter._bucket("http://host/properties/1")
+    assert limiter._bucket("http://host/properties?email=a") is properties
+    assert limiter._bucket("http://host/reservations") is not properties
+    assert type(properties) is TokenBucket
@@ -0,0 +1,304 @@
+"""
+    Checks the regular events handler's blocking engine: per-property worker lanes and the acknowledgement of every
+    message once it's processed.
+"""
+
+import json
+import threading
+import time
+from functools import partial
+from types import SimpleNamespace
+from unittest import mock
+
+import pytest
+import requests
+
+from ProjectUtils.MessagingService.schemas import MessageType, Service
+from Wrappers import config, crud, regular_events_handler
+from Wrappers.base_wrapper.http_session import CircuitOpenError
+from Wrappers.clickandgo.clickandgo_wrapper import CNGWrapper
+from Wrappers.earthstayin.earthstayin_wrapper import EarthStayinWrapper
+from Wrappers.keyed_executor import KeyedExecutor
+from Wrappers.zooking.zooking_wrapper import ZookingWrapper
+
+
+def body(message_type: MessageType, message_body: dict) -> bytes:
+    return json.dumps({"message_type": message_type.value, "body": message_body}).encode()
+
+
+@pytest.fixture(autouse=True)
+def plain_json_messages(monkeypatch):
+    # messages as {"message_type", "body"} JSON, whatever the wire format of ProjectUtils' schemas
+    def from_json(raw):
+        message = json.loads(raw)
+        return SimpleNamespace(message_type=MessageType(message["message_type"]), body=message["body"])
+    monkeypatch.setattr(regular_events_handler, "from_json", from_json)
+
+
+@pytest.fixture
+def channel():
+    # pika channel whose connection runs the threadsafe callbacks right away
+    channel = mock.Mock()
+    channel.connection.add_callback_threadsafe.side_effect = lambda callback: callback()
+    return channel
+
+
+def test_keyed_executor_keeps_the_order_of_each_key():
+    executor = KeyedExecutor(4, thread_name_prefix="test")
+    done = []
+    futures = [executor.submit(key, lambda key=key, n=n: (time.sleep(0.02 if n == 0 else 0), done.append((key, n))))
+               for n in range(3) for key in ("a", "b")]
+    for future in futures:
+        future.result(timeout=5)
+    executor.shutdown()
+    assert [n for key, n in done if key == "a"] == [0, 1, 2]
+    assert [n for key, n in done if key == "b"] == [0, 1, 2]
+
+
+def test_keyed_executor_exclusive_task_runs_alone():
+    executor = KeyedExecutor(3, thread_name_prefix="test")
+    running = set()
+    overlaps = []
+    lock = threading.Lock()
+
+    def task(name):
+        with lock:
+            running.add(name)
+            if "exclusive" in running and len(running) > 1:
+                overlaps.append(set(running))
+        time.sleep(0.02)
+        with lock:
+            running.discard(name)
+
+    futures = [executor.submit(key, task, f"before-{key}") for key in range(6)]
+    futures.append(executor.submit_exclusive(task, "exclusive"))
+    futures += [executor.submit(key, task, f"after-{key}") for key in range(6)]
+    for future in futures:
+        future.result(timeout=5)
+    executor.shutdown()
+    assert overlaps == []
+
+
+def test_dispatch_acks_after_processing(channel, monkeypatch):
+    processed = []
+    monkeypatch.setattr(regular_events_handler, "process_message",
+                        lambda wrapper, message, publish: processed.append(message.body))
+    wrapper = SimpleNamespace(service_schema=Service.ZOOKING)
+    submitted = []
+    regular_events_handler.dispatch_recv(
+        channel, SimpleNamespace(delivery_tag=7), None,
+        body(MessageType.PROPERTY_UPDATE, {"internal_id": 3, "update_parameters": {}}), wrapper,
+        lambda key, task: submitted.append((key, task)),
+    )
+    assert [key for key, _ in submitted] == [3]
+    channel.basic_ack.assert_not_called()
+    submitted[0][1]()
+    assert processed == [{"internal_id": 3, "update_parameters": {}}]
+    channel.basic_ack.assert_called_once_with(7)
+
+
+def test_dispatch_acks_failed_and_unreadable_messages(channel, monkeypatch):
+    def fail(wrapper, message, publish):
+        raise RuntimeError("platform unavailable")
+    monkeypatch.setattr(regular_events_handler, "process_message", fail)
+    wrapper = SimpleNamespace(service_schema=Service.ZOOKING)
+    submit = lambda key, task: task()
+    regular_events_handler.dispatch_recv(channel, SimpleNamespace(delivery_tag=1), None, b"not json", wrapper, submit)
+    regular_events_handler.dispatch_recv(
+        channel, SimpleNamespace(delivery_tag=2), None,
+        body(MessageType.PROPERTY_IMPORT, {"email": "alice@example.com"}), wrapper, submit,
+    )
+    assert channel.basic_ack.call_args_list == [mock.call(1), mock.call(2)]
+
+
+@pytest.mark.parametrize("message_type, message_body, key", [
+    (MessageType.PROPERTY_UPDATE, {"internal_id": 4, "update_parameters": {}}, 4),
+    (MessageType.MANAGEMENT_EVENT_DELETE, {"property_internal_id": 5, "event_internal_id": 9}, 5),
+    (MessageType.PROPERTY_IMPORT, {"email": "alice@example.com"}, None),
+])
+def test_message_key(message_type, message_body, key):
+    assert regular_events_handler.message_key(SimpleNamespace(message_type=message_type, body=message_body)) == key
+
+
+@pytest.fixture
+def buffer_channel(channel):
+    # the window timers are only fired by the tests, through flush
+    channel.connection.call_later.side_effect = lambda delay, callback: object()
+    return channel
+
+
+def update(internal_id: int, **update_parameters):
+    return SimpleNamespace(message_type=MessageType.PROPERTY_UPDATE,
+                           body={"internal_id": internal_id, "update_parameters": update_parameters})
+
+
+def coalesce(buffer_channel, messages: list, response=None):
+    wrapper = mock.Mock(service_schema=Service.ZOOKING)
+    wrapper.update_property.return_value = response
+    coalescer = regular_events_handler.PropertyUpdateCoalescer(buffer_channel, wrapper, 60, lambda key, task: task())
+    for delivery_tag, message in enumerate(messages, start=1):
+        coalescer.add(message.body["internal_id"], message, delivery_tag)
+    coalescer.flush_all()
+    return wrapper
+
+
+def test_coalescer_merges_the_updates_of_a_property(buffer_channel, database):
+    wrapper = coalesce(buffer_channel, [update(1, title="Casa", bedrooms=2), update(1, bedrooms=3)])
+    wrapper.update_property.assert_called_once_with(1, {"title": "Casa", "bedrooms": 3})
+    assert buffer_channel.basic_ack.call_args_list == [mock.call(1), mock.call(2)]
+
+
+@pytest.mark.parametrize("messages, merged", [
+    ([update(1, price=100, after_commission=True), update(1, price=120)], {"price": 120}),
+    ([update(1, price=100, after_commission=True), update(1, after_commission=False)], {"price": 100, "after_commission": True}),
+    ([update(1, price=100), update(1, after_commission=True, title="Casa")], {"price": 100, "title": "Casa"}),
+    ([update(1, after_commission=True), update(1, price=120)], {"price": 120}),
+    ([update(1, price=100), update(1, title="Casa")], {"price": 100, "title": "Casa"}),
+])
+def test_coalescer_keeps_price_and_commission_together(buffer_channel, database, messages, merged):
+    wrapper = coalesce(buffer_channel, messages)
+    wrapper.update_property.assert_called_once_with(1, merged)
+
+
+def test_coalescer_rejects_refused_updates(buffer_channel, database, fake_response):
+    coalesce(buffer_channel, [update(1, title="Casa"), update(1, bedrooms=3)], fake_response(status_code=400))
+    buffer_channel.basic_ack.assert_not_called()
+    assert buffer_channel.basic_nack.call_args_list == [mock.call(1, requeue=False), mock.call(2, requeue=False)]
+
+
+def test_coalescer_rejects_updates_that_raise(buffer_channel, database):
+    wrapper = mock.Mock(service_schema=Service.ZOOKING)
+    wrapper.update_property.side_effect = RuntimeError("platform unavailable")
+    coalescer = regular_events_handler.PropertyUpdateCoalescer(buffer_channel, wrapper, 60, lambda key, task: task())
+    coalescer.add(1, update(1, title="Casa"), 1)
+    coalescer.flush(1)
+    buffer_channel.basic_nack.assert_called_once_with(1, requeue=False)
+
+
+@pytest.fixture
+def retries(monkeypatch):
+    monkeypatch.setattr(config, "BUFFER_RETRY_ATTEMPTS", 3)
+    monkeypatch.setattr(config, "BUFFER_RETRY_BACKOFF_MS", 500)
+
+
+@pytest.mark.parametrize("failure", [
+    {"return_value": SimpleNamespace(ok=False, status_code=503)},
+    {"return_value": SimpleNamespace(ok=False, status_code=429)},
+    {"side_effect": requests.ConnectionError("connection refused")},
+    {"side_effect": requests.Timeout("read timed out")},
+    {"side_effect": CircuitOpenError("circuit breaker is open")},
+])
+def test_coalescer_retries_transient_failures_after_a_backoff(buffer_channel, database, retries, failure):
+    wrapper = mock.Mock(service_schema=Service.ZOOKING)
+    wrapper.update_property.configure_mock(**failure)
+    coalescer = regular_events_handler.PropertyUpdateCoalescer(buffer_channel, wrapper, 60, lambda key, task: task())
+    coalescer.add(1, update(1, title="Casa"), 1)
+    coalescer.flush(1)
+    coalescer.add(1, update(1, bedrooms=3), 2)
+    buffer_channel.basic_ack.assert_not_called()
+    buffer_channel.basic_nack.assert_not_called()
+    assert coalescer._pending[1]["delivery_tags"] == [1, 2]
+    assert buffer_channel.connection.call_later.call_args_list[-1].args[0] == 0.5
+    coalescer.flush(1)
+    assert buffer_channel.connection.call_later.call_args_list[-1].args[0] == 1.0
+
+    wrapper.update_property.configure_mock(side_effect=None, return_value=None)
+    coalescer.flush(1)
+    wrapper.update_property.assert_called_with(1, {"title": "Casa", "bedrooms": 3})
+    assert buffer_channel.basic_ack.call_args_list == [mock.call(1), mock.call(2)]
+    buffer_channel.basic_nack.assert_not_called()
+
+
+def test_coalescer_rejects_updates_after_the_last_attempt(buffer_channel, database, fake_response, retries):
+    wrapper = mock.Mock(service_schema=Service.ZOOKING)
+    wrapper.update_property.return_value = fake_response(status_code=503)
+    coalescer = regular_events_handler.PropertyUpdateCoalescer(buffer_channel, wrapper, 60, lambda key, task: task())
+    coalescer.add(1, update(1, title="Casa"), 1)
+    for _ in range(3):
+        coalescer.flush(1)
+    assert wrapper.update_property.call_count == 3
+    buffer_channel.basic_nack.assert_called_once_with(1, requeue=False)
+    assert not coalescer._pending
+
+
+@pytest.mark.parametrize("wrapper_class", [ZookingWrapper, CNGWrapper, EarthStayinWrapper])
+def test_update_property_returns_the_response(database, fake_response, wrapper_class):
+    wrapper = wrapper_class(queue="test")
+    wrapper.session = mock.Mock()
+    wrapper.session.put.return_value = response = fake_response(status_code=503)
+    internal_id = crud.set_property_internal_ids(wrapper.service_schema, [1001])[1001]
+    assert wrapper.update_property(internal_id, {"title": "Casa"}) is response
+
+
+def management_event(message_type: MessageType, property_internal_id: int, event_internal_id: int, **datetimes):
+    return SimpleNamespace(message_type=message_type, body={
+        "property_internal_id": property_internal_id, "event_internal_id": event_internal_id, **datetimes,
+    })
+
+
+def test_buffers_are_abstract(buffer_channel):
+    with pytest.raises(TypeError):
+        regular_events_handler.PropertyMessageBuffer(buffer_channel, mock.Mock(), 60, lambda key, task: task())
+
+
+def test_batcher_writes_the_events_of_a_property_together(buffer_channel, database):
+    wrapper = mock.Mock(service_schema=Service.ZOOKING)
+    batcher = regular_events_handler.ManagementEventBatcher(buffer_channel, wrapper, 60, lambda key, task: task())
+    datetimes = {"begin_datetime": "2024-05-01T00:00:00", "end_datetime": "2024-05-02T00:00:00"}
+    batcher.add(1, management_event(MessageType.MANAGEMENT_EVENT_CREATE, 1, 10, **datetimes), 1)
+    batcher.add(1, management_event(MessageType.MANAGEMENT_EVENT_DELETE, 1, 11), 2)
+    batcher.add(2, management_event(MessageType.MANAGEMENT_EVENT_UPDATE, 2, 12, **datetimes), 3)
+    wrapper.apply_management_event_batch.assert_not_called()
+    batcher.flush(1)
+    wrapper.apply_management_event_batch.assert_called_once_with(1, [
+        {"type": "create", "event_internal_id": 10, **datetimes},
+        {"type": "delete", "event_internal_id": 11},
+    ])
+    assert buffer_channel.basic_ack.call_args_list == [mock.call(1), mock.call(2)]
+    assert list(batcher._pending) == [2]
+
+
+def test_batcher_flushes_at_max_size(buffer_channel, database):
+    wrapper = mock.Mock(service_schema=Service.ZOOKING)
+    batcher = regular_events_handler.ManagementEventBatcher(buffer_channel, wrapper, 60, lambda key, task: task(), max_size=2)
+    batcher.add(1, management_event(MessageType.MANAGEMENT_EVENT_DELETE, 1, 10), 1)
+    wrapper.apply_management_event_batch.assert_not_called()
+    batcher.add(1, management_event(MessageType.MANAGEMENT_EVENT_DELETE, 1, 11), 2)
+    wrapper.apply_management_event_batch.assert_called_once()
+    buffer_channel.connection.remove_timeout.assert_called_once()
+    assert not batcher._pending
+
+
+def test_unkeyed_message_flushes_the_buffers_first(buffer_channel, monkeypatch):
+    order = []
+    monkeypatch.setattr(regular_events_handler, "process_message",
+                        lambda wrapper, message, publish: order.append(message.message_type))
+    wrapper = mock.Mock(service_schema=Service.ZOOKING)
+    wrapper.update_property.side_effect = lambda key, update_parameters: order.append(MessageType.PROPERTY_UPDATE)
+    submit = lambda key, task: task()
+    coalescer = regular_events_handler.PropertyUpdateCoalescer(buffer_channel, wrapper, 60, submit)
+    dispatch = partial(regular_events_handler.dispatch_recv, buffer_channel, properties=None, wrapper=wrapper,
+                       submit=submit, buffers=[coalescer])
+    dispatch(method=SimpleNamespace(delivery_tag=1), body=body(MessageType.PROPERTY_UPDATE, {"internal_id": 1, "update_parameters": {}}))
+    assert order == []
+    dispatch(method=SimpleNamespace(delivery_tag=2), body=body(MessageType.PROPERTY_IMPORT, {"email": "alice@example.com"}))
+    assert order == [MessageType.PROPERTY_UPDATE, MessageType.PROPERTY_IMPORT]
+
+
+def test_batcher_retries_after_a_connection_error(buffer_channel, database, retries):
+    wrapper = mock.Mock(service_schema=Service.ZOOKING)
+    wrapper.apply_management_event_batch.side_effect = CircuitOpenError("circuit breaker is open")
+    batcher = regular_events_handler.ManagementEventBatcher(buffer_channel, wrapper, 60, lambda key, task: task(), max_size=2)
+    batcher.add(1, management_event(MessageType.MANAGEMENT_EVENT_DELETE, 1, 10), 1)
+    batcher.add(1, management_event(MessageType.MANAGEMENT_EVENT_DELETE, 1, 11), 2)
+    # waiting for the backoff, whatever the size of the batch
+    batcher.add(1, management_event(MessageType.MANAGEMENT_EVENT_DELETE, 1, 12), 3)
+    assert wrapper.apply_management_event_batch.call_count == 1
+    buffer_channel.basic_nack.assert_not_called()
+
+    wrapper.apply_management_event_batch.side_effect = None
+    batcher.flush(1)
+    wrapper.apply_management_event_batch.assert_called_with(1, [
+        {"type": "delete", "event_internal_id": event_internal_id} for event_internal_id in (10, 11, 12)
+    ])
+    assert buffer_channel.basic_ack.call_args_list == [mock.call(1), mock.call(2), mock.call(3)]
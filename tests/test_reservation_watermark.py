@@ -0,0 +1,66 @@
+"""
+    Checks the per-user watermark of the new or newly canceled reservations import: reservations unchanged since the
+    last sync are dropped before any lookup, changed ones and those of properties mapped since then are imported.
+"""
+
+import pytest
+
+from Wrappers import crud
+
+EMAIL = "alice@example.com"
+
+
+def reservation(external_id: int, property_id: int = 1001, status: str = "confirmed") -> dict:
+    return {"id": external_id, "property_id": property_id, "reservation_status": status,
+            "arrival": "2024-05-01", "departure": "2024-05-03", "client_name": "Bob", "client_email": "bob@example.com",
+            "client_phone": "+351 900 000 000", "cost": 100.0}
+
+
+@pytest.fixture
+def sync(zooking_wrapper, fake_response):
+    crud.set_property_internal_ids(zooking_wrapper.service_schema, [1001])
+
+    def run(upcoming: list) -> list:
+        # the reservations imported by one sync of EMAIL's upcoming reservations
+        zooking_wrapper.session.get.return_value = fake_response(upcoming)
+        return zooking_wrapper.import_new_or_newly_canceled_reservations({"email": EMAIL})
+    return run
+
+
+def test_unchanged_reservations_are_skipped_before_any_lookup(sync, zooking_wrapper, mocker):
+    assert [r["reservation_status"] for r in sync([reservation(1), reservation(2)])] == ["confirmed", "confirmed"]
+    assert crud.get_reservation_watermark(zooking_wrapper.service_schema, EMAIL) == {1: "confirmed", 2: "confirmed"}
+    get_reservation_states = mocker.spy(crud, "get_reservation_states")
+    assert sync([reservation(1), reservation(2)]) == []
+    get_reservation_states.assert_called_once_with(zooking_wrapper.service_schema, [])
+
+
+def test_newly_canceled_reservations_are_imported(sync, zooking_wrapper):
+    sync([reservation(1), reservation(2)])
+    imported = sync([reservation(1), reservation(2, status="canceled")])
+    assert [(r["_id"], r["reservation_status"]) for r in imported] == \
+           [(crud.get_reservation_by_external_id(zooking_wrapper.service_schema, 2).internal_id, "canceled")]
+    assert crud.get_reservation_watermark(zooking_wrapper.service_schema, EMAIL) == {1: "confirmed", 2: "canceled"}
+    # canceled once
+    assert sync([reservation(1), reservation(2, status="canceled")]) == []
+
+
+def test_reservations_of_unmapped_properties_are_checked_again(sync, zooking_wrapper):
+    assert sync([reservation(1, property_id=2002)]) == []
+    assert crud.get_reservation_watermark(zooking_wrapper.service_schema, EMAIL) == {}
+    crud.set_property_internal_ids(zooking_wrapper.service_schema, [2002])
+    assert [r["property_id"] for r in sync([reservation(1, property_id=2002)])] == \
+           [crud.get_property_internal_id(zooking_wrapper.service_schema, 2002)]
+
+
+def test_reservations_already_imported_are_not_imported_again(sync, zooking_wrapper, fake_response):
+    # saved by the initial import, not seen by a sync yet
+    zooking_wrapper.session.get.return_value = fake_response([reservation(1)])
+    zooking_wrapper.import_reservations({"email": EMAIL})
+    assert sync([reservation(1)]) == []
+    assert crud.get_reservation_watermark(zooking_wrapper.service_schema, EMAIL) == {1: "confirmed"}
+
+
+def test_watermarks_are_per_user(sync, zooking_wrapper):
+    sync([reservation(1)])
+    assert crud.get_reservation_watermark(zooking_wrapper.service_schema, "bob@example.com") == {}
@@ -0,0 +1,133 @@
+"""
+    Checks the cache of property list responses: fresh entries served without a request, stale ones revalidated with
+    their ETag, and concurrent fetches of one URL sharing a single request.
+"""
+
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+import requests
+
+from Wrappers.base_wrapper import response_cache
+from Wrappers.base_wrapper.response_cache import ResponseCache
+
+URL = "http://zooking/properties?email=alice@example.com"
+
+
+def response(status_code: int = 200, body: bytes = b"[]", etag: str = None) -> requests.Response:
+    built = requests.Response()
+    built.status_code = status_code
+    built._content = body
+    if etag is not None:
+        built.headers["ETag"] = etag
+    return built
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    # time.monotonic of the cache, moved by the tests
+    now = [1000.0]
+    monkeypatch.setattr(response_cache.time, "monotonic", lambda: now[0])
+    return now
+
+
+def test_fresh_entries_are_served_without_a_request(clock, mocker):
+    cache = ResponseCache(ttl=10, max_size=8)
+    send = mocker.Mock(return_value=response(body=b'[{"id": 1}]'))
+    first = cache.fetch(URL, send)
+    clock[0] += 9
+    assert cache.fetch(URL, send) is first
+    assert first.json() == [{"id": 1}] and first.json() is first.json()
+    send.assert_called_once_with({})
+    assert (cache.misses, cache.hits) == (1, 1)
+
+
+def test_not_modified_without_a_cached_entry_is_fetched_again(clock, mocker):
+    cache = ResponseCache(ttl=10, max_size=8)
+    send = mocker.Mock(side_effect=[response(304, body=b""), response(body=b"[1]", etag='"v1"')])
+    assert cache.fetch(URL, send).json() == [1]
+    assert send.call_args_list == [mocker.call({}), mocker.call({"If-None-Match": None})]
+    clock[0] += 9
+    assert cache.fetch(URL, send).json() == [1] and send.call_count == 2
+
+def test_stale_entries_are_revalidated(clock, mocker):
+    cache = ResponseCache(ttl=10, max_size=8)
+    first = cache.fetch(URL, lambda headers: response(body=b"[1]", etag='"v1"'))
+    clock[0] += 11
+    send = mocker.Mock(return_value=response(304))
+    assert cache.fetch(URL, send) is first
+    send.assert_called_once_with({"If-None-Match": '"v1"'})
+    # fresh again after the revalidation
+    clock[0] += 9
+    assert cache.fetch(URL, send) is first and send.call_count == 1
+    clock[0] += 2
+    send.return_value = response(body=b"[2]", etag='"v2"')
+    assert cache.fetch(URL, send).json() == [2]
+    assert cache.stats()["revalidated"] == 1
+
+
+def test_entries_without_etag_are_fetched_again(clock, mocker):
+    cache = ResponseCache(ttl=10, max_size=8)
+    cache.fetch(URL, lambda headers: response(body=b"[1]"))
+    clock[0] += 11
+    send = mocker.Mock(return_value=response(body=b"[2]"))
+    assert cache.fetch(URL, send).json() == [2]
+    send.assert_called_once_with({})
+
+
+def test_failed_responses_are_not_cached(mocker):
+    cache = ResponseCache(ttl=10, max_size=8)
+    send = mocker.Mock(return_value=response(503))
+    assert cache.fetch(URL, send).status_code == 503
+    cache.fetch(URL, send)
+    assert send.call_count == 2 and cache.stats()["size"] == 0
+
+
+def test_least_recently_used_entries_are_evicted():
+    cache = ResponseCache(ttl=10, max_size=2)
+    for url in ("a", "b", "a", "c"):
+        cache.fetch(url, lambda headers: response())
+    assert list(cache._entries) == ["a", "c"]
+    cache.invalidate("a")
+    assert list(cache._entries) == ["c"]
+
+
+def test_concurrent_fetches_share_one_request():
+    cache = ResponseCache(ttl=10, max_size=8)
+    release = threading.Event()
+    calls = []
+
+    def send(headers):
+        calls.append(headers)
+        release.wait(5)
+        return response(body=b"[1]")
+
+    with ThreadPoolExecutor(4) as executor:
+        futures = [executor.submit(cache.fetch, URL, send) for _ in range(4)]
+        while cache.coalesced < 3:
+            time.sleep(0.01)
+        release.set()
+        responses = [future.result(timeout=5) for future in futures]
+    assert len(calls) == 1
+    assert all(shared is responses[0] for shared in responses)
+
+
+def test_failed_fetch_is_raised_to_every_waiting_caller():
+    cache = ResponseCache(ttl=10, max_size=8)
+    release = threading.Event()
+
+    def send(headers):
+        release.wait(5)
+        raise requests.exceptions.ConnectionError("zooking unavailable")
+
+    with ThreadPoolExecutor(2) as executor:
+        futures = [executor.submit(cache.fetch, URL, send) for _ in range(2)]
+        while cache.coalesced < 1:
+            time.sleep(0.01)
+        release.set()
+        for future in futures:
+            with pytest.raises(requests.exceptions.ConnectionError):
+                future.result(timeout=5)
+    assert not cache._in_flight and not cache._entries
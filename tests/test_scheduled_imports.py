@@ -0,0 +1,53 @@
+"""
+    Checks the scheduled imports' fan-out: the users of the service are imported concurrently, and one failing user
+    doesn't prevent publishing the others.
+"""
+
+import threading
+from types import SimpleNamespace
+
+from ProjectUtils.MessagingService.schemas import Service
+from Wrappers.scheduled_events_handler import import_for_each_user
+
+WRAPPER = SimpleNamespace(service_schema=Service.ZOOKING)
+USERS = {
+    "alice@example.com": ["zooking", "clickandgo"],
+    "bob@example.com": ["zooking"],
+    "carol@example.com": ["earthstayin"],
+    "dave@example.com": ["zooking"],
+}
+
+
+def test_users_are_imported_concurrently():
+    # every import waits for the other two: only completes if they run at the same time
+    barrier = threading.Barrier(3, timeout=5)
+
+    def import_user(user):
+        barrier.wait()
+        return [user["email"]]
+
+    results = dict(import_for_each_user(WRAPPER, USERS, import_user))
+    assert results == {email: [email] for email in ("alice@example.com", "bob@example.com", "dave@example.com")}
+
+
+def test_failing_user_is_skipped():
+    def import_user(user):
+        if user["email"] == "bob@example.com":
+            raise ConnectionError("platform unavailable")
+        return []
+
+    assert sorted(email for email, _ in import_for_each_user(WRAPPER, USERS, import_user)) == \
+           ["alice@example.com", "dave@example.com"]
+
+
+def test_results_are_yielded_to_the_calling_thread():
+    caller = threading.current_thread()
+    threads = []
+
+    def import_user(user):
+        threads.append(threading.current_thread())
+        return []
+
+    for _ in import_for_each_user(WRAPPER, USERS, import_user):
+        assert threading.current_thread() is caller
+    assert caller not in threads
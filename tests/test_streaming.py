@@ -0,0 +1,79 @@
+"""
+    Checks the streamed reservation imports: JSON arrays parsed item by item whatever the chunk boundaries, and the
+    items grouped into bounded chunks.
+"""
+
+import json
+
+import pytest
+
+from Wrappers.base_wrapper.streaming import chunked, iter_json_array
+
+ITEMS = [
+    {"id": 1, "price": 12.5, "guest": "Zoë \"Z\" Ç", "notes": "a\\nb ☃ \\u00e9", "paid": True, "refund": None},
+    -0.25e-3,
+    "]",
+    [],
+    {"nested": [1, [2, {"3": ","}]], "empty": {}},
+    123456789,
+    False,
+]
+
+
+class StreamedResponse:
+    # requests.Response(stream=True) stand-in, sending the body in chunks of read_size bytes
+    def __init__(self, body: bytes, encoding: str = None) -> None:
+        self.body = body
+        self.encoding = encoding
+
+    def iter_content(self, chunk_size: int):
+        for start in range(0, len(self.body), chunk_size):
+            yield self.body[start:start + chunk_size]
+
+
+@pytest.mark.parametrize("read_size", [1, 2, 3, 7, 64 * 1024])
+@pytest.mark.parametrize("indent", [None, 4])
+def test_items_are_parsed_across_chunk_boundaries(read_size, indent):
+    body = json.dumps(ITEMS, indent=indent, ensure_ascii=False).encode()
+    assert list(iter_json_array(StreamedResponse(body), read_size=read_size)) == ITEMS
+
+
+@pytest.mark.parametrize("body, items", [
+    (b"[]", []),
+    (b" \n[ ]\n", []),
+    (b"[1,2 , 3]", [1, 2, 3]),
+    (b"[12345, 6]", [12345, 6]),
+    (b'["\\"]"]', ['"]']),
+])
+def test_small_arrays(body, items):
+    assert list(iter_json_array(StreamedResponse(body), read_size=1)) == items
+
+
+@pytest.mark.parametrize("body", [b'{"id": 1}', b"[1, 2", b"[1 2]", b'[{"id": 1]', b""])
+def test_invalid_arrays_are_rejected(body):
+    with pytest.raises(ValueError):
+        list(iter_json_array(StreamedResponse(body), read_size=2))
+
+
+def test_items_are_yielded_while_downloading():
+    read = []
+
+    class Response(StreamedResponse):
+        def iter_content(self, chunk_size: int):
+            for chunk in super().iter_content(chunk_size):
+                read.append(chunk)
+                yield chunk
+
+    items = iter_json_array(Response(b'[{"id": 1}, {"id": 2}]'), read_size=12)
+    assert next(items) == {"id": 1}
+    assert len(read) < 3
+
+
+def test_chunked_by_count_and_bytes():
+    items = [{"id": n} for n in range(5)]
+    assert list(chunked(items, 2)) == [items[0:2], items[2:4], items[4:]]
+    item_bytes = len(json.dumps(items[0]))
+    assert list(chunked(items, 10, max_bytes=2 * item_bytes)) == [items[0:2], items[2:4], items[4:]]
+    # an item larger than max_bytes still gets a chunk
+    assert list(chunked(items[:2], 10, max_bytes=1)) == [items[:1], items[1:2]]
+    assert list(chunked([], 10)) == []